@@ -3,17 +3,20 @@
 # STARTER
 #python main.py --backend mvp --skip-orchestrate --csv data --scenario Baseline --ui cockpit
 #python main.py --backend mvp --skip-orchestrate --csv data --ui planner
+#python main.py --backend mvp --skip-orchestrate --csv data --ui none --import-report   (headless: Tk / matplotlib を読まない)
 
 
 
 
 from __future__ import annotations
 
+import time
+_T_START = time.perf_counter()   # 起動時 import 計測の基準（--import-report）
+
 import argparse
 import os
 import sys
 from pathlib import Path
-import tkinter as tk
 from typing import Optional
 import logging
 
@@ -22,6 +25,7 @@ from pysi.utils.config import Config
 # pipeline/hook/plugin関連をインポート
 from pysi.core.hooks.core import HookBus, set_global, autoload_plugins
 from pysi.core.wom_pipeline import WOMPipelineRunner, call_register_if_present
+from pysi.core.profiler import StageProfiler
 
 
 def _repo_root() -> Path:
@@ -69,7 +73,10 @@ def parse_args() -> argparse.Namespace:
     ap.add_argument("--db", default=str(d["db"]))
     ap.add_argument("--schema", default=str(d["schema"]))
     ap.add_argument("--csv", default=str(d["csv"]))
-    ap.add_argument("--ui", choices=["planner", "cockpit"], default="cockpit")
+    ap.add_argument("--ui", choices=["planner", "cockpit", "none"], default="cockpit",
+                    help="none: headless run (no Tk / matplotlib import), prints a result summary and exits")
+    ap.add_argument("--import-report", action="store_true",
+                    help="print startup import time / loaded heavy modules before and after the first run")
 
     ap.add_argument("--default-lot-size", type=int, default=1000)
     ap.add_argument("--plan-year-st", type=int, default=2024)
@@ -77,10 +84,18 @@ def parse_args() -> argparse.Namespace:
     ap.add_argument("--backend", choices=["sql", "mvp"], default=os.getenv("PYSI_BACKEND", "sql"))
     ap.add_argument("--skip-orchestrate", action="store_true")
     ap.add_argument("--product", default=None)
+    ap.add_argument("--compact-psi", action="store_true",
+                    help="replace PSI lot lists with the compact array store after planning")
+    ap.add_argument("--workers", type=int, default=None,
+                    help="processes for the decoupling pattern sweep (1=serial, 0=all CPUs; default PYSI_WORKERS)")
+    ap.add_argument("--profile", nargs="?", const="out/profile.json", default=None, metavar="JSON",
+                    help="record wall/CPU time and peak RSS per stage, hook and plugin; "
+                         "writes JSON (Chrome trace events) and a .folded flamegraph file")
     return ap.parse_args()
 
 
 def launch_gui(config: Config, psi_env: object) -> None:
+    import tkinter as tk
     if hasattr(psi_env, "reload"):
         psi_env.reload()
     if not hasattr(psi_env, "global_nodes"):
@@ -95,8 +110,21 @@ def launch_gui(config: Config, psi_env: object) -> None:
     gui_root.mainloop()
 
 
+def _write_profile(prof: StageProfiler, path: str) -> None:
+    out = Path(path)
+    if not out.is_absolute():
+        out = _repo_root() / out
+    prof.write_json(str(out))
+    prof.write_folded(str(out.with_suffix(".folded")))
+    print(prof.summary())
+    print(f"[profile] written: {out} (+ {out.with_suffix('.folded').name})")
+
+
 def main() -> None:
     args = parse_args()
+    if args.import_report:
+        from pysi.utils.startup import import_report, format_report
+        print(format_report(import_report(_T_START), "startup"))
     db_path = Path(args.db).resolve()
     schema_sql = Path(args.schema).resolve() if args.schema else None
 
@@ -108,10 +136,17 @@ def main() -> None:
     logging.basicConfig(level=logging.INFO)
     bus = HookBus()
     set_global(bus)
-    autoload_plugins("pysi.plugins")
-    call_register_if_present("pysi.plugins", bus)
+    prof = StageProfiler(name="main") if args.profile else None
+    if prof is not None:
+        bus.enable_timing(True, profiler=prof)
+        with prof.stage("plugins:load"):
+            autoload_plugins("pysi.plugins")
+            call_register_if_present("pysi.plugins", bus)
+    else:
+        autoload_plugins("pysi.plugins")
+        call_register_if_present("pysi.plugins", bus)
 
-    runner = WOMPipelineRunner(bus=bus)
+    runner = WOMPipelineRunner(bus=bus, compact_psi=(True if args.compact_psi else None), profiler=prof)
 
     # CSV path
     csv_path = Path(args.csv)
@@ -127,9 +162,14 @@ def main() -> None:
         scenario_id=args.scenario
     )
     env = result.get("env")
-    
+    if prof is not None:
+        _write_profile(prof, args.profile)
+    if args.import_report:
+        print(format_report(import_report(_T_START), "after first run"))
+
     if env is None:
         raise RuntimeError("WOMPipelineRunnerのrun結果からenvが取得できません")
+    env.sweep_workers = args.workers
 
     #@ADD
     if env:
@@ -148,19 +188,31 @@ def main() -> None:
         pass
 
 
+    if args.ui == "none":
+        print("[headless] product=%s revenue=%s profit=%s" % (
+            result.get("product_selected"), result.get("total_revenue"), result.get("total_profit")))
+        return
+
     if args.ui == "cockpit":
         from pysi.gui.cockpit_tk import launch_cockpit
 
         # ★ rerun_fn: cockpitで選ばれた product を pipeline に渡して env を作り直す
-        def rerun_from_cockpit(product: str):
+        #   cockpit は worker thread から呼ぶ（progress: 段階ごとの進捗 / False で打ち切り）
+        def rerun_from_cockpit(product: str, progress=None):
             r = runner.run(
                 data_dir=str(csv_path),
                 product=product,
-                scenario_id=args.scenario
+                scenario_id=args.scenario,
+                progress=progress,
             )
-            return r.get("env")
-
-        launch_cockpit(env, rerun_fn=rerun_from_cockpit)
+            new_env = r.get("env")
+            if new_env is not None:
+                new_env.sweep_workers = args.workers
+            if prof is not None:
+                _write_profile(prof, args.profile)     # 再計画分も累積して書き直す
+            return new_env
+
+        launch_cockpit(env, rerun_fn=rerun_from_cockpit, workers=args.workers)
     else:
         launch_gui(Config(), env)
 
@@ -32,6 +32,10 @@ def parse_args():
     ap.add_argument("--weeks", type=int, default=5)
     ap.add_argument("--iso-year-start", type=int, default=2025)
     ap.add_argument("--iso-week-start", type=int, default=1)
+    ap.add_argument("--engine", choices=["dict", "array"], default="dict",
+                    help="週次ループの実装（array: NumPy 行列で一括更新）")
+    ap.add_argument("--profile", nargs="?", const="out/profile.json", default=None,
+                    help="段階別 / plugin 別の wall・CPU・peak RSS を JSON に出力（既定 out/profile.json）")
     return ap.parse_args()
 
 def main():
@@ -45,6 +49,8 @@ def main():
                       weeks=a.weeks),
                       
         output_dir=a.out,
+        engine=a.engine,
+        profile=a.profile,
     )
     run_once(cfg)
     return 0
@@ -20,10 +20,17 @@ from __future__ import annotations
 import argparse
 import importlib
 import json
+import multiprocessing
 import os
+import queue
 import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional, Tuple, Set
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple, Set
 # --- DB/ETL/IO ----------------------------------------------------
 from pysi.db.apply_schema import apply_schema
 from pysi.db.calendar_sync import sync_calendar_iso
@@ -32,10 +39,13 @@ from pysi.io.psi_io_adapters import (
     _open,
     get_scenario_id,
     get_scenario_bounds,
+    write_both_layers,
 )
+from pysi.db.calendar_iso import weeks_count_cached
 # --- tree専用の薄い書戻し -----------------------------------------
 from pysi.io.tree_writeback import (
     write_both_layers_for_pair,     # ← これ1本で S生成→計算→DB書戻し まで完結
+    compute_pair_node,              # ← 並列時は計算だけ worker で行う
     pairs_from_weekly_demand,
     node_names_from_plan_root,
     intersect_pairs_with_network,
@@ -167,6 +177,133 @@ def _report_one(conn, scenario: str, node_name: str, product_name: str,
             import matplotlib.pyplot as plt
             plt.tight_layout(); plt.savefig(str(out)); plt.close()
     return str(out)
+def _resolve_workers(workers: Optional[int]) -> int:
+    """--workers の解釈（0 以下は CPU 数）"""
+    workers = 1 if workers is None else int(workers)
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+# ========== 並列実行（pair 計算は worker pool、書き込みは writer thread 1 本） ==========
+_W_CONN: Optional[sqlite3.Connection] = None
+def _open_readonly(db_path: str) -> sqlite3.Connection:
+    """worker 用の読み取り専用接続（WAL なので writer と同時に読める）"""
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+def _init_pair_worker(db_path: str) -> None:
+    global _W_CONN
+    _W_CONN = _open_readonly(db_path)
+def _compute_pairs(scenario_id: int, pairs: List[Tuple[str, str]]) -> List[tuple]:
+    """
+    worker 側: pair ごとに DB→pSi→計算 だけ行い、書き戻す PSI を返す。
+    戻り値: [(node, product, (psi4demand, psi4supply) or None, 秒, error or None), ...]
+    """
+    out = []
+    for node_name, product_name in pairs:
+        t0 = time.perf_counter()
+        try:
+            node = compute_pair_node(_W_CONN, scenario_id, node_name, product_name)
+            out.append((node_name, product_name, (node.psi4demand, node.psi4supply),
+                        time.perf_counter() - t0, None))
+        except Exception as e:
+            out.append((node_name, product_name, None, time.perf_counter() - t0, str(e)))
+    return out
+class _PairWriter(threading.Thread):
+    """
+    計算済み PSI を lot_bucket へ書く唯一のスレッド（自分専用の書き込み接続）。
+    batch_pairs 件ごと、または queue が空になった時にまとめて commit する。
+    """
+    def __init__(self, db_path: str, scenario_id: int, batch_pairs: int = 32):
+        super().__init__(name="pair-writer", daemon=True)
+        self.db_path = db_path
+        self.scenario_id = scenario_id
+        self.batch_pairs = max(1, int(batch_pairs))
+        self.queue: "queue.Queue" = queue.Queue(maxsize=256)
+        self.results: Dict[Tuple[str, str], dict] = {}
+        self.error: Optional[BaseException] = None
+    def run(self) -> None:
+        conn = _open(self.db_path)
+        pending = 0
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                node_name, product_name, psi = item
+                t0 = time.perf_counter()
+                res: dict = {}
+                try:
+                    holder = SimpleNamespace(name=node_name, psi4demand=psi[0], psi4supply=psi[1])
+                    d_rows, s_rows = write_both_layers(
+                        conn, scenario_id=self.scenario_id, node_obj=holder,
+                        product_name=product_name, replace_slice=True, commit=False,
+                    )
+                    res = {"d_rows": int(d_rows), "s_rows": int(s_rows),
+                           "weeks": weeks_count_cached(conn)}
+                    pending += 1
+                except Exception as e:
+                    res = {"error": str(e)}
+                res["t_write"] = round(time.perf_counter() - t0, 4)
+                self.results[(node_name, product_name)] = res
+                if pending >= self.batch_pairs or (pending and self.queue.empty()):
+                    conn.commit()
+                    pending = 0
+            conn.commit()
+        except BaseException as e:  # 呼び出し側で再送出
+            self.error = e
+            conn.rollback()
+        finally:
+            conn.close()
+def run_pairs_parallel(db_path: str, scenario_id: int,
+                       groups: List[List[Tuple[str, str]]],
+                       workers: int, batch_pairs: int = 32,
+                       progress: bool = True) -> List[dict]:
+    """
+    groups（1 group = 1 task。tree モードは product 単位、leaf モードは pair 単位）を
+    ProcessPoolExecutor で計算し、結果を writer thread 経由で lot_bucket に書く。
+    戻り値は pair ごとの {"node","product", d_rows, s_rows, weeks, t_compute, t_write}。
+    """
+    total = sum(len(g) for g in groups)
+    writer = _PairWriter(db_path, scenario_id, batch_pairs=batch_pairs)
+    writer.start()
+    timings: Dict[Tuple[str, str], dict] = {}
+    done = 0
+    t_start = time.perf_counter()
+    try:
+        # writer thread が動いている状態で fork しないよう spawn（Windows と同じ挙動）
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_pair_worker,
+                                 initargs=(db_path,),
+                                 mp_context=multiprocessing.get_context("spawn")) as ex:
+            futures = [ex.submit(_compute_pairs, scenario_id, g) for g in groups if g]
+            for fut in as_completed(futures):
+                for node_name, product_name, psi, sec, err in fut.result():
+                    key = (node_name, product_name)
+                    timings[key] = {"t_compute": round(sec, 4)}
+                    if err is not None:
+                        timings[key]["error"] = err
+                        print(f"[WARN] compute failed: node={node_name}, product={product_name} -> {err}",
+                              file=sys.stderr)
+                    else:
+                        writer.queue.put((node_name, product_name, psi))
+                    done += 1
+                    if progress:
+                        print(f"[orchestrator] {done}/{total} {node_name}/{product_name} "
+                              f"compute={sec:.3f}s elapsed={time.perf_counter() - t_start:.1f}s",
+                              file=sys.stderr)
+    finally:
+        writer.queue.put(None)
+        writer.join()
+    if writer.error is not None:
+        raise writer.error
+    written = []
+    for g in groups:
+        for node_name, product_name in g:
+            item = {"node": node_name, "product": product_name}
+            item.update(writer.results.get((node_name, product_name), {}))
+            item.update(timings.get((node_name, product_name), {}))
+            written.append(item)
+    return written
 # ========== CLI ==========
 def build_argparser() -> argparse.ArgumentParser:
     ap = argparse.ArgumentParser(description="PySI Orchestrator")
@@ -192,6 +329,11 @@ def build_argparser() -> argparse.ArgumentParser:
     ap.add_argument("--report", action="store_true")
     ap.add_argument("--report-outdir", default="report")
     ap.add_argument("--report-fmt", default="png")
+    # 並列
+    ap.add_argument("--workers", type=int, default=1,
+                    help="pair 計算の worker プロセス数（1 なら従来の逐次実行、0 以下は CPU 数）")
+    ap.add_argument("--write-batch", type=int, default=32,
+                    help="writer thread が 1 commit にまとめる pair 数")
     return ap
 def main():
     args = build_argparser().parse_args()
@@ -210,6 +352,13 @@ def main():
             sid = get_scenario_id(conn, args.scenario)
             pairs = _pairs_from_db(conn, sid)
             written = []
+            workers = _resolve_workers(args.workers)
+            if workers > 1:
+                # leaf 同士は独立 → pair 単位で worker に配る
+                conn.commit()
+                written = run_pairs_parallel(args.db, sid, [[p] for p in sorted(pairs)],
+                                             workers, batch_pairs=args.write_batch)
+                pairs = ()
             for node_name, product_name in sorted(pairs):
                 # これ1回で「S生成→計算→demand/supply 両レイヤ書戻し」まで完結
                 res = write_both_layers_for_pair(conn, sid, node_name, product_name)
@@ -270,11 +419,20 @@ def main():
                 pairs = [(root.name, fallback_product)]
             # 計算＆書戻し：write_both_layers_for_pair だけで一括実行
             written = []
+            workers = _resolve_workers(args.workers)
+            if workers > 1:
+                # product 単位で worker に配る（書き込みは writer thread 1 本）
+                by_product: Dict[str, List[Tuple[str, str]]] = {}
+                for node_name, product_name in pairs:
+                    by_product.setdefault(product_name, []).append((node_name, product_name))
+                conn.commit()
+                written = run_pairs_parallel(args.db, sid, list(by_product.values()),
+                                             workers, batch_pairs=args.write_batch)
+                pairs = []
             for node_name, product_name in pairs:
                 try:
                     res = write_both_layers_for_pair(conn, sid, node_name, product_name)
                 except Exception as e:
-                    import sys
                     print(f"[WARN] write_both_layers_for_pair failed: node={node_name}, product={product_name} -> {e}",
                           file=sys.stderr)
                     res = {}
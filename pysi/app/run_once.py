@@ -8,6 +8,7 @@
 from pysi.core.hooks.core import HookBus, set_global
 from pysi.core.plugin_loader import discover_and_register
 from pysi.core.pipeline import Pipeline
+from pysi.core.profiler import StageProfiler
 from pysi.io_adapters.sql_adapter import SQLAdapter
 from pysi.io_adapters.csv_adapter import CSVAdapter
 from pysi.utils.util import make_logger, make_calendar
@@ -29,11 +30,19 @@ def run_once(cfg):
     
     bus = HookBus(logger=logger)
 
+    # cfg.profile（JSON の出力先）があれば段階別 / plugin 別に計測
+    profile_path = getattr(cfg, "profile", None)
+    prof = StageProfiler(name=f"run_once:{cfg.scenario_id}") if profile_path else None
+
     # ★ここが重要：グローバル hooks を差し替える
     set_global(bus)
 
     # その後で、plugins/ ディレクトリ、entry_points、autoload の順で読み込む
-    discover_and_register(bus, plugins_dir=getattr(cfg, "plugins_dir", None), api_version="1.0")
+    if prof is not None:
+        with prof.stage("plugins:load"):
+            discover_and_register(bus, plugins_dir=getattr(cfg, "plugins_dir", None), api_version="1.0")
+    else:
+        discover_and_register(bus, plugins_dir=getattr(cfg, "plugins_dir", None), api_version="1.0")
 
     # I/Oアダプタ選択
     #schema は getattr(cfg.input, "schema", None) にしておくと、CSV でも同じコードが動きます。
@@ -51,10 +60,14 @@ def run_once(cfg):
 
     # Pipeline に渡す共通メタ (ctx に展開されるよう pipeline 側で使う)
     calendar["run_id"] = run_id
-    result = Pipeline(hooks=bus, io=io, logger=logger).run(
+    result = Pipeline(hooks=bus, io=io, logger=logger,
+                      engine=getattr(cfg, "engine", "dict"), profiler=prof).run(
         db_path=db_path, scenario_id=cfg.scenario_id, calendar=calendar,
         out_dir=getattr(cfg, "output_dir", "out"),
     )
+    if prof is not None:
+        prof.write_json(profile_path)
+        logger.info(f"profile written: {profile_path}\n{prof.summary()}")
     logger.info(f"run_id={run_id} done")
     return result
 
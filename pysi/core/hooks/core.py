@@ -14,35 +14,150 @@
 from __future__ import annotations
 import importlib, pkgutil, traceback, sys
 import logging
+import time
+from bisect import insort_right
 logger = logging.getLogger(__name__)
 from dataclasses import dataclass, field
-from typing import Any, Callable, Dict, List
+from typing import Any, Callable, Dict, List, Tuple
 
 # ---- HookBus ---------------------------------------------------------------
 
 Callback = Callable[..., Any]
 
+# plugin 以外から登録された callback の rank（同じ priority なら plugin の後ろ = 従来の登録順）
+_RANK_DEFAULT = 1 << 30
+
 @dataclass(order=True)
 class _CB:
     priority: int
+    rank: int
     fn: Callback = field(compare=False)
     src: str = field(compare=False)
 
 class HookBus:
-    """WordPress風の Action/Filter を極小実装。例外は握り潰してコアを止めない。"""
+    """
+    WordPress風の Action/Filter を極小実装。例外は握り潰してコアを止めない。
+    hook 名ごとに優先度順の tuple（dispatch table）を作っておき、登録が変わった時だけ作り直す。
+    同じ優先度は plugin の読み込み順（rank）→ 登録順（従来の stable sort と同じ）。
+    add_lazy() で「この hook が初めて発火したら plugin を読み込む」loader を置ける（plugin_registry 用）。
+    """
     def __init__(self, logger=None) -> None:
         self._actions: Dict[str, List[_CB]] = {}
         self._filters: Dict[str, List[_CB]] = {}
+        self._action_table: Dict[str, Tuple[_CB, ...]] = {}
+        self._filter_table: Dict[str, Tuple[_CB, ...]] = {}
         self.logger = logger
+        # enable_timing(True) で hook ごと / plugin callback ごとの呼び出し回数 / 累積秒を数える
+        self.timing = False
+        self.profiler = None
+        self.hook_stats: Dict[Tuple[str, str], List[float]] = {}
+        self.plugin_stats: Dict[Tuple[str, str, str], List[float]] = {}
+        # plugin_registry: 遅延 loader / 読み込み済み plugin / install 済みパッケージ
+        self._lazy: Dict[str, List[Callable[[], Any]]] = {}
+        self._rank = _RANK_DEFAULT
+        self.loaded_plugins: set = set()
+        self.installed_packages: set = set()
 
     # -- register -------------------------------------------------------------
     def add_action(self, name: str, fn: Callback, priority: int = 50) -> None:
-        self._actions.setdefault(name, []).append(_CB(priority, fn, _src_of(fn)))
-        self._actions[name].sort()
+        # insort_right: 同じ priority の中では末尾 → append + stable sort と同じ順序
+        insort_right(self._actions.setdefault(name, []), _CB(priority, self._rank, fn, _src_of(fn)))
+        self._action_table.pop(name, None)
 
     def add_filter(self, name: str, fn: Callback, priority: int = 50) -> None:
-        self._filters.setdefault(name, []).append(_CB(priority, fn, _src_of(fn)))
-        self._filters[name].sort()
+        insort_right(self._filters.setdefault(name, []), _CB(priority, self._rank, fn, _src_of(fn)))
+        self._filter_table.pop(name, None)
+
+    def remove_action(self, name: str, fn: Callback) -> None:
+        self._actions[name] = [cb for cb in self._actions.get(name, []) if cb.fn is not fn]
+        self._action_table.pop(name, None)
+
+    def remove_filter(self, name: str, fn: Callback) -> None:
+        self._filters[name] = [cb for cb in self._filters.get(name, []) if cb.fn is not fn]
+        self._filter_table.pop(name, None)
+
+    def add_lazy(self, names, loader: Callable[[], Any]) -> None:
+        """names のどれかが最初に発火した時に loader() を 1 回呼ぶ（loader 側で add_action / add_filter する）"""
+        for name in names:
+            self._lazy.setdefault(name, []).append(loader)
+            self._action_table.pop(name, None)
+            self._filter_table.pop(name, None)
+
+    def _run_lazy(self, name: str) -> None:
+        for loader in self._lazy.pop(name, ()):
+            try:
+                loader()
+            except Exception:
+                _print_exc(f"[hooks] lazy plugin load failed for '{name}'", logger=self.logger)
+
+    # -- dispatch tables ------------------------------------------------------
+    def _actions_for(self, name: str) -> Tuple[_CB, ...]:
+        if name in self._lazy:
+            self._run_lazy(name)
+        table = self._action_table.get(name)
+        if table is None:
+            table = self._action_table[name] = tuple(self._actions.get(name, ()))
+        return table
+
+    def _filters_for(self, name: str) -> Tuple[_CB, ...]:
+        if name in self._lazy:
+            self._run_lazy(name)
+        table = self._filter_table.get(name)
+        if table is None:
+            table = self._filter_table[name] = tuple(self._filters.get(name, ()))
+        return table
+
+    def enable_timing(self, on: bool = True, profiler=None) -> None:
+        """
+        計測モード。on の間は callback ごとに時間を測る（通常の dispatch とは別経路）。
+        profiler（pysi.core.profiler.StageProfiler）を渡すと hook / plugin ごとに stage も記録する。
+        """
+        self.timing = bool(on)
+        self.profiler = profiler if on else None
+
+    def _count(self, stats: Dict, key: tuple, sec: float) -> None:
+        st = stats.get(key)
+        if st is None:
+            st = stats[key] = [0, 0.0]
+        st[0] += 1
+        st[1] += sec
+
+    def _call_timed(self, kind: str, name: str, cb: _CB, args: tuple, ctx: Dict[str, Any]) -> Any:
+        prof = self.profiler
+        t0 = time.perf_counter()
+        try:
+            if prof is None:
+                return cb.fn(*args, **ctx)
+            with prof.stage(cb.src, cat="plugin", hook=f"{kind}:{name}"):
+                return cb.fn(*args, **ctx)
+        finally:
+            self._count(self.plugin_stats, (kind, name, cb.src), time.perf_counter() - t0)
+
+    def _dispatch_timed(self, kind: str, name: str, table: Tuple[_CB, ...], value: Any, ctx: Dict[str, Any]) -> Any:
+        """do_action / apply_filters の計測版（例外の扱いは同じ）"""
+        t0 = time.perf_counter()
+        prof = self.profiler
+        stage = prof.stage(f"{kind}:{name}", cat="hook") if prof is not None else None
+        if stage is not None:
+            stage.__enter__()
+        try:
+            out = value
+            for cb in table:
+                try:
+                    if kind == "filter":
+                        out = self._call_timed(kind, name, cb, (out,), ctx)
+                    else:
+                        self._call_timed(kind, name, cb, (), ctx)
+                except AttributeError:
+                    _report_attribute_error(kind, name, cb)
+                    raise
+                except Exception:
+                    _print_exc(f"[hooks] {kind} '{name}' failed in {cb.src}", logger=self.logger)
+            return out
+        finally:
+            if stage is not None:
+                stage.__exit__(None, None, None)
+            self._count(self.hook_stats, (kind, name), time.perf_counter() - t0)
 
     # -- run ------------------------------------------------------------------
     def do_action(self, name: str, **ctx: Any) -> None:
@@ -51,17 +166,20 @@ class HookBus:
         - AttributeError（典型: obj.get が無い等）は犯人プラグイン特定のため詳細ログを出し、再送出して早期に気付けるようにする
         - その他の例外は従来どおり握り潰してコア継続（ログは出力）
         """
-        for cb in sorted(self._actions.get(name, [])):
+        table = self._action_table.get(name)
+        if table is None:
+            table = self._actions_for(name)
+        if not table:
+            return                      # 購読者なし
+        if self.timing:
+            self._dispatch_timed("action", name, table, None, ctx)
+            return
+        for cb in table:
             try:
                 cb.fn(**ctx)
-            except AttributeError as e:
-                # ここで犯人を特定できる詳細トレースを出す
-                print(
-                    f"[HOOK ERROR] action={name} plugin="
-                    f"{getattr(cb.fn, '__module__', '?')}.{getattr(cb.fn, '__name__', '?')}"
-                )
-                traceback.print_exc()
-                # AttributeError は再送出して落として原因を表面化
+            except AttributeError:
+                # ここで犯人を特定できる詳細トレースを出し、再送出して落として原因を表面化
+                _report_attribute_error("action", name, cb)
                 raise
             except Exception:
                 # それ以外は従来どおりログして継続
@@ -79,18 +197,20 @@ class HookBus:
 
 
     def apply_filters(self, name: str, value: Any, **ctx: Any) -> Any:
+        table = self._filter_table.get(name)
+        if table is None:
+            table = self._filters_for(name)
+        if not table:
+            return value                # 購読者なし：素通し
+        if self.timing:
+            return self._dispatch_timed("filter", name, table, value, ctx)
         out = value
-        for cb in self._filters.get(name, []):
+        for cb in table:
             try:
                 out = cb.fn(out, **ctx)
             except AttributeError:
-                # ここで犯人を特定
-                print(
-                    f"[HOOK ERROR] filter={name} plugin="
-                    f"{getattr(cb.fn, '__module__', '?')}.{getattr(cb.fn, '__name__', '?')}"
-                )
-                traceback.print_exc()
-                # AttributeError は再送出（早く直すべき型の不一致）
+                # ここで犯人を特定。AttributeError は再送出（早く直すべき型の不一致）
+                _report_attribute_error("filter", name, cb)
                 raise
             except Exception:
                 _print_exc(f"[hooks] filter '{name}' failed in {cb.src}", logger=self.logger)
@@ -116,45 +236,25 @@ def filter(name: str, priority: int = 50) -> Callable[[Callback], Callback]:
 
 # ---- loader ----------------------------------------------------------------
 
-def autoload_plugins(package: str = "pysi.plugins") -> None:
-    """pysi.plugins 以下を再帰的に import して register 実行（サブディレクトリ対応版）"""
+def autoload_plugins(package: str = "pysi.plugins", lazy: bool | None = None) -> None:
+    """
+    package 配下の plugin をグローバル bus に登録（pysi.core.plugin_registry 経由）。
+    各 plugin パッケージの plugin.json の entry だけを読み、_BK / _OLD / _SHIP_OK などのバックアップは import しない。
+    manifest に hooks があれば、その hook の初回発火まで import を遅らせる。
+    """
+    from pysi.core.plugin_registry import get_registry
     try:
-        pkg = importlib.import_module(package)
+        get_registry(package).install(hooks, lazy=lazy)
     except Exception:
         _print_exc(f"[hooks] cannot import package: {package}", logger=getattr(hooks, "logger", None))
-        return
-    for _, name, is_pkg in pkgutil.walk_packages(pkg.__path__, prefix=package + "."):
-        if is_pkg:
-            continue
-        try:
-            mod = importlib.import_module(name)
-            print(f"[hooks] loaded plugin: {name}")
-        except Exception:
-            _print_exc(f"[hooks] failed to import: {name}", logger=getattr(hooks, "logger", None))
 
-def call_register_if_present(package: str, bus: HookBus) -> None:
+def call_register_if_present(package: str, bus: HookBus, lazy: bool | None = None) -> None:
+    """bus に package の plugin を登録（autoload_plugins 済みの bus なら何もしない = 二重登録しない）"""
+    from pysi.core.plugin_registry import get_registry
     try:
-        pkg = importlib.import_module(package)
+        get_registry(package).install(bus, lazy=lazy)
     except Exception:
         logger.exception("call_register_if_present: cannot import plugin package %s", package)
-        return
-
-    for _, name, is_pkg in pkgutil.walk_packages(pkg.__path__, prefix=package + "."):
-        if is_pkg:
-            continue
-        try:
-            mod = importlib.import_module(name)
-        except Exception:
-            logger.exception("Failed to import plugin module %s", name)
-            continue
-
-        reg = getattr(mod, "register", None)
-        if callable(reg):
-            try:
-                reg(bus)
-                logger.info("[plugins] called register(bus) on %s", name)
-            except Exception:
-                logger.exception("[plugins] register(bus) failed for %s", name)
 
 # ---- utils -----------------------------------------------------------------
 
@@ -163,6 +263,13 @@ def _src_of(fn: Callback) -> str:
     name = getattr(fn, "__name__", "?")
     return f"{mod}:{name}"
 
+def _report_attribute_error(kind: str, name: str, cb: _CB) -> None:
+    print(
+        f"[HOOK ERROR] {kind}={name} plugin="
+        f"{getattr(cb.fn, '__module__', '?')}.{getattr(cb.fn, '__name__', '?')}"
+    )
+    traceback.print_exc()
+
 def _print_exc(msg: str, logger=None) -> None:
     if logger is not None:
         logger.exception(msg)
@@ -0,0 +1,225 @@
+# pysi/core/move_log.py
+# Pipeline の move ログ（列指向バッファ + チャンク単位のディスク退避）
+#  - week / kind / src / dst / node / product / qty ... をチャンクごとに型付き列（int32 / float64）にする
+#  - 拠点名・製品名は 1 つの名前辞書で int コード化（-1 = None）
+#  - chunk_rows 行たまるごとに Parquet（pyarrow が無ければ CSV）へ退避して buffer を空にする
+#    → メモリは chunk サイズで頭打ち（実行期間の長さに比例しない）
+#  - exporter / cockpit は iter_chunks()（DataFrame 単位）か iter_records()（従来の dict 単位）で読む
+from __future__ import annotations
+import os
+import shutil
+import tempfile
+import weakref
+from operator import itemgetter
+from typing import Any, Dict, Iterator, List, Optional
+import numpy as np
+import pandas as pd
+MOVE_KINDS = ("ship", "recv", "ticket")
+MOVE_COLUMNS = [
+    "week_idx", "kind", "src", "dst", "node", "product", "qty",
+    "avg_urgency", "urgency", "ticket_id", "lot_ids",
+]
+# kind ごとに dict 化するときのキー（従来の move_log の dict と同じ形）
+_RECORD_KEYS = {
+    "ship":   ("week_idx", "kind", "src", "dst", "product", "qty", "avg_urgency", "lot_ids"),
+    "recv":   ("week_idx", "kind", "node", "qty", "lot_ids"),
+    "ticket": ("week_idx", "kind", "node", "product", "qty", "urgency", "ticket_id"),
+}
+_NAME_COLS = ("src", "dst", "node", "product")
+_NAN = float("nan")
+def _have_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+class MoveLog:
+    """
+    列指向の move ログ。
+
+        log = MoveLog(chunk_rows=100_000)
+        log.add_ship(week, src, dst, prod, qty, avg_urgency, lot_ids)
+        for df in log.iter_chunks(): ...
+
+    従来の list[dict] と同じく len() / for m in log / append(dict) が使える。
+    spill_dir を省略すると一時ディレクトリを作り、MoveLog が消える時に削除する。
+    """
+    def __init__(self, chunk_rows: int = 100_000, spill_dir: Optional[str] = None,
+                 fmt: Optional[str] = None):
+        self.chunk_rows = max(1, int(chunk_rows))
+        self.fmt = fmt or ("parquet" if _have_pyarrow() else "csv")
+        self.names: List[str] = []
+        self._name_index: Dict[Any, int] = {}
+        self._spill_dir = spill_dir
+        self._owns_dir = spill_dir is None
+        self._chunks: List[str] = []
+        self._spilled_rows = 0
+        self._reset()
+    # -- buffer -----------------------------------------------------------------
+    # 追記は行タプルを list に積むだけ（dict を作るより軽い）。
+    # 型付き列への変換と名前のコード化は spill / 読み出し時にチャンク単位でまとめて行う。
+    def _reset(self) -> None:
+        self._rows: List[tuple] = []
+    def _codes_of(self, names) -> np.ndarray:
+        """名前列 → 共有名前辞書の int32 コード（None は -1）。チャンク内で factorize してから写像"""
+        local, uniques = pd.factorize(np.array(names, dtype=object), use_na_sentinel=True)
+        idx = self._name_index
+        glob = np.empty(len(uniques) + 1, dtype=np.int32)
+        glob[-1] = -1                   # local == -1（None）→ -1
+        for i, name in enumerate(uniques):
+            c = idx.get(name)
+            if c is None:
+                c = idx[name] = len(self.names)
+                self.names.append(name)
+            glob[i] = c
+        return glob[local]
+    def _add(self, week_idx, kind: int, src=None, dst=None, node=None, product=None,
+             qty=0.0, avg_urgency=None, urgency=None, ticket_id=None, lot_ids=None) -> None:
+        rows = self._rows
+        rows.append((week_idx, kind, src, dst, node, product, qty, avg_urgency, urgency, ticket_id,
+                     list(lot_ids) if isinstance(lot_ids, (list, tuple)) else None))
+        if len(rows) >= self.chunk_rows:
+            self.spill()
+    def add_ship(self, week_idx, src, dst, product, qty, avg_urgency=None, lot_ids=None) -> None:
+        self._add(week_idx, 0, src=src, dst=dst, product=product, qty=qty,
+                  avg_urgency=avg_urgency, lot_ids=lot_ids)
+    def add_recv(self, week_idx, node, qty, lot_ids=None) -> None:
+        self._add(week_idx, 1, node=node, qty=qty, lot_ids=lot_ids)
+    def add_ticket(self, week_idx, node, product, qty, urgency=None, ticket_id=None) -> None:
+        self._add(week_idx, 2, node=node, product=product, qty=qty,
+                  urgency=urgency, ticket_id=ticket_id)
+    def append(self, m: dict) -> None:
+        """従来の move dict を 1 件追加（list.append 互換）"""
+        kind = m.get("kind")
+        k = MOVE_KINDS.index(kind) if kind in MOVE_KINDS else 0
+        self._add(m.get("week_idx", 0), k, src=m.get("src"), dst=m.get("dst"), node=m.get("node"),
+                  product=m.get("product"), qty=m.get("qty", 0.0) or 0.0,
+                  avg_urgency=m.get("avg_urgency"), urgency=m.get("urgency"),
+                  ticket_id=m.get("ticket_id"), lot_ids=m.get("lot_ids"))
+    def extend(self, moves) -> None:
+        for m in moves:
+            self.append(m)
+    def __len__(self) -> int:
+        return self._spilled_rows + len(self._rows)
+    # -- spill ------------------------------------------------------------------
+    def _dir(self) -> str:
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix="pysi_moves_")
+            weakref.finalize(self, shutil.rmtree, self._spill_dir, True)
+        os.makedirs(self._spill_dir, exist_ok=True)
+        return self._spill_dir
+    def _buffer_columns(self) -> Dict[str, Any]:
+        """buffer を列 dict（名前は int コード、数値は型付き ndarray）にする"""
+        rows = self._rows
+        (week, kind, src, dst, node, product, qty, avg_u, urg, ticket, lots) = \
+            [list(map(itemgetter(i), rows)) for i in range(11)]
+        def _f64(vals):
+            return np.array([_NAN if v is None else v for v in vals], dtype=np.float64)
+        return {
+            "week_idx": np.array(week, dtype=np.int32),
+            "kind": np.array(kind, dtype=np.int8),
+            "src": self._codes_of(src),
+            "dst": self._codes_of(dst),
+            "node": self._codes_of(node),
+            "product": self._codes_of(product),
+            "qty": np.array(qty, dtype=np.float64),
+            "avg_urgency": _f64(avg_u),
+            "urgency": _f64(urg),
+            "ticket_id": [None if t is None else str(t) for t in ticket],
+            "lot_ids": lots,
+        }
+    def spill(self) -> None:
+        """buffer を 1 チャンクとしてディスクへ書き出す"""
+        n = len(self._rows)
+        if n == 0:
+            return
+        cols = self._buffer_columns()
+        path = os.path.join(self._dir(), f"moves_{len(self._chunks):05d}.{self.fmt}")
+        if self.fmt == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            tbl = pa.table({
+                **{k: cols[k] for k in ("week_idx", "kind", *_NAME_COLS, "qty", "avg_urgency", "urgency")},
+                "ticket_id": pa.array(cols["ticket_id"], type=pa.string()),
+                "lot_ids": pa.array([None if v is None else [str(x) for x in v] for v in cols["lot_ids"]],
+                                    type=pa.list_(pa.string())),
+            })
+            pq.write_table(tbl, path)
+        else:
+            df = pd.DataFrame(cols)
+            df["lot_ids"] = [None if v is None else "|".join(map(str, v)) for v in cols["lot_ids"]]
+            df.to_csv(path, index=False)
+        self._chunks.append(path)
+        self._spilled_rows += n
+        self._reset()
+    def _read_chunk(self, path: str) -> Dict[str, Any]:
+        if self.fmt == "parquet":
+            import pyarrow.parquet as pq
+            tbl = pq.read_table(path)
+            cols = {k: tbl.column(k).to_numpy() for k in ("week_idx", "kind", *_NAME_COLS, "qty", "avg_urgency", "urgency")}
+            cols["ticket_id"] = tbl.column("ticket_id").to_pylist()
+            cols["lot_ids"] = tbl.column("lot_ids").to_pylist()
+            return cols
+        df = pd.read_csv(path, dtype={"ticket_id": object, "lot_ids": object},
+                         keep_default_na=False, na_values=[""], float_precision="round_trip")
+        cols = {k: df[k].to_numpy() for k in ("week_idx", "kind", *_NAME_COLS, "qty", "avg_urgency", "urgency")}
+        cols["ticket_id"] = [None if pd.isna(v) else v for v in df["ticket_id"]]
+        cols["lot_ids"] = [None if pd.isna(v) else str(v).split("|") for v in df["lot_ids"]]
+        return cols
+    # -- read -------------------------------------------------------------------
+    def _iter_column_chunks(self) -> Iterator[Dict[str, Any]]:
+        for path in list(self._chunks):
+            yield self._read_chunk(path)
+        if self._rows:
+            yield self._buffer_columns()
+    def _decode(self, cols: Dict[str, Any]) -> Dict[str, Any]:
+        """コード列を名前に戻した列 dict（MOVE_COLUMNS 順）"""
+        names = np.array(self.names + [None], dtype=object)   # -1 → 末尾の None
+        kinds = np.array(MOVE_KINDS, dtype=object)
+        out = {
+            "week_idx": np.asarray(cols["week_idx"], dtype=np.int64),
+            "kind": kinds[np.asarray(cols["kind"], dtype=np.int64)],
+        }
+        for c in _NAME_COLS:
+            out[c] = names[np.asarray(cols[c], dtype=np.int64)]
+        out["qty"] = np.asarray(cols["qty"], dtype=float)
+        out["avg_urgency"] = np.asarray(cols["avg_urgency"], dtype=float)
+        out["urgency"] = np.asarray(cols["urgency"], dtype=float)
+        out["ticket_id"] = cols["ticket_id"]
+        out["lot_ids"] = cols["lot_ids"]
+        return {c: out[c] for c in MOVE_COLUMNS}
+    def iter_chunks(self) -> Iterator[pd.DataFrame]:
+        """チャンク（退避済み → 未退避 buffer の順）ごとに MOVE_COLUMNS の DataFrame を返す"""
+        for cols in self._iter_column_chunks():
+            out = self._decode(cols)
+            # 名前列は object のまま（None を NaN にしない）
+            yield pd.DataFrame({c: pd.Series(v, dtype=object) if c in _NAME_COLS + ("kind", "ticket_id", "lot_ids")
+                                else v for c, v in out.items()}, columns=MOVE_COLUMNS)
+    def iter_records(self) -> Iterator[dict]:
+        """従来の move dict（kind ごとのキー）を 1 件ずつ返す"""
+        for cols in self._iter_column_chunks():
+            out = self._decode(cols)
+            lists = [out[c].tolist() if isinstance(out[c], np.ndarray) else out[c] for c in MOVE_COLUMNS]
+            for row in zip(*lists):
+                rec = dict(zip(MOVE_COLUMNS, row))
+                keys = _RECORD_KEYS.get(rec["kind"], MOVE_COLUMNS)
+                m = {k: rec[k] for k in keys}
+                for k in ("avg_urgency", "urgency"):
+                    if k in m and m[k] != m[k]:   # NaN → None
+                        m[k] = None
+                yield m
+    __iter__ = iter_records
+    def to_frame(self) -> pd.DataFrame:
+        """全件を 1 つの DataFrame に（小さいログや cockpit 用。大きいログは iter_chunks を使う）"""
+        frames = list(self.iter_chunks())
+        if not frames:
+            return pd.DataFrame(columns=MOVE_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+    def close(self) -> None:
+        """一時ディレクトリを消す（spill_dir を渡した場合は残す）"""
+        if self._owns_dir and self._spill_dir and os.path.isdir(self._spill_dir):
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+        self._chunks = []
+        self._spilled_rows = 0
+        self._reset()
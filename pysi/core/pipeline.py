@@ -3,10 +3,14 @@
 
 from __future__ import annotations
 from typing import Any, Dict
+from contextlib import nullcontext
 import subprocess   # ← 追加：長期計画モードでOptimiser自動実行用
 import os           # ← 追加：ファイル存在チェック用
 
 from pysi.core.hooks.core import HookBus
+from pysi.core.pipeline_arrays import init_array_state, finalize_array_state, run_one_step_arrays
+from pysi.core.move_log import MoveLog
+from pysi.core.profiler import StageProfiler
 
 # plugin: 
 from pysi.plugins.capacity_allocator import capacity_constraint_allocator   # ← 追加（プラグイン読み込み）
@@ -76,11 +80,36 @@ def run_one_step(root, week_idx: int, allocation, params) -> bool:
     return True
 
 class Pipeline:
-    """ジオラマ的・段階型パイプライン。全Hookはここを通る。"""
-    def __init__(self, hooks: HookBus, io, logger=None):
+    """
+    ジオラマ的・段階型パイプライン。全Hookはここを通る。
+    engine="dict"（既定・参照実装）/ "array"（pipeline_arrays: 密 index + NumPy 行列で週次ステップ）
+    move ログは state["move_log"] の MoveLog（列指向、move_log_chunk_rows 行ごとにディスク退避）
+    profiler=StageProfiler() で段階別 / hook・plugin 別の wall・CPU・peak RSS を記録
+    """
+    def __init__(self, hooks: HookBus, io, logger=None, engine: str = "dict",
+                 move_log_chunk_rows: int = 100_000, move_log_dir: str | None = None,
+                 profiler: StageProfiler | None = None):
+        if engine not in ("dict", "array"):
+            raise ValueError(f"unknown pipeline engine: {engine}")
         self.hooks, self.io, self.logger = hooks, io, logger
+        self.engine = engine
+        self.move_log_chunk_rows = move_log_chunk_rows
+        self.move_log_dir = move_log_dir
+        self.profiler = profiler
+        if profiler is not None:
+            hooks.enable_timing(True, profiler=profiler)
+
+    def _stage(self, name: str, cat: str = "pipeline"):
+        return self.profiler.stage(name, cat=cat) if self.profiler is not None else nullcontext()
+
+    def _timed(self, fn, name: str, cat: str = "pipeline"):
+        return self.profiler.wrap(fn, name, cat=cat) if self.profiler is not None else fn
 
     def run(self, db_path: str, scenario_id: str, calendar: Dict[str, Any], out_dir: str = "out"):
+        with self._stage(f"run:{scenario_id}"):
+            return self._run(db_path, scenario_id, calendar, out_dir)
+
+    def _run(self, db_path: str, scenario_id: str, calendar: Dict[str, Any], out_dir: str = "out"):
         # ---- 追加：長期能力計画モードでSCN Optimiser自動実行 ----
         long_term_keywords = ["long_term", "capacity_planning", "annual_plan", "quarterly_plan"]
         if any(keyword in scenario_id.lower() for keyword in long_term_keywords):
@@ -108,14 +137,16 @@ class Pipeline:
         spec = {"db_path": db_path, "scenario_id": scenario_id}
         spec = self.hooks.apply_filters("scenario:preload", spec,
                                         db_path=db_path, scenario_id=scenario_id, logger=self.logger, run_id=calendar.get("run_id"))
-        raw = self.io.load_all(spec)
+        with self._stage("data_load"):
+            raw = self.io.load_all(spec)
         self.hooks.do_action("after_data_load",
                              db_path=db_path, scenario_id=scenario_id, raw=raw, logger=self.logger, run_id=calendar.get("run_id"))
 
         # ---- Tree Build ----
         self.hooks.do_action("before_tree_build",
                              db_path=db_path, scenario_id=scenario_id, raw=raw, logger=self.logger)
-        root = self.io.build_tree(raw)
+        with self._stage("tree_build"):
+            root = self.io.build_tree(raw)
         root = self.hooks.apply_filters("plan:graph:build", root,
                                         db_path=db_path, scenario_id=scenario_id, raw=raw, logger=self.logger)
         root = self.hooks.apply_filters("opt:network_design", root,
@@ -126,7 +157,8 @@ class Pipeline:
         # ---- PSI Build ----
         self.hooks.do_action("before_psi_build",
                              db_path=db_path, scenario_id=scenario_id, root=root, logger=self.logger)
-        params = self.io.derive_params(raw)
+        with self._stage("derive_params"):
+            params = self.io.derive_params(raw)
         params = self.hooks.apply_filters("plan:params", params,
                                           db_path=db_path, scenario_id=scenario_id, root=root, logger=self.logger)
         params = self.hooks.apply_filters("opt:capacity_plan", params,
@@ -145,7 +177,8 @@ class Pipeline:
             graph=root, calendar=calendar, scenario_id=scenario_id, logger=self.logger
         )
 
-        demand_map = self.io.build_initial_demand(raw, params)
+        with self._stage("initial_demand"):
+            demand_map = self.io.build_initial_demand(raw, params)
 
         # ★ tickets を作る（デフォルト実装 or プラグイン実装に委ねる）
         tickets_by_week = self.hooks.apply_filters(
@@ -157,6 +190,27 @@ class Pipeline:
         )
 
         weeks = int(calendar["weeks"] if isinstance(calendar, dict) else getattr(calendar, "weeks", 0))
+
+        # array モード：demand_map は行列化し、hook には dict 互換の view を渡す
+        arrs = None
+        step_fn = run_one_step
+        if self.engine == "array" and isinstance(root, dict) and isinstance(demand_map, dict):
+            arrs = init_array_state(root, demand_map, weeks)
+            demand_map = arrs.demand_view
+            step_fn = run_one_step_arrays
+        # 週次ループ内の allocator / step は呼び出しごとに計測（profile 時のみ包む）
+        allocator_fn = self._timed(allocator_fn, "allocator", cat="plugin")
+        step_fn = self._timed(step_fn, f"step:{self.engine}")
+
+        # move ログ（既存の list があれば引き継ぐ）
+        movelog = root.setdefault("state", {}).get("move_log") if isinstance(root, dict) else None
+        if not isinstance(movelog, MoveLog):
+            prev = movelog or []
+            movelog = MoveLog(chunk_rows=self.move_log_chunk_rows, spill_dir=self.move_log_dir)
+            movelog.extend(prev)
+            if isinstance(root, dict):
+                root["state"]["move_log"] = movelog
+
         for week_idx in range(int(weeks)):
             week_tickets = tickets_by_week.get(week_idx, [])
 
@@ -205,76 +259,55 @@ class Pipeline:
                 # 既存の leaf 需要/在庫の簡易ログ
                 leafs = root.get("state", {}).get("leafs", set())
                 dem_leaf = 0.0
-                for (n, p), by_week in demand_map.items():
-                    if n in leafs:
-                        dem_leaf += float(by_week.get(week_idx, 0.0))
+                if arrs is not None:
+                    dem_leaf = arrs.leaf_demand_total(week_idx)
+                else:
+                    for (n, p), by_week in demand_map.items():
+                        if n in leafs:
+                            dem_leaf += float(by_week.get(week_idx, 0.0))
                 self.logger.debug(
                     f"[week {week_idx}] tickets={len(week_tickets)} demand_leaf={dem_leaf:.2f} "
                     f"inv_RET_01={root['state']['inventory'].get('RET_01')}"
                 )
 
-            # --- 週の move ログ（lot 単位でも集計でもOK）を state に追記 ---
-            movelog = root.setdefault("state", {}).setdefault("move_log", [])
-
+            # --- 週の move ログ（lot 単位でも集計でもOK）を MoveLog に追記 ---
             # shipments: key = (src, dst, prod) / val = dict or number
-            for k, v in (ships or {}).items():
-                src, dst, prod = k
+            for (src, dst, prod), v in (ships or {}).items():
                 if isinstance(v, dict):
-                    qty = float(v.get("qty", 0.0))
-                    avg_u = v.get("avg_urgency")
-                    lot_ids = v.get("lot_ids")  # あれば list[str]
+                    movelog.add_ship(week_idx, src, dst, prod, float(v.get("qty", 0.0)),
+                                     v.get("avg_urgency"), v.get("lot_ids"))  # lot_ids: あれば list[str]
                 else:
-                    qty = float(v)
-                    avg_u = None
-                    lot_ids = None
-                movelog.append({
-                    "week_idx": int(week_idx),
-                    "kind": "ship",
-                    "src": src, "dst": dst, "product": prod,
-                    "qty": qty,
-                    "avg_urgency": avg_u,
-                    "lot_ids": list(lot_ids) if isinstance(lot_ids, (list, tuple)) else None,
-                })
+                    movelog.add_ship(week_idx, src, dst, prod, float(v))
 
             # receipts: key = node / val = dict or number
             for node, v in (recs or {}).items():
                 if isinstance(v, dict):
-                    qty = float(v.get("qty", 0.0))
-                    lot_ids = v.get("lot_ids")
+                    movelog.add_recv(week_idx, node, float(v.get("qty", 0.0)), v.get("lot_ids"))
                 else:
-                    qty = float(v)
-                    lot_ids = None
-                movelog.append({
-                    "week_idx": int(week_idx),
-                    "kind": "recv",
-                    "node": node,
-                    "qty": qty,
-                    "lot_ids": list(lot_ids) if isinstance(lot_ids, (list, tuple)) else None,
-                })
+                    movelog.add_recv(week_idx, node, float(v))
 
             # 需要チケット（参考ログ）
             for t in (week_tickets or []):
-                movelog.append({
-                    "week_idx": int(week_idx),
-                    "kind": "ticket",
-                    "node": t.get("node"),
-                    "product": t.get("product"),
-                    "qty": float(t.get("qty", 0.0)),
-                    "urgency": float(t.get("urgency", 0.0)),
-                    "ticket_id": t.get("ticket_id"),
-                })
+                movelog.add_ticket(week_idx, t.get("node"), t.get("product"),
+                                   float(t.get("qty", 0.0)), float(t.get("urgency", 0.0)),
+                                   t.get("ticket_id"))
 
             # 実反映
-            run_one_step(root, week_idx, allocation, params)
+            step_fn(root, week_idx, allocation, params)
+
+        if arrs is not None:
+            finalize_array_state(root)
 
         # ---- Collect / Adjust ----
-        result = self.io.collect_result(root, params)
+        with self._stage("collect"):
+            result = self.io.collect_result(root, params)
         result = self.hooks.apply_filters("opt:postplan_adjust", result,
                                           db_path=db_path, scenario_id=scenario_id, logger=self.logger)
 
         # ---- Output ----
         weeks = int(calendar["weeks"] if isinstance(calendar, dict) else getattr(calendar, "weeks", 0))
-        series_df = self.io.to_series_df(result, horizon=weeks)
+        with self._stage("series"):
+            series_df = self.io.to_series_df(result, horizon=weeks)
 
         series_df = self.hooks.apply_filters(
             "viz:series", series_df,
@@ -316,12 +349,13 @@ class Pipeline:
             "out_dir": out_dir,
         }
         for ex in exporters:
-            try:
-                ex(result, **export_ctx)
-            except TypeError:
-                ex(result)
-            except Exception as e:
-                self.logger and self.logger.exception(f"exporter failed: {e}")
+            with self._stage(getattr(ex, "__qualname__", None) or repr(ex), cat="exporter"):
+                try:
+                    ex(result, **export_ctx)
+                except TypeError:
+                    ex(result)
+                except Exception as e:
+                    self.logger and self.logger.exception(f"exporter failed: {e}")
 
         self.hooks.do_action("after_scenario_run",
                              db_path=db_path, scenario_id=scenario_id,
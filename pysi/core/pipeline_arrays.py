@@ -0,0 +1,196 @@
+# pysi/core/pipeline_arrays.py
+# Pipeline の array モード（engine="array"）用の状態と週次ステップ
+#  - node / (node, product) を一度だけ密な index に写像
+#  - demand_map は (pairs × weeks) の行列、在庫は nodes 長のベクトル
+#  - hook には dict 互換の軽量 view（DemandMatrixView / InventoryView）を渡す
+#  - run_one_step_arrays は run_one_step（dict 版・参照実装）と同じ結果を配列演算で出す
+from __future__ import annotations
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Dict, Iterator, List, Tuple
+import numpy as np
+def _qty(v) -> float:
+    return float(v.get("qty", 0.0)) if isinstance(v, dict) else float(v)
+class _WeekRow(Mapping):
+    """demand 行列の 1 行を {week: qty} として見せる（0 の週は無いものとして扱う）"""
+    __slots__ = ("_row",)
+    def __init__(self, row: List[float]):
+        self._row = row                 # 行列の行を list にした読み取り用コピー（hook 側の .get を速くする）
+    def __getitem__(self, week):
+        w = int(week)
+        if 0 <= w < len(self._row) and self._row[w] != 0.0:
+            return self._row[w]
+        raise KeyError(week)
+    def get(self, week, default=None):
+        w = int(week)
+        if 0 <= w < len(self._row):
+            return self._row[w]
+        return default
+    def __iter__(self) -> Iterator[int]:
+        return (w for w, q in enumerate(self._row) if q != 0.0)
+    def __len__(self) -> int:
+        return sum(1 for q in self._row if q != 0.0)
+class DemandMatrixView(Mapping):
+    """{(node, product): {week: qty}} 互換の読み取り専用 view"""
+    def __init__(self, state: "ArrayPlanState"):
+        self._state = state
+        self._rows = [_WeekRow(r) for r in state.demand.tolist()]
+    def __getitem__(self, key):
+        return self._rows[self._state.pair_index[key]]
+    def __iter__(self):
+        return iter(self._state.pairs)
+    def __len__(self) -> int:
+        return len(self._state.pairs)
+    def __contains__(self, key) -> bool:
+        return key in self._state.pair_index
+    def items(self):
+        return list(zip(self._state.pairs, self._rows))
+    def values(self):
+        return list(self._rows)
+class InventoryView(MutableMapping):
+    """{node: qty} 互換の view（書き込みは在庫ベクトルへ反映）"""
+    def __init__(self, state: "ArrayPlanState"):
+        self._state = state
+    def __getitem__(self, node):
+        return float(self._state.inv[self._state.node_index[node]])
+    def __setitem__(self, node, qty) -> None:
+        self._state.inv[self._state.node_id(node)] = float(qty)
+    def __delitem__(self, node) -> None:
+        raise TypeError("InventoryView: node は削除できません")
+    def __iter__(self):
+        return iter(self._state.nodes)
+    def __len__(self) -> int:
+        return len(self._state.nodes)
+    def __contains__(self, node) -> bool:
+        return node in self._state.node_index
+class ArrayPlanState:
+    """
+    array モードの計画状態。root["state"]["arrays"] に置かれる。
+      nodes / node_index : 在庫ノードの密 index
+      pairs / pair_index : demand の (node, product) 密 index
+      demand             : (len(pairs), weeks) float 行列
+      inv                : (len(nodes),) float 在庫
+      leaf_node / leaf_pair : 葉ノードの mask
+    """
+    def __init__(self, inventory: Dict[Any, float], leafs, demand_map, weeks: int = 0):
+        self.nodes: List[Any] = list(inventory.keys())
+        self.node_index: Dict[Any, int] = {n: i for i, n in enumerate(self.nodes)}
+        self.inv = np.array([float(inventory[n]) for n in self.nodes], dtype=float)
+        self.leafs = set(leafs or ())
+        self.pairs: List[Tuple[Any, Any]] = list((demand_map or {}).keys())
+        self.pair_index: Dict[Tuple[Any, Any], int] = {k: j for j, k in enumerate(self.pairs)}
+        max_w = -1
+        for by_week in (demand_map or {}).values():
+            if by_week:
+                max_w = max(max_w, max(int(w) for w in by_week.keys()))
+        self.weeks = max(int(weeks or 0), max_w + 1, 0)
+        self.demand = np.zeros((len(self.pairs), self.weeks), dtype=float)
+        for j, key in enumerate(self.pairs):
+            for w, q in (demand_map[key] or {}).items():
+                w = int(w)
+                if w >= 0:
+                    self.demand[j, w] += float(q)
+        self._refresh_masks()
+        self.demand_view = DemandMatrixView(self)
+        self.inventory_view = InventoryView(self)
+    def _refresh_masks(self) -> None:
+        # pair_node を先に作る（葉の demand だけ持つ node もここで index に入る）
+        self.pair_node = np.array([self.node_id(n) for n, _ in self.pairs], dtype=np.int64)
+        self.leaf_pair = np.array([n in self.leafs for n, _ in self.pairs], dtype=bool)
+        self.leaf_node = np.array([n in self.leafs for n in self.nodes], dtype=bool)
+    def node_id(self, node) -> int:
+        """node の index（未登録なら在庫 0 で追加。dict 版の inv.get(node, 0.0) と同じ扱い）"""
+        i = self.node_index.get(node)
+        if i is None:
+            i = self.node_index[node] = len(self.nodes)
+            self.nodes.append(node)
+            self.inv = np.append(self.inv, 0.0)
+            if hasattr(self, "leaf_node"):
+                self.leaf_node = np.append(self.leaf_node, node in self.leafs)
+        return i
+    def week_demand(self, week_idx: int) -> np.ndarray:
+        if 0 <= week_idx < self.weeks:
+            return self.demand[:, week_idx]
+        return np.zeros(len(self.pairs), dtype=float)
+    def leaf_demand_total(self, week_idx: int) -> float:
+        return float(self.week_demand(week_idx)[self.leaf_pair].sum())
+    def inventory_dict(self) -> Dict[Any, float]:
+        return dict(zip(self.nodes, self.inv.tolist()))
+def init_array_state(root, demand_map, weeks: int) -> ArrayPlanState:
+    """root["state"] に ArrayPlanState を作り、inventory を view に差し替える"""
+    state = root.setdefault("state", {})
+    arrs = ArrayPlanState(state.get("inventory", {}) or {}, state.get("leafs", set()), demand_map, weeks)
+    state["arrays"] = arrs
+    state["inventory"] = arrs.inventory_view
+    return arrs
+def finalize_array_state(root) -> None:
+    """ループ終了後、inventory を素の dict に戻す（下流の exporter 互換）"""
+    state = root.get("state", {})
+    arrs = state.get("arrays")
+    if isinstance(arrs, ArrayPlanState):
+        state["inventory"] = arrs.inventory_dict()
+def _node_vector(arrs: ArrayPlanState, items) -> np.ndarray:
+    """[(node, qty), ...] → 在庫ベクトル長の合計量"""
+    idx, qty = [], []
+    for node, q in items:
+        idx.append(arrs.node_id(node))
+        qty.append(q)
+    return np.bincount(np.asarray(idx, dtype=np.int64), weights=np.asarray(qty, dtype=float),
+                       minlength=len(arrs.nodes))
+def run_one_step_arrays(root, week_idx: int, allocation, params) -> bool:
+    """run_one_step の配列版：receipts → shipments → demand(leaf) → 履歴ログ(+ avg_urgency)"""
+    state = root["state"]
+    arrs: ArrayPlanState = state["arrays"]
+    shipments  = allocation.get("shipments", {}) or {}
+    receipts   = allocation.get("receipts",  {}) or {}
+    demand_map = allocation.get("demand_map", {})
+    # 1) 入荷反映
+    if receipts:
+        add = _node_vector(arrs, ((n, _qty(q)) for n, q in receipts.items()))
+        arrs.inv += add
+    # 2) 出荷反映：同一 src の逐次 max(0, x - q) は q >= 0 なら max(0, x - Σq) と同じ
+    tot_qty = 0.0
+    num_u = 0.0
+    if shipments:
+        items = []
+        for (src, _dst, _prod), v in shipments.items():
+            q = _qty(v)
+            items.append((src, q))
+            if isinstance(v, dict):
+                u = v.get("avg_urgency", None)
+                tot_qty += q
+                if u is not None:
+                    num_u += q * float(u)
+        if all(q >= 0.0 for _, q in items):
+            sub = _node_vector(arrs, items)
+            np.maximum(arrs.inv - sub, 0.0, out=arrs.inv)
+        else:
+            for src, q in items:        # 負の出荷が混ざる時は逐次（dict 版と同じ順序）
+                i = arrs.node_id(src)
+                arrs.inv[i] = max(0.0, arrs.inv[i] - q)
+    # 3) 需要控除（葉）
+    if demand_map is arrs.demand_view:
+        d = arrs.week_demand(week_idx)
+        mask = arrs.leaf_pair & (d > 0)
+        if mask.any():
+            sub = np.bincount(arrs.pair_node[mask], weights=d[mask], minlength=len(arrs.nodes))
+            np.maximum(arrs.inv - sub, 0.0, out=arrs.inv)
+    else:
+        # hook が demand_map を差し替えた場合は dict として読む
+        for (node, _prod), by_week in (demand_map or {}).items():
+            if node in arrs.leafs and node in arrs.node_index:
+                qty = float(by_week.get(week_idx, 0.0))
+                if qty > 0:
+                    i = arrs.node_index[node]
+                    arrs.inv[i] = max(0.0, arrs.inv[i] - qty)
+    # 4) 在庫履歴を記録（可視化用）＋ 平均urgency（数量重み）
+    inv_leaf = float(arrs.inv[arrs.leaf_node].sum()) if arrs.leafs else float(arrs.inv.sum())
+    inv_total = float(arrs.inv.sum())
+    avg_u = (num_u / tot_qty) if tot_qty > 0 else None
+    hist = state.setdefault("hist", {
+        "week": [], "inventory": [], "inventory_total": [], "avg_urgency": []
+    })
+    hist["week"].append(int(week_idx))
+    hist["inventory"].append(inv_leaf)
+    hist["inventory_total"].append(inv_total)
+    hist["avg_urgency"].append(avg_u)
+    return True
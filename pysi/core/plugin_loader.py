@@ -3,7 +3,6 @@ from __future__ import annotations
 import importlib
 import importlib.util
 import importlib.machinery
-import importlib.metadata as md
 import os
 import pkgutil
 from types import ModuleType
@@ -51,35 +50,21 @@ def discover_and_register(bus, plugins_dir: Optional[str] = None, api_version: s
                 except Exception as e:
                     bus.logger and bus.logger.exception(f"[hooks] load failed: {mod_name}: {e}")
 
-    # 2) パッケージ配下 pysi.plugins.*
+    # 2) パッケージ配下 pysi.plugins.*（plugin.json の entry だけ。hook の初回発火まで import を遅らせる）
     try:
-        pkg = importlib.import_module("pysi.plugins")
-        for m in pkgutil.iter_modules(pkg.__path__):  # type: ignore
-            mod_name = f"pysi.plugins.{m.name}"
-            if mod_name in seen:
-                continue
-            try:
-                mod = importlib.import_module(mod_name)
-                # サブモジュールの中に plugin.py がある場合にも対応
-                called = _call_register(mod, bus)
-                if not called:
-                    # よくある構成: pysi.plugins.educ_pack.plugin.register
-                    sub_name = f"{mod_name}.plugin"
-                    try:
-                        sub = importlib.import_module(sub_name)
-                        _call_register(sub, bus)
-                        mod_name = sub_name
-                    except Exception:
-                        pass
-                bus.logger and bus.logger.info(f"[hooks] loaded plugin: {mod_name}")
-            except Exception as e:
-                bus.logger and bus.logger.exception(f"[hooks] import failed: {mod_name}: {e}")
+        from pysi.core.plugin_registry import get_registry
+        reg = get_registry("pysi.plugins")
+        for spec in reg.discover():
+            if spec.module in seen or spec.module.rsplit(".", 1)[0] in seen:
+                bus.loaded_plugins.add(spec.module)
+        reg.install(bus)
     except Exception:
         # pysi.plugins が無い環境も許容
-        pass
+        bus.logger and bus.logger.exception("[hooks] pysi.plugins registry failed")
 
-    # 3) entry_points (任意)
+    # 3) entry_points (任意)  ※ importlib.metadata は重いのでここで import
     try:
+        import importlib.metadata as md
         for ep in md.entry_points(group="psi_plugins"):
             try:
                 reg = ep.load()
@@ -0,0 +1,219 @@
+# pysi/core/plugin_registry.py
+# plugin.json（manifest）駆動の plugin 登録
+#  - pysi/plugins/<name>/plugin.json を読み、entry モジュールだけを import する
+#    （plugin_BK251019.py / plugin_OLD.py / plugin_251020_SHIP_OK.py / plugin.off.py は見ない）
+#  - manifest に hooks があれば遅延ロード：その hook が最初に発火した時に import + register(bus)
+#  - 同じ bus への登録は 1 回だけ（autoload_plugins と call_register_if_present を両方呼んでも二重にならない）
+#  - 探索結果は __pycache__/plugin_registry.json にキャッシュ（ディレクトリ / manifest の mtime が同じなら再走査しない）
+#
+# plugin.json の例:
+#   {"name": "log_moves_csv", "entry": "plugin", "priority": 90, "hooks": ["report:exporters"]}
+#   "enabled": false で無効化、"lazy": false か hooks が空なら起動時に読み込む。
+from __future__ import annotations
+import importlib
+import json
+import logging
+import os
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+logger = logging.getLogger(__name__)
+MANIFEST_FILE = "plugin.json"
+CACHE_FILE = "plugin_registry.json"
+CACHE_VERSION = 1
+# バックアップ / 無効化されたモジュール名（entry には使わない）
+_INACTIVE_RE = re.compile(r"(_BK\d*|_OLD|_SHIP_OK|\.off)(_|\b|$)", re.IGNORECASE)
+def is_inactive_module(name: str) -> bool:
+    """plugin_BK251019 / plugin_OLD / plugin_251020_SHIP_OK / plugin.off などは True"""
+    return bool(_INACTIVE_RE.search(name))
+@dataclass
+class PluginSpec:
+    name: str                           # パッケージ名（例: log_moves_csv）
+    module: str                         # import するモジュール（例: pysi.plugins.log_moves_csv.plugin）
+    hooks: List[str] = field(default_factory=list)
+    priority: int = 50                  # 読み込み順（同じ hook・同じ priority の callback はこの順）
+    enabled: bool = True
+    lazy: bool = True
+    manifest: bool = False              # plugin.json から作ったか（無ければ plugin.py を推測）
+    @property
+    def deferred(self) -> bool:
+        return self.enabled and self.lazy and bool(self.hooks)
+def _read_manifest(pkg_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(pkg_dir, MANIFEST_FILE)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, encoding="utf-8-sig") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning("[plugins] manifest を読めません: %s (%s)", path, e)
+        return {"enabled": False}
+def _spec_for(package: str, name: str, pkg_dir: str) -> Optional[PluginSpec]:
+    if os.path.isfile(pkg_dir):
+        # パッケージ直下の単一ファイル plugin（例: pysi/plugins/foo.py）は従来どおり起動時に読む
+        return PluginSpec(name, f"{package}.{name}", lazy=False)
+    man = _read_manifest(pkg_dir)
+    if man is None:
+        # manifest なし：plugin.py があればそれを（従来の構成）、無ければ対象外
+        if not os.path.isfile(os.path.join(pkg_dir, "plugin.py")):
+            return None
+        return PluginSpec(name, f"{package}.{name}.plugin", lazy=False)
+    entry = str(man.get("entry") or "plugin")
+    enabled = bool(man.get("enabled", True))
+    if is_inactive_module(entry):
+        logger.warning("[plugins] %s: entry '%s' はバックアップ名なので無効にします", name, entry)
+        enabled = False
+    hooks = man.get("hooks") or []
+    if isinstance(hooks, dict):          # {"hook": priority} 形式も許す
+        hooks = list(hooks.keys())
+    return PluginSpec(
+        name=str(man.get("name") or name),
+        module=f"{package}.{name}.{entry}" if entry != "__init__" else f"{package}.{name}",
+        hooks=[str(h) for h in hooks],
+        priority=int(man.get("priority", 50)),
+        enabled=enabled,
+        lazy=bool(man.get("lazy", True)),
+        manifest=True,
+    )
+class PluginRegistry:
+    """
+    1 つの plugin パッケージ（既定 pysi.plugins）の探索結果と、bus への登録。
+
+        reg = get_registry("pysi.plugins")
+        reg.install(bus)            # 遅延 hook を張る（import は hook の初回発火時）
+    """
+    def __init__(self, package: str = "pysi.plugins", use_cache: Optional[bool] = None):
+        self.package = package
+        if use_cache is None:
+            use_cache = os.getenv("PYSI_PLUGIN_CACHE", "1").lower() not in ("0", "false", "no")
+        self.use_cache = use_cache
+        self.cache_hit = False
+        self._specs: Optional[List[PluginSpec]] = None
+        self._rank: Dict[str, int] = {}
+    # -- discovery --------------------------------------------------------------
+    def _package_dirs(self) -> List[str]:
+        pkg = importlib.import_module(self.package)
+        return [os.path.abspath(p) for p in getattr(pkg, "__path__", [])]
+    @staticmethod
+    def _signature(base: str) -> Tuple[List[Tuple[str, int, int]], List[Tuple[str, str]]]:
+        """(name, mtime, manifest mtime) の一覧と、plugin パッケージ / 単一ファイル plugin の一覧"""
+        sig, dirs = [], []
+        entries = sorted(os.scandir(base), key=lambda e: e.name)
+        pkg_names = {e.name for e in entries if e.is_dir()}
+        for ent in entries:
+            if ent.name.startswith(("_", ".")):
+                continue
+            if ent.is_file():
+                stem, ext = os.path.splitext(ent.name)
+                # 同名パッケージに隠れるファイル（capacity_allocator.py 等）とバックアップは対象外
+                if ext == ".py" and stem not in pkg_names and not is_inactive_module(stem):
+                    sig.append((stem, ent.stat().st_mtime_ns, 0))
+                    dirs.append((stem, ent.path))
+                continue
+            if not os.path.isfile(os.path.join(ent.path, "__init__.py")):
+                continue
+            try:
+                m = os.stat(os.path.join(ent.path, MANIFEST_FILE)).st_mtime_ns
+            except OSError:
+                m = 0
+            sig.append((ent.name, ent.stat().st_mtime_ns, m))
+            dirs.append((ent.name, ent.path))
+        return sig, dirs
+    @staticmethod
+    def _cache_path(base: str) -> str:
+        return os.path.join(base, "__pycache__", CACHE_FILE)
+    def _load_cache(self, base: str, sig) -> Optional[List[PluginSpec]]:
+        try:
+            with open(self._cache_path(base), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != CACHE_VERSION or data.get("package") != self.package:
+            return None
+        if [tuple(x) for x in data.get("signature", [])] != [tuple(x) for x in sig]:
+            return None
+        return [PluginSpec(**d) for d in data.get("specs", [])]
+    def _save_cache(self, base: str, sig, specs: List[PluginSpec]) -> None:
+        path = self._cache_path(base)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": CACHE_VERSION, "package": self.package, "signature": sig,
+                           "specs": [asdict(s) for s in specs]}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, path)
+        except OSError:
+            pass                        # 書けない環境（読み取り専用インストール等）はキャッシュなし
+    def discover(self, refresh: bool = False) -> List[PluginSpec]:
+        """plugin 一覧（priority, name 順）。キャッシュが有効ならディレクトリ走査だけで済ませる"""
+        if self._specs is not None and not refresh:
+            return self._specs
+        specs: List[PluginSpec] = []
+        self.cache_hit = True
+        for base in self._package_dirs():
+            sig, dirs = self._signature(base)
+            cached = None if (refresh or not self.use_cache) else self._load_cache(base, sig)
+            if cached is None:
+                self.cache_hit = False
+                cached = [s for s in (_spec_for(self.package, n, p) for n, p in dirs) if s is not None]
+                if self.use_cache:
+                    self._save_cache(base, sig, cached)
+            specs.extend(cached)
+        specs.sort(key=lambda s: (s.priority, s.name))
+        self._specs = specs
+        self._rank = {s.module: i for i, s in enumerate(specs)}
+        return specs
+    # -- install / load ---------------------------------------------------------
+    def load(self, spec: PluginSpec, bus) -> bool:
+        """entry を import して register(bus) を呼ぶ（bus ごとに 1 回だけ）。成功 → True"""
+        from pysi.core.hooks import core
+        done = bus.loaded_plugins
+        if spec.module in done:
+            return True
+        done.add(spec.module)
+        prev_global, prev_rank = core.hooks, bus._rank
+        # デコレータ方式（@action/@filter）も同じ bus に入るよう一時的に global を合わせる
+        core.set_global(bus)
+        self.discover()
+        bus._rank = self._rank.get(spec.module, prev_rank)
+        try:
+            mod = importlib.import_module(spec.module)
+            print(f"[hooks] loaded plugin: {spec.module}")
+            reg = getattr(mod, "register", None)
+            if callable(reg):
+                try:
+                    reg(bus)
+                    logger.info("[plugins] called register(bus) on %s", spec.module)
+                except Exception:
+                    logger.exception("[plugins] register(bus) failed for %s", spec.module)
+            return True
+        except Exception:
+            core._print_exc(f"[hooks] failed to import: {spec.module}", logger=getattr(bus, "logger", None))
+            return False
+        finally:
+            bus._rank = prev_rank
+            core.set_global(prev_global)
+    def install(self, bus, lazy: Optional[bool] = None) -> List[PluginSpec]:
+        """
+        有効な plugin を bus に登録する。
+        lazy=True（既定 / PYSI_PLUGIN_LAZY）: manifest に hooks がある plugin は hook の初回発火まで import しない。
+        """
+        if lazy is None:
+            lazy = os.getenv("PYSI_PLUGIN_LAZY", "1").lower() not in ("0", "false", "no")
+        if self.package in bus.installed_packages:
+            return self.discover()
+        bus.installed_packages.add(self.package)
+        for spec in self.discover():
+            if not spec.enabled:
+                continue
+            if lazy and spec.deferred:
+                bus.add_lazy(spec.hooks, lambda spec=spec: self.load(spec, bus))
+            else:
+                self.load(spec, bus)
+        return self.discover()
+_REGISTRIES: Dict[str, PluginRegistry] = {}
+def get_registry(package: str = "pysi.plugins") -> PluginRegistry:
+    reg = _REGISTRIES.get(package)
+    if reg is None:
+        reg = _REGISTRIES[package] = PluginRegistry(package)
+    return reg
@@ -0,0 +1,184 @@
+# pysi/core/profiler.py
+# パイプラインの段階別プロファイラ（--profile 用）
+#  - stage("name") で wall 時間 / CPU 時間 / peak RSS を記録（入れ子 OK、親子関係はスタックで持つ）
+#  - HookBus.enable_timing(True, profiler=prof) で hook 呼び出し・plugin callback ごとに stage を切る
+#  - instrument(env, ENV_PHASES) で WOMEnv の主要フェーズをインスタンス単位でラップ
+#  - report() → JSON（stage / plugin 集計 + Chrome trace の traceEvents）
+#    traceEvents は chrome://tracing / Perfetto / speedscope でそのまま flamegraph 表示できる
+#  - write_folded() → "a;b;c <usec>" 形式（flamegraph.pl / inferno 用）
+from __future__ import annotations
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+try:
+    import resource                     # Unix
+except ImportError:                     # Windows
+    resource = None
+# WOMEnv の計測対象フェーズ
+ENV_PHASES = (
+    "load_data_files",
+    "init_psi_spaces_and_demand",
+    "demand_planning4multi_product",
+    "demand_leveling4multi_prod",
+    "supply_planning4multi_product",
+    "update_evaluation_results4multi_product",
+)
+def peak_rss_mb() -> Optional[float]:
+    """プロセスの peak RSS（MB）。取れない環境では None"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux は KB、macOS は byte
+        return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+    try:
+        import psutil
+        mi = psutil.Process().memory_info()
+        return getattr(mi, "peak_wset", mi.rss) / (1024.0 * 1024.0)
+    except Exception:
+        return None
+class StageProfiler:
+    """
+    段階別の wall / CPU / peak RSS を集める。
+
+        prof = StageProfiler()
+        bus.enable_timing(True, profiler=prof)
+        with prof.stage("build"):
+            ...
+        prof.write_json("out/profile.json")
+
+    peak RSS はプロセス全体の最高水位なので、stage ごとには
+    終了時点の値（peak_rss_mb）と、その stage 中の上昇分（rss_growth_mb）を持つ。
+    """
+    def __init__(self, name: str = "wom", max_events: int = 200_000):
+        self.name = name
+        self.max_events = int(max_events)
+        self.events: List[Dict[str, Any]] = []
+        self.dropped_events = 0
+        # (cat, name) → [calls, wall, cpu, self_wall, peak_rss, rss_growth]
+        self.totals: Dict[Tuple[str, str], List[float]] = {}
+        # stack（";" 区切り）→ self 時間（folded 出力用）
+        self.folded: Dict[str, float] = {}
+        self._t0 = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+    def _stack(self) -> List[list]:
+        st = getattr(self._local, "stack", None)
+        if st is None:
+            st = self._local.stack = []
+        return st
+    @contextmanager
+    def stage(self, name: str, cat: str = "stage", **args: Any):
+        stack = self._stack()
+        frame = [name, 0.0]             # [name, 子 stage の wall 合計]
+        stack.append(frame)
+        rss0 = peak_rss_mb()
+        c0 = time.process_time()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - t0
+            cpu = time.process_time() - c0
+            rss1 = peak_rss_mb()
+            path = ";".join(f[0] for f in stack)
+            stack.pop()
+            if stack:
+                stack[-1][1] += wall
+            self._record(name, cat, path, t0, wall, cpu, wall - frame[1], rss0, rss1, args)
+    def _record(self, name, cat, path, t0, wall, cpu, self_wall, rss0, rss1, args) -> None:
+        growth = (rss1 - rss0) if (rss0 is not None and rss1 is not None) else None
+        with self._lock:
+            tot = self.totals.get((cat, name))
+            if tot is None:
+                tot = self.totals[(cat, name)] = [0, 0.0, 0.0, 0.0, 0.0, 0.0]
+            tot[0] += 1
+            tot[1] += wall
+            tot[2] += cpu
+            tot[3] += self_wall
+            if rss1 is not None:
+                tot[4] = max(tot[4], rss1)
+            if growth:
+                tot[5] += growth
+            self.folded[path] = self.folded.get(path, 0.0) + max(self_wall, 0.0)
+            if len(self.events) >= self.max_events:
+                self.dropped_events += 1
+                return
+            ev_args = {"cpu_ms": round(cpu * 1e3, 3)}
+            if rss1 is not None:
+                ev_args["peak_rss_mb"] = round(rss1, 1)
+                ev_args["rss_growth_mb"] = round(growth or 0.0, 1)
+            if args:
+                ev_args.update({k: str(v) for k, v in args.items()})
+            self.events.append({
+                "name": name, "cat": cat, "ph": "X",
+                "ts": round((t0 - self._t0) * 1e6, 1), "dur": round(wall * 1e6, 1),
+                "pid": os.getpid(), "tid": threading.get_ident(), "args": ev_args,
+            })
+    # -- wrapping ---------------------------------------------------------------
+    def wrap(self, fn: Callable, name: Optional[str] = None, cat: str = "stage") -> Callable:
+        label = name or getattr(fn, "__name__", "fn")
+        @functools.wraps(fn)
+        def _wrapped(*a, **kw):
+            with self.stage(label, cat=cat):
+                return fn(*a, **kw)
+        _wrapped.__wrapped_by_profiler__ = True
+        return _wrapped
+    def instrument(self, obj: Any, methods: Iterable[str] = ENV_PHASES, cat: str = "env") -> Any:
+        """obj のメソッドをインスタンス属性として上書きしてラップ（クラスは触らない）"""
+        for m in methods:
+            fn = getattr(obj, m, None)
+            if callable(fn) and not getattr(fn, "__wrapped_by_profiler__", False):
+                setattr(obj, m, self.wrap(fn, m, cat=cat))
+        return obj
+    # -- report -----------------------------------------------------------------
+    def _rows(self, cats: Optional[Iterable[str]] = None, exclude: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        rows = []
+        for (cat, name), (calls, wall, cpu, self_wall, peak, growth) in self.totals.items():
+            if cats is not None and cat not in cats:
+                continue
+            if cat in exclude:
+                continue
+            rows.append({
+                "cat": cat, "name": name, "calls": int(calls),
+                "wall_s": round(wall, 6), "cpu_s": round(cpu, 6), "self_wall_s": round(self_wall, 6),
+                "peak_rss_mb": round(peak, 1) if peak else None, "rss_growth_mb": round(growth, 1),
+            })
+        rows.sort(key=lambda r: r["wall_s"], reverse=True)
+        return rows
+    def report(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "elapsed_s": round(time.perf_counter() - self._t0, 6),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": self._rows(exclude=("hook", "plugin")),
+            "hooks": self._rows(cats=("hook",)),
+            "plugins": self._rows(cats=("plugin",)),
+            "dropped_events": self.dropped_events,
+            "displayTimeUnit": "ms",
+            "traceEvents": list(self.events),
+        }
+    def write_json(self, path: str) -> str:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=1)
+        return path
+    def write_folded(self, path: str) -> str:
+        """flamegraph.pl 形式（値はマイクロ秒の self 時間）"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, sec in sorted(self.folded.items()):
+                us = int(round(sec * 1e6))
+                if us > 0:
+                    f.write(f"{stack.replace(' ', '_')} {us}\n")
+        return path
+    def summary(self, top: int = 15) -> str:
+        lines = [f"[profile] {self.name}: {time.perf_counter() - self._t0:.3f}s"]
+        for r in self._rows()[:top]:
+            rss = f" rss+{r['rss_growth_mb']:.1f}MB" if r["rss_growth_mb"] else ""
+            lines.append(f"  {r['wall_s']:9.3f}s wall {r['cpu_s']:9.3f}s cpu  x{r['calls']:<6d}"
+                         f" {r['cat']}:{r['name']}{rss}")
+        return "\n".join(lines)
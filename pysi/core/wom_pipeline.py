@@ -33,14 +33,18 @@ from __future__ import annotations
 import argparse
 import importlib
 import logging
+import os
 import pkgutil
 import sys
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Optional
 
 import csv
+from contextlib import nullcontext
 
 # use project hook implementation if available
 from pysi.core.hooks.core import HookBus, set_global, autoload_plugins, hooks as global_hooks
+from pysi.core.hooks.core import call_register_if_present as _core_call_register
+from pysi.core.profiler import ENV_PHASES, StageProfiler
 
 logger = logging.getLogger(__name__)
 
@@ -57,34 +61,16 @@ except Exception as e:
     raise ImportError("Cannot import WOMEnv from pysi.wom_main; adjust import path.") from e
 
 
+class PipelineCancelled(Exception):
+    """progress callback が False を返した（cockpit で新しい再計画に置き換えられた等）"""
+
+
 def call_register_if_present(package: str, bus: HookBus) -> None:
     """
-    After importing plugin modules via autoload_plugins, call register(bus) on each module
-    if it defines it. This enforces the register(bus) convention.
+    Register the plugins of `package` on bus via pysi.core.plugin_registry
+    (manifest entry modules only, lazy per hook, at most once per bus).
     """
-    try:
-        pkg = importlib.import_module(package)
-    except Exception:
-        logger.exception("call_register_if_present: cannot import plugin package %s", package)
-        return
-
-    for m in pkgutil.iter_modules(pkg.__path__):
-        full = f"{package}.{m.name}"
-        try:
-            mod = importlib.import_module(full)
-        except Exception:
-            # if autoload_plugins already imported, failures here are logged by autoload_plugins;
-            # still try to continue to other modules.
-            logger.exception("Failed to import plugin module %s", full)
-            continue
-
-        reg = getattr(mod, "register", None)
-        if callable(reg):
-            try:
-                reg(bus)
-                logger.info("[plugins] called register(bus) on %s", full)
-            except Exception:
-                logger.exception("[plugins] register(bus) failed for %s", full)
+    _core_call_register(package, bus)
 
 
 class WOMIOAdapter:
@@ -96,6 +82,8 @@ class WOMIOAdapter:
         self.data_dir = data_dir
         self.product = product
         self._env: Optional[WOMEnv] = None
+        # profiler があれば、作った WOMEnv の主要フェーズ（ENV_PHASES）を計測する
+        self.profiler: Optional[StageProfiler] = None
 
 
 
@@ -125,6 +113,8 @@ class WOMIOAdapter:
                 pass
 
         env = WOMEnv(cfg)
+        if self.profiler is not None:
+            self.profiler.instrument(env, ENV_PHASES)
         # load CSVs / DBs etc.
         env.load_data_files()
         self._env = env
@@ -186,8 +176,17 @@ class WOMPipelineRunner:
     """
     The pipeline runner orchestrates the flow and exposes hook points for plugins.
     """
-    def __init__(self, bus: Optional[HookBus] = None, io_adapter: Optional[WOMIOAdapter] = None, plugin_package: str = "pysi.plugins"):
+    def __init__(self, bus: Optional[HookBus] = None, io_adapter: Optional[WOMIOAdapter] = None, plugin_package: str = "pysi.plugins",
+                 compact_psi: Optional[bool] = None, profiler: Optional[StageProfiler] = None):
         self.bus = bus or HookBus(logger=logging.getLogger("hooks"))
+        # profiler=StageProfiler(): build / 各 WOMEnv フェーズ / hook・plugin ごとの時間と peak RSS を記録
+        self.profiler = profiler
+        if profiler is not None:
+            self.bus.enable_timing(True, profiler=profiler)
+        # compact_psi=True: 計画後に全製品の PSI を圧縮ストア(lot handle + CSR)へ置換
+        if compact_psi is None:
+            compact_psi = os.getenv("PYSI_COMPACT_PSI", "0").lower() in ("1", "true", "yes")
+        self.compact_psi = bool(compact_psi)
         # set global hooks so decorator-based plugins also hook into this bus
         set_global(self.bus)
 
@@ -205,10 +204,34 @@ class WOMPipelineRunner:
             logger.exception("call_register_if_present failed; continuing")
 
         self.io = io_adapter or WOMIOAdapter()
+        self.io.profiler = profiler
         self.logger = logging.getLogger("wom_pipeline")
+        # run(progress=...) の callback（run 中だけ）
+        self._progress: Optional[Callable[[str], Any]] = None
+
+    def _stage(self, name: str):
+        return self.profiler.stage(name, cat="pipeline") if self.profiler is not None else nullcontext()
 
+    def _step(self, name: str) -> None:
+        # 段階の境目で進捗を知らせる。callback が False を返したらここで打ち切る
+        if self._progress is not None and self._progress(name) is False:
+            raise PipelineCancelled(name)
 
-    def run(self, data_dir: str, product: Optional[str] = None, scenario_id: str = "default") -> Dict[str, Any]:
+
+    def run(self, data_dir: str, product: Optional[str] = None, scenario_id: str = "default",
+            progress: Optional[Callable[[str], Any]] = None) -> Dict[str, Any]:
+        """
+        progress(stage_name) は各段階の前に呼ばれる（別 thread から run する cockpit の進捗表示用）。
+        False を返すと PipelineCancelled を送出して残りの段階を実行しない。
+        """
+        self._progress = progress
+        try:
+            with self._stage(f"run:{product or '*'}"):
+                return self._run(data_dir, product, scenario_id)
+        finally:
+            self._progress = None
+
+    def _run(self, data_dir: str, product: Optional[str] = None, scenario_id: str = "default") -> Dict[str, Any]:
         # prepare spec and allow plugins to modify it
         spec = {"data_dir": data_dir, "scenario_id": scenario_id, "product": product}
         spec = self.bus.apply_filters("pipeline:spec", spec)
@@ -217,7 +240,9 @@ class WOMPipelineRunner:
         self.logger.info("Building plan tree (data_dir=%s, product=%s)", spec.get("data_dir"), spec.get("product"))
         self.io.data_dir = spec.get("data_dir", self.io.data_dir)
         self.io.product = spec.get("product", self.io.product)
-        root = self.io.build_tree(spec)
+        self._step("build")
+        with self._stage("build"):
+            root = self.io.build_tree(spec)
 
         # after build hook
         self.bus.do_action("pipeline:after_build", root=root, env=getattr(self.io, "_env", None))
@@ -232,38 +257,54 @@ class WOMPipelineRunner:
 
         if env is None:
             raise RuntimeError("WOMEnv instance not available after build; cannot proceed")
+        if self.profiler is not None:
+            self.profiler.instrument(env, ENV_PHASES)    # 自前 adapter 以外で作られた env も計測（二重には包まない）
 
         # planning steps with hooks
         try:
             self.bus.do_action("pipeline:before_planning", env=env, root=root)
 
             if hasattr(env, "demand_planning4multi_product"):
+                self._step("demand_planning")
                 env.demand_planning4multi_product()
                 self.bus.do_action("pipeline:after_demand_planning", env=env, root=root)
             else:
                 self.logger.warning("env missing demand_planning4multi_product")
 
             if hasattr(env, "demand_leveling4multi_prod"):
+                self._step("demand_leveling")
                 env.demand_leveling4multi_prod()
                 self.bus.do_action("pipeline:after_demand_leveling", env=env, root=root)
             else:
                 self.logger.warning("env missing demand_leveling4multi_prod")
 
             if hasattr(env, "supply_planning4multi_product"):
+                self._step("supply_planning")
                 env.supply_planning4multi_product()
                 self.bus.do_action("pipeline:after_supply_planning", env=env, root=root)
             else:
                 self.logger.warning("env missing supply_planning4multi_product")
 
+            if self.compact_psi and hasattr(env, "compact_psi_all"):
+                with self._stage("compact_psi"):
+                    nbytes = env.compact_psi_all()
+                self.logger.info("PSI compacted: %.1f MB in arrays", nbytes / 1e6)
+
             # optional pre-collect
             self.bus.do_action("pipeline:before_collect", env=env, root=root)
+        except PipelineCancelled:
+            raise
         except Exception:
             logger.exception("Planning steps failed")
             raise
 
         # collect result and allow result filters (visualize/export etc.)
-        result = self.io.collect_result(root)
-        result = self.bus.apply_filters("pipeline:result", result)
+        self._step("collect")
+        with self._stage("collect"):
+            result = self.io.collect_result(root)
+        # exporter / visualizer は pipeline:result の filter として動く（profile では plugin ごとに出る）
+        with self._stage("result_filters"):
+            result = self.bus.apply_filters("pipeline:result", result)
         self.bus.do_action("pipeline:after_run", result=result)
 
         return result
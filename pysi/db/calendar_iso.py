@@ -2,7 +2,7 @@
 from __future__ import annotations
 import sqlite3
 from datetime import date
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Optional
 def _generate_calendar_rows(plan_year_st: int, plan_range: int) -> List[tuple]:
     """
     ISO週 (iso_year, iso_week) を連続列挙し、存在しない週はスキップ。
@@ -37,6 +37,7 @@ def rebuild_calendar_iso(conn: sqlite3.Connection, plan_year_st: int, plan_range
             """,
             rows,
         )
+    invalidate_weeks_cache(conn)
     return len(rows)
 def ensure_calendar_iso(conn: sqlite3.Connection, plan_year_st: int, plan_range: int) -> int:
     """
@@ -59,6 +60,26 @@ def load_week_index_map(conn: sqlite3.Connection) -> Dict[Tuple[int, str], int]:
 def weeks_count(conn: sqlite3.Connection) -> int:
     cur = conn.execute("SELECT COUNT(*) FROM calendar_iso;")
     return int(cur.fetchone()[0] or 0)
+# 接続ごとの週数キャッシュ: id(conn) -> (conn, weeks)
+# （conn 自体を保持するので id の再利用は起きない。古いものから捨てる）
+_WEEKS_CACHE: Dict[int, Tuple[sqlite3.Connection, int]] = {}
+_WEEKS_CACHE_MAX = 8
+def weeks_count_cached(conn: sqlite3.Connection) -> int:
+    """weeks_count の接続ごとキャッシュ版（rebuild_calendar_iso で無効化される）"""
+    ent = _WEEKS_CACHE.get(id(conn))
+    if ent is not None and ent[0] is conn:
+        return ent[1]
+    n = weeks_count(conn)
+    if len(_WEEKS_CACHE) >= _WEEKS_CACHE_MAX:
+        _WEEKS_CACHE.pop(next(iter(_WEEKS_CACHE)))
+    _WEEKS_CACHE[id(conn)] = (conn, n)
+    return n
+def invalidate_weeks_cache(conn: Optional[sqlite3.Connection] = None) -> None:
+    """calendar_iso を書き換えた後に呼ぶ（conn=None なら全接続分）"""
+    if conn is None:
+        _WEEKS_CACHE.clear()
+    else:
+        _WEEKS_CACHE.pop(id(conn), None)
 # おまけ：逆写像（week_index -> (iso_year, 'WW')）
 def load_index_to_iso_map(conn: sqlite3.Connection) -> List[Tuple[int, str]]:
     cur = conn.execute(
@@ -0,0 +1,182 @@
+# pysi/db/psi_bulk.py
+# PSI（lot 粒度）を SQLite にまとめて書くための writer
+#  - 行は列ごとの buffer に貯め、batch_rows ごとに executemany で流す
+#  - 全体を 1 transaction（BEGIN IMMEDIATE … COMMIT）で書く
+#  - lot_handles=True なら lot_id を整数 handle にして WITHOUT ROWID の psi_lot に保存
+#      psi_lot   : (node_name, product_name, iso_index, bucket, seq) → lot_handle
+#      lot_handle: lot_handle → lot_id
+#    psi（TEXT lot_id 行 + index）より table / index がかなり小さくなる
+from __future__ import annotations
+import sqlite3
+from itertools import repeat
+from typing import Dict, List, Optional
+PSI_BUCKETS = ("S", "CO", "I", "P")
+PSI_LOT_SCHEMA_SQL = r"""
+CREATE TABLE IF NOT EXISTS lot_handle(
+  lot_handle INTEGER PRIMARY KEY,
+  lot_id TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS psi_lot(
+  node_name TEXT NOT NULL,
+  product_name TEXT NOT NULL,
+  iso_index INTEGER NOT NULL,
+  bucket INTEGER NOT NULL,          -- 0:S, 1:CO, 2:I, 3:P
+  seq INTEGER NOT NULL,             -- バケツ内の lot 順
+  lot_handle INTEGER NOT NULL,
+  PRIMARY KEY(node_name, product_name, iso_index, bucket, seq)
+) WITHOUT ROWID;
+CREATE VIEW IF NOT EXISTS psi_lot_view AS
+  SELECT p.node_name, p.product_name, p.iso_index,
+         CASE p.bucket WHEN 0 THEN 'S' WHEN 1 THEN 'CO' WHEN 2 THEN 'I' ELSE 'P' END AS bucket,
+         p.seq, h.lot_id
+  FROM psi_lot p JOIN lot_handle h ON h.lot_handle = p.lot_handle;
+"""
+def apply_bulk_pragmas(con: sqlite3.Connection, cache_mb: int = 64) -> None:
+    """bulk 書き込み向けの session pragma（WAL / synchronous=NORMAL / 大きめの cache）"""
+    if not con.in_transaction:
+        # journal_mode / synchronous は transaction 中には切り替えられない
+        con.execute("PRAGMA journal_mode=WAL;")
+        con.execute("PRAGMA synchronous=NORMAL;")
+    con.execute(f"PRAGMA cache_size=-{int(cache_mb) * 1024};")  # 負値は KiB 指定
+    con.execute("PRAGMA temp_store=MEMORY;")
+def ensure_psi_lot_schema(con: sqlite3.Connection) -> None:
+    # executescript は暗黙に COMMIT するので、呼び出し側の transaction を切らないよう 1 文ずつ
+    for stmt in PSI_LOT_SCHEMA_SQL.split(";"):
+        if stmt.strip():
+            con.execute(stmt)
+class PSIBulkWriter:
+    """
+    node.psi4demand / psi4supply を psi（または psi_lot）へまとめて保存する。
+
+        with PSIBulkWriter(con) as w:
+            for n in nodes:
+                w.add_node(n, product_name)
+
+    (node, product) ごとに既存行を消してから入れ直す（persist_node_psi と同じ意味）。
+    with を抜けると commit、例外なら rollback（writer が始めた transaction の場合）。
+    """
+    def __init__(self, con: sqlite3.Connection, source: str = "demand",
+                 lot_handles: bool = False, batch_rows: int = 100_000,
+                 pragmas: bool = True):
+        assert source in ("demand", "supply")
+        self.con = con
+        self.attr = "psi4demand" if source == "demand" else "psi4supply"
+        self.lot_handles = lot_handles
+        self.batch_rows = int(batch_rows)
+        self.rows_written = 0
+        self._own_tx = False
+        self._pending_keys: set = set()
+        self._deletes: List[tuple] = []
+        self._reset_buffers()
+        self._handles: Optional[Dict[str, int]] = None
+        self._next_handle = 1
+        if pragmas:
+            apply_bulk_pragmas(con)
+        if lot_handles:
+            ensure_psi_lot_schema(con)
+    # -- transaction ------------------------------------------------------------
+    def __enter__(self) -> "PSIBulkWriter":
+        if not self.con.in_transaction:
+            self.con.execute("BEGIN IMMEDIATE")
+            self._own_tx = True
+        return self
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.flush()
+            if self._own_tx:
+                self.con.commit()
+        elif self._own_tx:
+            self.con.rollback()
+        self._own_tx = False
+    # -- buffering --------------------------------------------------------------
+    def _reset_buffers(self) -> None:
+        self._node: List[str] = []
+        self._prod: List[str] = []
+        self._iso: List[int] = []
+        self._bucket: List[object] = []
+        self._seq: List[int] = []
+        self._lot: List[str] = []
+    def add_node(self, node, product_name: str) -> int:
+        """node 1 つ分の PSI を buffer に積む。戻り値は積んだ行数。"""
+        key = (node.name, product_name)
+        if key in self._pending_keys:
+            # 同じ batch 内で同じ (node, product) を入れ直す → 先に書いてから delete
+            self.flush()
+        self._pending_keys.add(key)
+        self._deletes.append(key)
+        data = getattr(node, self.attr, None) or []
+        iso, bucket, seq, lots = self._iso, self._bucket, self._seq, self._lot
+        labels = range(4) if self.lot_handles else PSI_BUCKETS
+        added = 0
+        for w, week in enumerate(data):
+            for b, label in zip(range(4), labels):
+                bl = week[b]
+                if not bl:
+                    continue
+                k = len(bl)
+                iso.extend(repeat(w, k))
+                bucket.extend(repeat(label, k))
+                if self.lot_handles:
+                    seq.extend(range(k))
+                lots.extend(bl)
+                added += k
+        self._node.extend(repeat(node.name, added))
+        self._prod.extend(repeat(product_name, added))
+        if len(self._lot) >= self.batch_rows:
+            self.flush()
+        return added
+    # -- write ------------------------------------------------------------------
+    def _load_handles(self) -> None:
+        self._handles = {}
+        for h, lot_id in self.con.execute("SELECT lot_handle, lot_id FROM lot_handle"):
+            self._handles[lot_id] = h
+        self._next_handle = max(self._handles.values(), default=0) + 1
+    def _lot_handles(self, lots: List[str]) -> List[int]:
+        if self._handles is None:
+            self._load_handles()
+        handles = self._handles
+        new_rows = []
+        out = []
+        for lot in lots:
+            h = handles.get(lot)
+            if h is None:
+                h = handles[lot] = self._next_handle
+                self._next_handle += 1
+                new_rows.append((h, lot))
+            out.append(h)
+        if new_rows:
+            self.con.executemany("INSERT INTO lot_handle(lot_handle, lot_id) VALUES (?,?)", new_rows)
+        return out
+    def flush(self) -> None:
+        """buffer の delete / insert を executemany で流す（commit はしない）"""
+        con = self.con
+        if self._deletes:
+            table = "psi_lot" if self.lot_handles else "psi"
+            con.executemany(f"DELETE FROM {table} WHERE node_name=? AND product_name=?", self._deletes)
+            self._deletes = []
+        if self._lot:
+            if self.lot_handles:
+                con.executemany(
+                    "INSERT INTO psi_lot(node_name,product_name,iso_index,bucket,seq,lot_handle) VALUES (?,?,?,?,?,?)",
+                    zip(self._node, self._prod, self._iso, self._bucket, self._seq,
+                        self._lot_handles(self._lot)))
+            else:
+                con.executemany(
+                    "INSERT INTO psi(node_name,product_name,iso_index,bucket,lot_id) VALUES (?,?,?,?,?)",
+                    zip(self._node, self._prod, self._iso, self._bucket, self._lot))
+            self.rows_written += len(self._lot)
+        self._reset_buffers()
+        self._pending_keys.clear()
+def load_node_psi_lots(con: sqlite3.Connection, node_name: str, product_name: str, weeks_count: int):
+    """psi_lot（lot handle 形式）から [[S, CO, I, P], ...] を復元する"""
+    p = [[[], [], [], []] for _ in range(weeks_count)]
+    cur = con.execute("""
+      SELECT p.iso_index, p.bucket, h.lot_id
+      FROM psi_lot p JOIN lot_handle h ON h.lot_handle = p.lot_handle
+      WHERE p.node_name=? AND p.product_name=?
+      ORDER BY p.iso_index, p.bucket, p.seq
+    """, (node_name, product_name))
+    for i, b, lot_id in cur:
+        if 0 <= i < weeks_count and 0 <= b < 4:
+            p[i][b].append(lot_id)
+    return p
@@ -116,3 +116,17 @@ CREATE TABLE IF NOT EXISTS lot_bucket (
 );
 CREATE INDEX IF NOT EXISTS idx_lot_bucket_qry
   ON lot_bucket (scenario_id, layer, node_id, product_id, week_index, bucket);
+
+-- lot_bucket の週ごと fingerprint（差分書き戻し用。psi_io_adapters が管理）
+CREATE TABLE IF NOT EXISTS lot_bucket_fp (
+  scenario_id INTEGER NOT NULL,
+  layer       TEXT NOT NULL CHECK(layer IN ('demand','supply')),
+  node_id     INTEGER NOT NULL,
+  product_id  INTEGER NOT NULL,
+  week_index  INTEGER NOT NULL,
+  fp          INTEGER NOT NULL,
+  PRIMARY KEY (scenario_id, layer, node_id, product_id, week_index),
+  FOREIGN KEY (scenario_id) REFERENCES scenario(id) ON DELETE CASCADE,
+  FOREIGN KEY (node_id) REFERENCES node(id) ON DELETE CASCADE,
+  FOREIGN KEY (product_id) REFERENCES product(id) ON DELETE CASCADE
+) WITHOUT ROWID;
@@ -4,6 +4,7 @@ import sqlite3
 import json
 from contextlib import contextmanager
 from typing import Iterable, Optional
+from pysi.db.psi_bulk import PSIBulkWriter
 # ---------------------------------
 # 基本接続
 # ---------------------------------
@@ -171,27 +172,12 @@ def persist_node_psi(con: sqlite3.Connection, node, product_name: str, source: s
     """
     node.psi4demand / node.psi4supply を psi テーブルへ保存。
     source: "demand" or "supply"
+    該当ノード・製品の PSI を全消し→executemany で挿入（commit は呼び出し側）。
+    木全体を保存するときは PSIBulkWriter（pysi.db.psi_bulk）で 1 transaction にまとめる。
     """
-    assert source in ("demand", "supply")
-    data = node.psi4demand if source == "demand" else node.psi4supply
-    weeks = len(data)
-    # 一旦該当ノード・製品の PSI 全消し→挿入（最小実装）
-    con.execute("DELETE FROM psi WHERE node_name=? AND product_name=?", (node.name, product_name))
-    cur = con.cursor()
-    for w in range(weeks):
-        S, CO, I, P = data[w]
-        for lot in S:
-            cur.execute("INSERT INTO psi(node_name,product_name,iso_index,bucket,lot_id) VALUES (?,?,?,?,?)",
-                        (node.name, product_name, w, "S", lot))
-        for lot in CO:
-            cur.execute("INSERT INTO psi(node_name,product_name,iso_index,bucket,lot_id) VALUES (?,?,?,?,?)",
-                        (node.name, product_name, w, "CO", lot))
-        for lot in I:
-            cur.execute("INSERT INTO psi(node_name,product_name,iso_index,bucket,lot_id) VALUES (?,?,?,?,?)",
-                        (node.name, product_name, w, "I", lot))
-        for lot in P:
-            cur.execute("INSERT INTO psi(node_name,product_name,iso_index,bucket,lot_id) VALUES (?,?,?,?,?)",
-                        (node.name, product_name, w, "P", lot))
+    w = PSIBulkWriter(con, source=source, pragmas=False)
+    w.add_node(node, product_name)
+    w.flush()
 def load_node_psi(con: sqlite3.Connection, node_name: str, product_name: str, weeks_count: int):
     p = [[[],[],[],[]] for _ in range(weeks_count)]
     idx = {"S":0, "CO":1, "I":2, "P":3}
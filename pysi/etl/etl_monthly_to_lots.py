@@ -16,6 +16,7 @@ from pathlib import Path
 from typing import Callable, Dict, Tuple
 import numpy as np
 import pandas as pd
+from pysi.plan.demand_generate import monthly_to_weekly_values, resolve_lot_sizes, lot_id_lists
 # -------------------------
 # 共有仕様（lot_id 形式など）
 # -------------------------
@@ -176,66 +177,25 @@ def monthly_to_weekly_with_lots(
     lot_size_lookup: Callable[[str, str], int]
 ) -> Tuple[pd.DataFrame, PlanBounds]:
     """
-    - 月次を縦持ち→日次→ISO週集計
+    - 月次→ISO週集計（month_week_weight_matrix による一括集計）
     - S_lot = ceil(value / lot_size_lookup(prod,node))
     - lot_id を NODE-PROD-YYYYWWNNNN で生成（週単位で 0001 リセット）
     戻り: df_weekly（iso_year, iso_week, value, S_lot, lot_id_list）, PlanBounds
     """
     bounds = compute_plan_bounds(df_monthly)
-    # 縦持ち
-    melt = df_monthly.melt(
-        id_vars=["product_name", "node_name", "year"],
-        var_name="month", value_name="value"
-    )
-    melt["month"] = melt["month"].str[1:].astype(int)
-    # 月→日→ISO週
-    frames = []
-    for _, r in melt.iterrows():
-        y, m, v = int(r["year"]), int(r["month"]), float(r["value"])
-        if v == 0:
-            continue
-        days = pd.Timestamp(y, m, 1).days_in_month
-        dates = pd.date_range(f"{y}-{m:02d}-01", periods=days, freq="D")
-        frames.append(pd.DataFrame({
-            "product_name": r["product_name"],
-            "node_name":    r["node_name"],
-            "date":         dates,
-            "value":        v
-        }))
-    if frames:
-        daily = pd.concat(frames, ignore_index=True)
-    else:
-        daily = pd.DataFrame(columns=["product_name","node_name","date","value"])
-    if daily.empty:
+    # 月→ISO週（日数重み行列で一括集計。日次には展開しない）
+    weekly = monthly_to_weekly_values(df_monthly)
+    if weekly.empty:
         cols = ["product_name","node_name","iso_year","iso_week","value","S_lot","lot_id_list"]
         return pd.DataFrame(columns=cols), bounds
-    iso = daily["date"].dt.isocalendar()
-    daily["iso_year"] = iso.year.astype(int)
-    daily["iso_week"] = iso.week.astype(int)
-    weekly = (
-        daily.groupby(["product_name","node_name","iso_year","iso_week"], as_index=False)["value"]
-        .sum()
-    )
     # lot_size と S_lot
-    def _row_lot_size(row):
-        try:
-            return max(1, int(lot_size_lookup(row["product_name"], row["node_name"])))
-        except Exception:
-            return 1
-    weekly["lot_size"] = weekly.apply(_row_lot_size, axis=1)
-    weekly["S_lot"]    = (weekly["value"] / weekly["lot_size"]).apply(np.ceil).astype(int)
+    weekly["lot_size"] = resolve_lot_sizes(weekly, lot_size_lookup)
+    weekly["S_lot"]    = np.ceil(weekly["value"].to_numpy() / weekly["lot_size"].to_numpy()).astype(int)
     # lot_id 生成（週単位 0001 リセット）
-    def _mk_lots(row):
-        y   = int(row["iso_year"])
-        w   = int(row["iso_week"])
-        nn  = _sanitize_token(row["node_name"])
-        pn  = _sanitize_token(row["product_name"])
-        cnt = int(row["S_lot"])
-        if cnt <= 0:
-            return []
-        base = f"{nn}{LOT_SEP}{pn}{LOT_SEP}{y}{w:02d}"
-        return [f"{base}{i:04d}" for i in range(1, cnt+1)]
-    weekly["lot_id_list"] = weekly.apply(_mk_lots, axis=1)
+    weekly["lot_id_list"] = lot_id_lists(
+        weekly["product_name"], weekly["node_name"],
+        weekly["iso_year"], weekly["iso_week"], weekly["S_lot"],
+    )
     return weekly, bounds
 # -------------------------
 # DB 書き込み（冪等）
@@ -0,0 +1,152 @@
+# pysi/evaluate/cashflow.py
+# -*- coding: utf-8 -*-
+# キャッシュフロー計算（cockpit の Cashflow パネル / app.py の Cash Out&In&Net 用）
+#  - 入力: (node, week, {S,CO,I,P}) の lot 数テンソル + ノードごとの単価 (N, 4) と AR / AP の週シフト (N,)
+#  - 出力: (node, row, week) の金額テンソル。row は従来の CSV と同じ並び 0, IN, 1, 2, 3, OUT, NET
+#      0..3 : lot 数 × 単価（0:S=売価, 1:CO / 2:I=仕入総原価, 3:P=直接材料費）
+#      IN / OUT : S / P の金額（シフトなし。従来どおり）
+#      NET : S を AR 分、P を AP 分だけ右シフトした差（cockpit はゼロ埋め、app.py は np.roll の循環）
+#  - 木の走査は 1 回（前順：親 → 子の順、Level / Position も従来どおり）、週方向は配列演算だけ
+#  - CashflowResult: ノード名で行を引ける。series / kpis は NumPy、to_wide() は従来の横持ち DataFrame、
+#    to_long() は (node_name, Level, Position, PSI_attribute, Week, Cash Flow) の縦持ち
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pandas as pd
+from pysi.network.psi_metrics import psi_count_matrix
+ROW_ATTRS = (0, "IN", 1, 2, 3, "OUT", "NET")
+_ROW = {a: i for i, a in enumerate(ROW_ATTRS)}
+_PRICE_ATTRS = ("cs_price_sales_shipped", "cs_purchase_total_cost", "cs_purchase_total_cost", "cs_direct_materials_costs")
+def shift_weeks(values: np.ndarray, shifts: np.ndarray, circular: bool = False) -> np.ndarray:
+    """(N, W) の各行を shifts[i] 週だけ右にずらす（circular=False: 先頭を 0 埋め / True: np.roll と同じ）"""
+    N, W = values.shape
+    shifts = np.asarray(shifts, dtype=np.int64)
+    if not circular:
+        shifts = np.maximum(shifts, 0)          # 負のリードタイムはシフトなし（shift_right と同じ）
+    if W == 0 or not np.any(shifts):
+        return values.copy()
+    src = np.arange(W)[None, :] - shifts[:, None]
+    if circular:
+        return np.take_along_axis(values, src % W, axis=1)
+    out = np.take_along_axis(values, np.clip(src, 0, W - 1), axis=1)
+    out[src < 0] = 0.0
+    return out
+def cashflow_tensor(counts: np.ndarray, price: np.ndarray, ar_shift: np.ndarray, ap_shift: np.ndarray,
+                    circular: bool = False) -> np.ndarray:
+    """counts (N, W, 4), price (N, 4), ar_shift / ap_shift (N,) → (N, 7, W)（行は ROW_ATTRS 順）"""
+    N, W = counts.shape[0], counts.shape[1]
+    amt = counts.transpose(0, 2, 1) * np.asarray(price, dtype=float)[:, :, None]     # (N, 4, W)
+    out = np.empty((N, len(ROW_ATTRS), W), dtype=float)
+    out[:, _ROW[0]] = amt[:, 0]
+    out[:, _ROW["IN"]] = amt[:, 0]
+    out[:, _ROW[1]] = amt[:, 1]
+    out[:, _ROW[2]] = amt[:, 2]
+    out[:, _ROW[3]] = amt[:, 3]
+    out[:, _ROW["OUT"]] = amt[:, 3]
+    out[:, _ROW["NET"]] = shift_weeks(amt[:, 0], ar_shift, circular) - shift_weeks(amt[:, 3], ap_shift, circular)
+    return out
+class CashflowResult:
+    """
+    ノード × 行(ROW_ATTRS) × 週 の金額。
+
+        cf = build_cashflow(root_outbound, output_period=53 * plan_range)
+        net = cf.series("NET", node_name="MOM_A")
+        cf.kpis()                   # {"net_cash_min", "net_cash_sum", "cum_net_cash_min"}
+        cf.to_wide().to_csv(...)    # 従来の CashFlow_AR_AP_shift.csv と同じ列
+    """
+    def __init__(self, names: List[str], level: np.ndarray, position: np.ndarray, prices: List[list],
+                 values: np.ndarray):
+        self.names = names
+        self.level = level
+        self.position = position
+        self.prices = prices            # ノードごとの [S, CO, I, P] 単価（元の値のまま。CSV の Price 列用）
+        self.values = values            # (N, 7, W)
+        self.index: Dict[str, np.ndarray] = {}
+        if names:
+            codes, uniq = pd.factorize(pd.Series(names, dtype=object))
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(uniq) + 1))
+            for k, name in enumerate(uniq):
+                self.index[name] = order[bounds[k]:bounds[k + 1]]
+    @property
+    def weeks(self) -> int:
+        return int(self.values.shape[2])
+    def rows(self, node_name: Optional[str] = None) -> np.ndarray:
+        """node_name のノード行（同名ノードはすべて）。None なら全ノード"""
+        if node_name is None:
+            return self.values
+        idx = self.index.get(node_name)
+        return self.values[idx] if idx is not None else self.values[:0]
+    def series(self, attr, node_name: Optional[str] = None) -> np.ndarray:
+        """attr 行の週系列（ノード合計）"""
+        return self.rows(node_name)[:, _ROW[attr], :].sum(axis=0)
+    def kpis(self, node_name: Optional[str] = None) -> Dict[str, float]:
+        v = self.rows(node_name)
+        if v.shape[0] == 0 or self.weeks == 0:
+            return {"net_cash_min": 0.0, "net_cash_sum": 0.0, "cum_net_cash_min": 0.0}
+        net = v[:, _ROW["NET"], :].sum(axis=0)
+        return {"net_cash_min": float(net.min()), "net_cash_sum": float(net.sum()),
+                "cum_net_cash_min": float(net.cumsum().min())}
+    def to_wide(self, net_price: str = "zero") -> pd.DataFrame:
+        """
+        従来の横持ち DataFrame（node_name, Level, Position, Price, PSI_attribute, w1..wN）。
+        net_price: NET 行の Price 列。"zero"（cockpit）/ "P"（app.py: 直前の P 単価）
+        """
+        N, R, W = self.values.shape
+        price_col: List[Any] = []
+        for p in self.prices:
+            net = p[3] if net_price == "P" else 0
+            price_col.extend((p[0], p[0], p[1], p[2], p[3], p[3], net))
+        head = pd.DataFrame({
+            "node_name": np.repeat(np.array(self.names, dtype=object), R),
+            "Level": np.repeat(self.level, R),
+            "Position": np.repeat(self.position, R),
+            "Price": pd.Series(price_col, dtype=object).infer_objects(),
+            "PSI_attribute": pd.Series(list(ROW_ATTRS) * N, dtype=object),
+        })
+        body = pd.DataFrame(self.values.reshape(N * R, W), columns=[f"w{i + 1}" for i in range(W)])
+        return pd.concat([head, body], axis=1)
+    def to_long(self) -> pd.DataFrame:
+        """縦持ち（node_name, Level, Position, PSI_attribute, Week, Cash Flow）。PSI_attribute は文字列"""
+        N, R, W = self.values.shape
+        rep = R * W
+        return pd.DataFrame({
+            "node_name": np.repeat(np.array(self.names, dtype=object), rep),
+            "Level": np.repeat(self.level, rep),
+            "Position": np.repeat(self.position, rep),
+            "PSI_attribute": pd.Series(np.tile(np.repeat(np.array([str(a) for a in ROW_ATTRS], dtype=object), W), N),
+                                       dtype=object),
+            "Week": np.tile(np.arange(1, W + 1), N * R),
+            "Cash Flow": self.values.reshape(-1),
+        })
+def _preorder(root):
+    """(node, level, position) を前順で（従来の再帰 collect と同じ順）"""
+    stack = [(root, 0, 1)]
+    while stack:
+        node, level, pos = stack.pop()
+        yield node, level, pos
+        ch = getattr(node, "children", []) or []
+        for i in range(len(ch) - 1, -1, -1):
+            stack.append((ch[i], level + 1, i + 1))
+def build_cashflow(root, output_period: int, circular: bool = False, layer: str = "psi4supply") -> CashflowResult:
+    """root 以下の全ノードのキャッシュフロー。output_period 週に満たない PSI は 0 埋め"""
+    names: List[str] = []
+    level: List[int] = []
+    position: List[int] = []
+    prices: List[list] = []
+    shifts: List[tuple] = []
+    mats: List[np.ndarray] = []
+    for node, lv, pos in _preorder(root):
+        names.append(getattr(node, "name", ""))
+        level.append(lv)
+        position.append(pos)
+        prices.append([getattr(node, a, 0) or 0 for a in _PRICE_ATTRS])
+        shifts.append((int((getattr(node, "AR_lead_time", 0) or 0) // 7),
+                       int((getattr(node, "AP_lead_time", 0) or 0) // 7)))
+        mats.append(psi_count_matrix(getattr(node, layer, None), output_period))
+    N = len(names)
+    counts = np.stack(mats) if mats else np.zeros((0, output_period, 4), dtype=np.int64)
+    sh = np.array(shifts, dtype=np.int64).reshape(N, 2)
+    price = np.array(prices, dtype=float).reshape(N, 4)
+    values = cashflow_tensor(counts, price, sh[:, 0], sh[:, 1], circular=circular)
+    return CashflowResult(names, np.array(level, dtype=np.int64), np.array(position, dtype=np.int64), prices, values)
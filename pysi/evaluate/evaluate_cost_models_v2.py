@@ -4,8 +4,6 @@
 # --------------------------------------------
 import csv
 import os
-import tkinter as tk
-from tkinter import filedialog, messagebox
 # --------------------------------------------
 # Utils
 # --------------------------------------------
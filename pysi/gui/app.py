@@ -68,11 +68,14 @@ from pysi.utils.file_io import *
 from pysi.utils.calendar445 import Calendar445
 from pysi.plan.demand_generate import convert_monthly_to_weekly
 from pysi.plan.operations import *
+from pysi.plan.lot_routing import feedback_psi_lists_routed
 # "plan.demand_processing" is merged in "plan.operations"
 #from plan.demand_processing import *
 #from pysi.plan.demand_processing import set_df_Slots2psi4demand
 from pysi.network.node_base import Node, PlanNode, GUINode
+from pysi.evaluate.cashflow import build_cashflow
 from pysi.network.tree import *
+from pysi.network.psi_snapshot import PSISnapshot
 #from network.tree import create_tree_set_attribute
 #from network.tree import set_node_costs
 #from network.tree import calc_all_psi2i4demand, set_lot_counts
@@ -718,71 +721,11 @@ def extract_node_name(stringA):
 # main function is this: place_P_in_supply_LT(w, ship2node, lot)
 def feedback_psi_lists(node, nodes):
 #def feedback_psi_lists(node, node_psi_dict, nodes):
-    # キーが存在する場合は対応する値valueが返り、存在しない場合はNoneが返る。
-    if node.children == []:  # 子nodeがないleaf nodeの場合
-        pass
-    else:
-        # ************************************
-        # clearing children P[w][3] and S[w][0]
-        # ************************************
-        # replace lotするために、事前に、
-        # 出荷先となるすべてのchildren nodesのS[w][0]とP[w][3]をクリア
-        for child in node.children:
-            for w in range(53 * node.plan_range):
-                child.psi4supply[w][0] = []
-                child.psi4supply[w][3] = []
-        # lotidから、leaf_nodeを特定し、出荷先ship2nodeに出荷することは、
-        # すべての子nodeに出荷することになる
-        # ************************************
-        # setting mother_confirmed_S
-        # ************************************
-        # このnode内での子nodeへの展開
-        for w in range(53 * node.plan_range):
-            #@STOP
-            #print("node.psi4supply", node.psi4supply)
-            confirmed_S_lots = node.psi4supply[w][0]  # 親の確定出荷confS lot
-            print("confirmed_S_lots", confirmed_S_lots)
-            # 出荷先nodeを特定して
-            # 一般には、下記のLT shiftだが・・・・・
-            # 出荷先の ETA = LT_shift(ETD) でP place_lot
-            # 工程中の ETA = SS_shift(ETD) でS place_lot
-            # 本モデルでは、輸送工程 = modal_nodeを想定して・・・・・
-            # 出荷先の ETA = 出荷元ETD        でP place_lot
-            # 工程中の ETA = LT&SS_shift(ETD) でS place_lot
-            # というイビツなモデル定義・・・・・
-            # 直感的なPO=INVOICEという考え方に戻すべきかも・・・・・
-            #
-            # modal shiftのmodelingをLT_shiftとの拡張で考える???
-            # modal = BOAT/AIR/QURIE
-            # LT_shift(modal, w, ,,,,
-            for lot in confirmed_S_lots:
-                if lot == []:
-                    pass
-                else:
-                    # *********************************************************
-                    # child#ship2node = find_node_to_ship(node, lot)
-                    # lotidからleaf_nodeのpointerを返す
-                    print("lot_ID", lot)
-                    leaf_node_name = extract_node_name(lot)
-                    print("lot_ID leaf_node_name", lot, leaf_node_name )
-                    leaf_node = nodes[leaf_node_name]
-                    # 末端からあるnodeAまでleaf_nodeまでのnode_listをpathで返す
-                    current_path = []
-                    path = []
-                    path = find_path_to_leaf_with_parent(node, leaf_node, current_path)
-                    # nodes_listを逆にひっくり返す
-                    path.reverse()
-                    # 出荷先nodeはnodeAの次node、path[1]になる
-                    ship2node_name = path[1]
-                    ship2node = nodes[ship2node_name]
-                    # ここでsupply planを更新している
-                    # lot: 親nodeの確定出荷confirmed_S lotsを
-                    # ship2node: 子nodeの出荷先を(lot_IDから)特定してある
-                    # 出荷先node psiのPとSに、confirmed_SのlotsをLT shiftで置く
-                    place_P_in_supply_LT(w, ship2node, lot)
-    for child in node.children:
-        feedback_psi_lists(child, nodes)
-        #feedback_psi_lists(child, node_psi_dict, nodes)
+    # lot_idのleaf_nodeから出荷先ship2node(=nodeの次node)を引く表を木ごとに1回だけ作り、
+    # (w, ship2node)単位でconfirmed_S lotsをまとめてLT shiftで置く
+    # （旧: lotごとに find_path_to_leaf_with_parent → path[1] → place_P_in_supply_LT）
+    feedback_psi_lists_routed(node, nodes, extract_leaf=extract_node_name)
+
 def copy_P_demand2supply(node): # TOBE 240926
 #def update_child_PS(node): # TOBE 240926
     # 明示的に.copyする。
@@ -1490,6 +1433,7 @@ class PSIPlannerApp:
 
         # supply_plan / decoupling / buffer stock
         self.decouple_node_dic = {}
+        self.psi_snapshot = None  # PSISnapshot（demand leveling 後の PSI 初期状態）
         self.decouple_node_selected = []
 
         # === ここを追加 ===
@@ -2187,6 +2131,9 @@ class PSIPlannerApp:
         self.nodes_prod_inbound  = {n.name: n for n in self._walk_nodes(r_in)} if r_in else {}
         self.nodes_outbound      = {n.name: n for n in self._walk_nodes(r_ot)} if r_ot else {}
         self.nodes_inbound       = {n.name: n for n in self._walk_nodes(r_in)} if r_in else {}
+        # psi_state から読んだ場合、未付与の product の PSI をここで付与
+        if selected and getattr(self, "psi_state", None) is not None:
+            self.psi_state.ensure_psi_attached(selected, logger=getattr(self, "logger", None))
         # 描画
         # ← これだけでOK（現在の view_mode に合わせて片方だけ描画、右のPSIも揃う）
         self._redraw_current_view(selected)
@@ -6086,7 +6033,11 @@ class PSIPlannerApp:
 
         logger = getattr(self, "logger", None)
 
-        state = load_psi_state(base_dir, attach_psi=True, logger=logger)
+        # PSI は表示する product の分だけ付与する（他は選択時に lazy attach）
+        state = load_psi_state(base_dir, attach_psi=False, logger=logger)
+        if state.product_name_list:
+            state.ensure_psi_attached(state.product_name_list[0], logger=logger)
+        self.psi_state = state
         plan_env = PsiStatePlanEnv(state)
 
         # 1) GUI 内の product tree を差し替え
@@ -6904,171 +6855,13 @@ class PSIPlannerApp:
         print("Save to", save_path)
         # 出力期間の計算
         output_period_outbound = 53 * self.root_node_outbound.plan_range
-        # データの収集
-        data = []
-        def collect_data(node, output_period):
-            for attr in range(4):  # 0:"Sales", 1:"CarryOver", 2:"Inventory", 3:"Purchase"
-                if attr == 0:
-                    price = node.cs_price_sales_shipped
-                elif attr == 1:
-                    price = node.cs_purchase_total_cost
-                elif attr == 2:
-                    price = node.cs_purchase_total_cost
-                elif attr == 3:
-                    price = node.cs_direct_materials_costs
-                else:
-                    price = 0  # 予期しない値の場合
-                row = [node.name, price, attr]
-                for week_no in range(output_period):
-                    count = len(node.psi4supply[week_no][attr])
-                    row.append(count)
-                data.append(row)
-            for child in node.children:
-                collect_data(child, output_period)
-        # ヘッダーの設定
-        headers_outbound = ["node_name", "Price", "PSI_attribute"] + [f"w{i+1}" for i in range(output_period_outbound)]
-        # root_node_outbound のツリー構造を走査してデータを収集
-        collect_data(self.root_node_outbound, output_period_outbound)
-        # DataFrame を作成して CSV に保存
-        df_outbound = pd.DataFrame(data, columns=headers_outbound)
-        df_outbound.to_csv(save_path, index=False)
-        # 完了メッセージを表示
-        messagebox.showinfo("CSV Export", f"PSI and Price for CashFlow data has been exported to {save_path}")
-    #9. Ensure Data Accuracy
-    #Before displaying the chart:
-    #
-    #Verify that eval_cs_price_sales_shipped and eval_cs_profit are up-to-date.
-    #If necessary, call a method like update_evaluation_results() to refresh the data prior to collection.
-    #For example:
-    #    self.update_evaluation_results()  # Ensure data is current
-    #    performance_data = self.collect_performance_data()
-    # This recursive function:
-    # Traverses the supply chain tree starting from the root node (root_node_outbound).
-    # Stores each node’s revenue and profit in a dictionary, keyed by node name.
-    def collect_performance_data(self):
-        performance_data = {}
-        def traverse(node):
-            performance_data[node.name] = {
-                'revenue': node.eval_cs_price_sales_shipped,
-                'profit': node.eval_cs_profit
-            }
-            for child in node.children:
-                traverse(child)
-        traverse(self.root_node_outbound)
-        return performance_data
-    # Extracts node names, revenues, and profits from the collected data.
-    # Plots two bars per node (revenue in blue, profit in green).
-    # Adds labels, a title, and a legend for clarity.
-    #import matplotlib.pyplot as plt
-    #import tkinter as tk
-    #from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-    def show_revenue_profit(self):
-        # Collect data
-        performance_data = self.collect_performance_data()
-        nodes = list(performance_data.keys())
-        revenues = [data['revenue'] for data in performance_data.values()]
-        profits = [data['profit'] for data in performance_data.values()]
-        total_costs = [revenue - profit for revenue, profit in zip(revenues, profits)]
-        profit_ratios = [round((profit / revenue) * 100, 2) if revenue != 0 else 0 for profit, revenue in zip(profits, revenues)]
-        # Create bar chart
-        fig, ax = plt.subplots(figsize=(6, 9))  # グラフサイズ調整
-        bar_width = 0.35
-        index = range(len(nodes))
-        # Plot stacked bars
-        bars1 = ax.bar(index, total_costs, bar_width, label='Total Cost', color='red', alpha=0.8)
-        bars2 = ax.bar(index, profits, bar_width, bottom=total_costs, label='Profit', color='green', alpha=0.8)
-        # Add value labels on top of bars (adjusting position)
-        for idx, (bar1, bar2) in enumerate(zip(bars1, bars2)):
-            height = bar1.get_height() + bar2.get_height()
-            formatted_revenue = f'{int(round(revenues[idx])):,}'
-            formatted_profit_ratio = f'{profit_ratios[idx]:.2f}%'
-            # **数値ラベルの配置調整**
-            ax.text(bar1.get_x() + bar1.get_width() / 2.0,
-                    height + 300,  # 上にずらす
-                    formatted_revenue, ha='center', va='bottom', fontsize=6, color='black')
-            ax.text(bar1.get_x() + bar1.get_width() / 2.0,
-                    height + bar2.get_height() / 2 + 600,  # さらに上にずらす
-                    formatted_profit_ratio, ha='center', va='bottom', fontsize=6, color='black')
-        # Customize chart
-        ax.set_xlabel('Supply Chain Nodes', fontsize=8)
-        ax.set_ylabel('Amount', fontsize=8)
-        ax.set_title('Revenue and Profit Ratio by Node', fontsize=10)
-        ax.set_xticks([i for i in index])
-        ax.set_xticklabels(nodes, rotation=90, ha='right', fontsize=6)
-        ax.legend(fontsize=8)
-        # Reduce chart margins
-        fig.tight_layout()
-        # Display in GUI
-        self.display_chart(fig)
-    def display_chart(self, fig):
-        # Clear previous content
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-        # Embed chart
-        canvas = FigureCanvasTkAgg(fig, master=self.scrollable_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-    def cashflow_out_in_net(self):
-        print("cashflow_out_in_net")
-        # CSVファイルの保存パスを固定
-        cashflow_save_path = os.path.join(self.load_directory, "CashFlow_AR_AP_shift.csv")
-        profile_outbound_path = os.path.join(self.load_directory, "profile_tree_outbound.csv")
-        print("Save to", cashflow_save_path)
-        # 出力期間の計算
-        output_period_outbound = 53 * self.root_node_outbound.plan_range
-        # データの収集
-        data = []
-        def collect_data(node, output_period, level, position):
-            ar_days = node.AR_lead_time  # 売掛金回収期間（例: 30日）
-            ap_days = node.AP_lead_time  # 買掛金支払期間（例: 45日）
-            ar_shift = int(ar_days // 7)
-            ap_shift = int(ap_days // 7)
-            weekly_values_cash_in = []
-            weekly_values_cash_out = []
-            for attr in range(4):  # 0:"Sales", 1:"CarryOver", 2:"Inventory", 3:"Purchase"
-                if attr == 0:
-                    price = node.cs_price_sales_shipped
-                elif attr in [1, 2]:
-                    price = node.cs_purchase_total_cost
-                elif attr == 3:
-                    price = node.cs_direct_materials_costs
-                else:
-                    price = 0
-                row = [node.name, level, position, price, attr]
-                weekly_values = [len(node.psi4supply[week_no][attr]) * price for week_no in range(output_period)]
-                row.extend(weekly_values)
-                data.append(row)
-                if attr == 0:
-                    weekly_values_cash_in = np.roll(weekly_values, ar_shift)
-                    row = [node.name, level, position, price, "IN"]
-                elif attr == 3:
-                    weekly_values_cash_out = np.roll(weekly_values, ap_shift)
-                    row = [node.name, level, position, price, "OUT"]
-                else:
-                    continue
-                row.extend(weekly_values)
-                data.append(row)
-            # Net Cashの計算
-            row = [node.name, level, position, price, "NET"]
-            max_length = output_period
-            if len(weekly_values_cash_in) == 0:
-                weekly_values_cash_in = np.zeros(max_length)
-            if len(weekly_values_cash_out) == 0:
-                weekly_values_cash_out = np.zeros(max_length)
-            weekly_values_cash_net = np.array(weekly_values_cash_in) - np.array(weekly_values_cash_out)
-            row.extend(weekly_values_cash_net)
-            data.append(row)
-            for i, child in enumerate(node.children):
-                collect_data(child, output_period, level + 1, i + 1)
-        # CSVヘッダーの設定
-        headers_outbound = ["node_name", "Level", "Position", "Price", "PSI_attribute"] + [f"w{i+1}" for i in range(output_period_outbound)]
-        # データ収集
-        collect_data(self.root_node_outbound, output_period_outbound, 0, 1)
-        # DataFrame作成 & CSV保存
-        df_outbound = pd.DataFrame(data, columns=headers_outbound)
+        # node × (S/CO/I/P/IN/OUT/NET) × week を配列で一度に計算（AR/AP シフトは従来どおり np.roll の循環）
+        cf = build_cashflow(self.root_node_outbound, output_period_outbound, circular=True)
+        # DataFrame作成 & CSV保存（NET 行の Price は従来どおり P の単価）
+        df_outbound = cf.to_wide(net_price="P")
         df_outbound.to_csv(cashflow_save_path, index=False)
-        # CSVデータを別ウィンドウで表示
-        self.plot_cash_flow_window(cashflow_save_path, profile_outbound_path)
+        # 別ウィンドウで表示（CSV を読み直さずに縦持ちをそのまま渡す）
+        self.plot_cash_flow_window(cashflow_save_path, profile_outbound_path, cash_flow_long=cf.to_long())
     # Function to plot cash flow graph with spacing adjustment
     def plot_cash_flow(self, node_data, parent_frame):
         node_name = node_data['node_name'].iloc[0]
@@ -7146,12 +6939,7 @@ class PSIPlannerApp:
                 child_node_name = child['Child_node']
                 node_stack.append((child_node_name, current_level + 1))
             row_counter += 1
-    def plot_cash_flow_window(self, cashflow_save_path, profile_outbound_path):
-        df = pd.read_csv(cashflow_save_path)
-        df = df.drop(columns=['Price'])
-        df_melted = df.melt(id_vars=['node_name', 'Level', 'Position', 'PSI_attribute'], var_name='Week', value_name='Cash Flow')
-        df_melted['Week'] = df_melted['Week'].str.extract(r'(\d+)').astype(int)
-        cash_flow_data = df_melted.groupby(['node_name', 'Level', 'Position', 'PSI_attribute', 'Week'])['Cash Flow'].sum().reset_index()
+    def plot_cash_flow_window(self, cashflow_save_path, profile_outbound_path, cash_flow_long=None):
         cash_window = tk.Toplevel(self.root)
         cash_window.title("Cash Flow Analyzer")
         cash_window.geometry("1400x800")
@@ -7204,7 +6992,10 @@ class PSIPlannerApp:
             cash_flow_long = cash_flow_data.melt(id_vars=['node_name', 'Level', 'Position', 'PSI_attribute'], var_name='Week', value_name='Cash Flow')
             cash_flow_long['Week'] = cash_flow_long['Week'].str.extract(r'(\d+)').astype(int)
             return cash_flow_long.groupby(['node_name', 'Level', 'Position', 'PSI_attribute', 'Week'])['Cash Flow'].sum().reset_index()
-        cash_flow_agg = load_and_process_csv(cashflow_save_path)
+        if cash_flow_long is not None:
+            cash_flow_agg = cash_flow_long.groupby(['node_name', 'Level', 'Position', 'PSI_attribute', 'Week'])['Cash Flow'].sum().reset_index()
+        else:
+            cash_flow_agg = load_and_process_csv(cashflow_save_path)
         unique_nodes = tree_structure[parent_col].unique()
         root_node = unique_nodes[0] if len(unique_nodes) > 0 else None
         print("root_node", root_node)
@@ -7315,6 +7106,7 @@ class PSIPlannerApp:
         self.update_evaluation_results()
         # PSI計画の初期状態をバックアップ
         self.psi_backup_to_file(self.root_node_outbound, 'psi_backup.pkl')
+        self.psi_snapshot = PSISnapshot.capture(self.root_node_outbound)
         self.view_nx_matlib()
         self.root.after(1000, self.show_psi("outbound", "supply"))
         #self.root.after(1000, self.show_psi_graph)
@@ -7481,12 +7273,17 @@ class PSIPlannerApp:
         # This backup is in "demand leveling"
         ## PSI計画の初期状態をバックアップ
         #self.psi_backup_to_file(self.root_node_outbound, 'psi_backup.pkl')
+        # pattern ごとに pickle から木全体を復元せず、PSI バケツだけを snapshot から戻す
+        snapshot = self.psi_snapshot
+        if snapshot is None:
+            self.root_node_outbound = self.psi_restore_from_file('psi_backup.pkl')
+            snapshot = self.psi_snapshot = PSISnapshot.capture(self.root_node_outbound)
         nodes_decouple_all = make_nodes_decouple_all(self.root_node_outbound)
         print("nodes_decouple_all", nodes_decouple_all)
         for i, decouple_node_names in enumerate(nodes_decouple_all):
             print("nodes_decouple_all", nodes_decouple_all)
             # PSI計画の状態をリストア
-            self.root_node_outbound = self.psi_restore_from_file('psi_backup.pkl')
+            snapshot.restore(self.root_node_outbound)
             push_pull_all_psi2i_decouple4supply5(self.root_node_outbound, decouple_node_names)
             self.update_evaluation_results()
             print("decouple_node_names", decouple_node_names)
@@ -9615,6 +9412,8 @@ class PSIPlannerApp:
     # *************************
     def show_psi_by_product(self, bound, layer, product_name):
         self._ensure_plan_window()
+        if getattr(self, "psi_state", None) is not None:
+            self.psi_state.ensure_psi_attached(product_name, logger=getattr(self, "logger", None))
 
         #@251126 UPDATE
         self._ensure_psi_area(self.frame_psi)      # ← これを追加
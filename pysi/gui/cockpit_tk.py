@@ -16,13 +16,21 @@ from dataclasses import dataclass
 
 import numpy as np
 
-# cockpit_tk.py の上部に追加
-try:
-    from pysi.gui.world_map_view import show_world_map
-except ImportError:
-    # パスが通っていない場合のデバッグ用
-    def show_world_map(*args, **kwargs):
+from pysi.gui.kpi_cache import KPICache, PanelKeys, bump_plan_version, plan_version
+from pysi.gui.replan_service import ReplanService, accepts_progress
+from pysi.network.psi_metrics import P as P_BUCKET, PSICounts, psi_count_matrix, service_jit
+from pysi.evaluate.cashflow import CashflowResult, build_cashflow
+from pysi.gui.plot_layer import CashChart, PSIChart, chart_for
+
+# world_map_view / network_viewer（networkx, cartopy）は画面を開く時に import する（起動を軽く）
+def show_world_map(*args, **kwargs):
+    try:
+        from pysi.gui.world_map_view import show_world_map as _show_world_map
+    except ImportError:
+        # パスが通っていない場合のデバッグ用
         print("[Error] world_map_view.py could not be imported.")
+        return None
+    return _show_world_map(*args, **kwargs)
 
 # ----------------------------
 # UI Selection State
@@ -41,11 +49,6 @@ class SelectionState:
     selected_week: int | None = None
 
 import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-
-
-from pysi.gui.network_viewer_patched import show_network_E2E_matplotlib
 
 
 
@@ -87,91 +90,24 @@ def count_lots(x):
 # ----------------------------
 # Service KPI (JIT deviation)
 # ----------------------------
-def _percentile(sorted_vals, p: float) -> float:
-    if not sorted_vals:
-        return 0.0
-    n = len(sorted_vals)
-    k = int(round((n - 1) * p))
-    k = max(0, min(n - 1, k))
-    return float(sorted_vals[k])
-
 def compute_service_jit_for_product(root_outbound, weeks_count: int | None = None):
-    W = weeks_count or len(root_outbound.psi4demand)
-    leaves = leaf_nodes(root_outbound)
-
-    demand_week = {}
-    ship_week = {}
-
-    for lf in leaves:
-        for w in range(min(W, len(lf.psi4demand))):
-            for lot_id in (lf.psi4demand[w][0] or []):
-                if lot_id not in demand_week:
-                    demand_week[lot_id] = w
-
-        for w in range(min(W, len(lf.psi4supply))):
-            for lot_id in (lf.psi4supply[w][0] or []):
-                if lot_id not in ship_week:
-                    ship_week[lot_id] = w
-
-    diffs_abs = []
-    late = []
-    early = []
-    unfilled = 0
-    filled = 0
-
-    for lot_id, dw in demand_week.items():
-        sw = ship_week.get(lot_id)
-        if sw is None:
-            unfilled += 1
-            continue
-        filled += 1
-        d = sw - dw
-        diffs_abs.append(abs(d))
-        if d > 0:
-            late.append(float(d))
-        elif d < 0:
-            early.append(float(abs(d)))
-
-    diffs_abs.sort()
-
-    jit_mad = (sum(diffs_abs) / len(diffs_abs)) if diffs_abs else 0.0
-    jit_p95 = _percentile(diffs_abs, 0.95)
-    avg_late = (sum(late) / len(late)) if late else 0.0
-    avg_early = (sum(early) / len(early)) if early else 0.0
-
-    return {
-        "jit_mad_weeks": jit_mad,
-        "jit_p95_weeks": jit_p95,
-        "unfilled_lots": unfilled,
-        "filled_lots": filled,
-        "total_demand_lots": len(demand_week),
-        "avg_late_weeks": avg_late,
-        "avg_early_weeks": avg_early,
-    }
+    # leaf の需要週 / 出荷週の突き合わせは lot handle 配列で（pysi.network.psi_metrics）
+    return service_jit(root_outbound, weeks_count)
 
 
 # ----------------------------
 # Inventory / Utilization
 # ----------------------------
-def compute_total_inventory_lots(root_outbound, weeks_count: int | None = None):
-    # simplest: sum of I lots count across nodes for a representative week (last week) and/or average
-    W = weeks_count or len(root_outbound.psi4supply)
-    if W <= 0:
-        return 0, 0.0
-
-    inv_per_week = []
-    for w in range(W):
-        s = 0
-        for n in iter_nodes(root_outbound):
-            try:
-                s += count_lots(n.psi4supply[w][2])
-            except Exception:
-                pass
-        inv_per_week.append(s)
+def compute_psi_counts(root_outbound, weeks_count: int | None = None):
+    # 木を 1 回だけ辿って (node, week, S/CO/I/P) の lot 数行列を作る（在庫 / 稼働率はここから）
+    return PSICounts.from_tree(root_outbound, "psi4supply", weeks_count)
 
-    return int(inv_per_week[-1]), float(sum(inv_per_week) / len(inv_per_week))
+def compute_total_inventory_lots(root_outbound, weeks_count: int | None = None, counts: PSICounts | None = None):
+    # simplest: sum of I lots count across nodes for a representative week (last week) and/or average
+    pc = counts if counts is not None else compute_psi_counts(root_outbound, weeks_count)
+    return pc.inventory_summary()
 
-def compute_utilization_series(env, product: str, mom_name: str, root_outbound):
+def compute_utilization_series(env, product: str, mom_name: str, root_outbound, counts: PSICounts | None = None):
     # used_lots: MOM node P lots if available else root_outbound P lots
     # cap_lots: env.weekly_capability[product][mom_name][w]
     cap = (((getattr(env, "weekly_capability", {}) or {}).get(product, {}) or {}).get(mom_name, None))
@@ -179,120 +115,37 @@ def compute_utilization_series(env, product: str, mom_name: str, root_outbound):
         return None, None
 
     W = len(cap)
-    mom = find_node_by_name(root_outbound, mom_name)  # outbound tree may contain MOM. If not, use root_outbound.
-    node_for_used = mom if mom is not None else root_outbound
-
-    used = []
-    for w in range(W):
-        # P slot: try attr=3 (Purchase/Production) in your convention,
-        # but fallback if missing
-        p_lots = None
-        try:
-            p_lots = node_for_used.psi4supply[w][3]
-        except Exception:
-            p_lots = None
-        if p_lots is None:
-            try:
-                p_lots = node_for_used.psi4supply[w][0]  # fallback to S if P not available
-            except Exception:
-                p_lots = []
-        used.append(count_lots(p_lots))
+    pc = counts if counts is not None else compute_psi_counts(root_outbound)
+    # outbound tree may contain MOM. If not, use root_outbound.
+    p_lots = pc.series(mom_name, P_BUCKET)
+    if p_lots is None:
+        p_lots = pc.series(getattr(root_outbound, "name", ""), P_BUCKET)
+
+    used = np.zeros(W, dtype=float)
+    if p_lots is not None:
+        n = min(W, p_lots.size)
+        used[:n] = p_lots[:n]
 
-    util = []
-    for u, c in zip(used, cap):
-        if c and c > 0:
-            util.append(u / c)
-        else:
-            util.append(0.0)
-    return np.array(used, dtype=float), np.array(util, dtype=float)
+    c = np.array([float(x) if x else 0.0 for x in cap], dtype=float)
+    util = np.divide(used, c, out=np.zeros(W, dtype=float), where=c > 0)
+    return used, util
 
 
 # ----------------------------
 # Cashflow: compute df (NO CSV required)
 # ----------------------------
-def shift_right(values, k: int):
-    """Non-circular shift (delay)."""
-    values = np.array(values, dtype=float)
-    if k <= 0:
-        return values
-    out = np.zeros_like(values)
-    if k < len(values):
-        out[k:] = values[:-k]
-    return out
+def build_cashflow_outbound(root_outbound, output_period: int) -> CashflowResult:
+    """node × (S/CO/I/P/IN/OUT/NET) × week の金額（pysi.evaluate.cashflow、木の走査 1 回）"""
+    return build_cashflow(root_outbound, output_period)
 
 def build_cashflow_df_outbound(root_outbound, output_period: int):
     """
     returns DataFrame like your CSV but in-memory.
     """
-    data = []
-    week_cols = [f"w{i+1}" for i in range(output_period)]
-
-    def collect(node, level, position):
-        ar_days = getattr(node, "AR_lead_time", 0) or 0
-        ap_days = getattr(node, "AP_lead_time", 0) or 0
-        ar_shift = int(ar_days // 7)
-        ap_shift = int(ap_days // 7)
-
-        weekly_in = None
-        weekly_out = None
-
-        for attr in range(4):  # 0:S, 1:CarryOver, 2:I, 3:P (your convention)
-            if attr == 0:
-                price = getattr(node, "cs_price_sales_shipped", 0) or 0
-            elif attr in [1, 2]:
-                price = getattr(node, "cs_purchase_total_cost", 0) or 0
-            elif attr == 3:
-                price = getattr(node, "cs_direct_materials_costs", 0) or 0
-            else:
-                price = 0
+    return build_cashflow_outbound(root_outbound, output_period).to_wide()
 
-            base = [getattr(node, "name", ""), level, position, price, attr]
-            vals = []
-            for w in range(output_period):
-                try:
-                    vals.append(count_lots(node.psi4supply[w][attr]) * price)
-                except Exception:
-                    vals.append(0)
-            data.append(base + vals)
-
-            if attr == 0:
-                weekly_in = shift_right(vals, ar_shift)
-                data.append([getattr(node, "name", ""), level, position, price, "IN"] + list(vals))
-            elif attr == 3:
-                weekly_out = shift_right(vals, ap_shift)
-                data.append([getattr(node, "name", ""), level, position, price, "OUT"] + list(vals))
-
-        if weekly_in is None:
-            weekly_in = np.zeros(output_period)
-        if weekly_out is None:
-            weekly_out = np.zeros(output_period)
-        net = np.array(weekly_in) - np.array(weekly_out)
-        data.append([getattr(node, "name", ""), level, position, 0, "NET"] + list(net))
-
-        for i, child in enumerate(getattr(node, "children", []) or []):
-            collect(child, level + 1, i + 1)
-
-    collect(root_outbound, 0, 1)
-
-    cols = ["node_name", "Level", "Position", "Price", "PSI_attribute"] + week_cols
-    return pd.DataFrame(data, columns=cols)
-
-def cashflow_kpis_from_df(df, node_name: str | None = None):
-    week_cols = [c for c in df.columns if c.startswith("w")]
-    d = df
-    if node_name is not None:
-        d = d[d["node_name"] == node_name]
-
-    dnet = d[d["PSI_attribute"] == "NET"]
-    if dnet.empty:
-        return {"net_cash_min": 0.0, "net_cash_sum": 0.0, "cum_net_cash_min": 0.0}
-
-    net = dnet[week_cols].sum(axis=0).astype(float).values
-    net_cash_min = float(net.min()) if len(net) else 0.0
-    net_cash_sum = float(net.sum()) if len(net) else 0.0
-    cum = net.cumsum() if len(net) else np.array([])
-    cum_min = float(cum.min()) if len(cum) else 0.0
-    return {"net_cash_min": net_cash_min, "net_cash_sum": net_cash_sum, "cum_net_cash_min": cum_min}
+def cashflow_kpis(cash: CashflowResult, node_name: str | None = None):
+    return cash.kpis(node_name)
 
 
 # ----------------------------
@@ -303,8 +156,6 @@ def clear_frame(frame):
         w.destroy()
 
 def plot_mom_psi_cap(frame, env, product: str, mom_name: str, root_outbound):
-    clear_frame(frame)
-
     # NOTE:
     # ここは「MOM固定」ではなく、cockpit の選択ノード（leaf/WS/PAD/MOM 何でも）を描けるようにする。
     node_name = mom_name  # 引数名は互換維持。実体は「描画したいノード名」
@@ -329,69 +180,34 @@ def plot_mom_psi_cap(frame, env, product: str, mom_name: str, root_outbound):
     if cap is not None:
         W = len(cap)
     W = max(W, len(psi_supply), len(psi_demand))
+    chart = chart_for(frame, PSIChart)
     if W <= 0:
-        tk.Label(frame, text=f"No PSI data for {product}:{node_name}").pack()
+        chart.show_message(f"No PSI data for {product}:{node_name}")
         return
 
-    # series: S lots, I lots, P lots (fallback)
-    s_series = []
-    i_series = []
-    p_series = []
-    for w in range(W):
-        try:
-            if w < len(psi_supply):
-                s_series.append(count_lots(psi_supply[w][0]))
-            else:
-                s_series.append(count_lots(psi_demand[w][0]) if w < len(psi_demand) else 0)
-        except Exception:
-            s_series.append(0)
-        try:
-            i_series.append(count_lots(psi_supply[w][2]) if w < len(psi_supply) else 0)
-        except Exception:
-            i_series.append(0)
-        try:
-            p_series.append(count_lots(psi_supply[w][3]) if w < len(psi_supply) else 0)
-        except Exception:
-            p_series.append(0)
-
-    fig, ax = plt.subplots(figsize=(8.6, 3.2), dpi=110)
-    x = np.arange(1, W + 1)
-
-    ax.plot(x, s_series, marker="o", linewidth=1, markersize=2, label="S (Ship/Sales lots)")
-    ax.plot(x, p_series, marker="o", linewidth=1, markersize=2, label="P (Production lots)")
-    ax.plot(x, i_series, marker="o", linewidth=1, markersize=2, label="I (Inventory lots)")
-
-    #@STOP
-    #if cap is not None:
-    #    ax.plot(x, cap, marker=None, linewidth=2, label="Capability (lots/week)")
+    # series: S lots, I lots, P lots（S は supply が無い週だけ demand で補う）
+    sup = psi_count_matrix(psi_supply, W)
+    dem = psi_count_matrix(psi_demand, W)
+    in_supply = np.arange(W) < len(psi_supply)
+    s_series = np.where(in_supply, sup[:, 0], dem[:, 0])
+    i_series = sup[:, 2]
+    p_series = sup[:, 3]
 
+    cap_arr = None
     if cap is not None:
         # cap length must match W; pad with NaN (line breaks) or trim.
-        cap_list = list(cap)
-        if len(cap_list) < W:
-            cap_list = cap_list + [float("nan")] * (W - len(cap_list))
-        elif len(cap_list) > W:
-            cap_list = cap_list[:W]
-        ax.plot(x, cap_list, marker=None, linewidth=2, label="Capability (lots/week)")
-
-
+        cap_arr = np.full(W, np.nan)
+        cap_list = list(cap)[:W]
+        cap_arr[:len(cap_list)] = cap_list
 
     title = f"{product} / {node_name} : PSI"
     if cap is not None:
         title += " vs Capability"
-    ax.set_title(title)
-    ax.set_xlabel("Week")
-    ax.set_ylabel("Lots")
-    ax.legend(loc="upper left", fontsize=9)
+    # Figure / Line は作り直さず set_data だけ（ノード切り替えを軽く）
+    chart.update(np.arange(1, W + 1), s_series, p_series, i_series, cap_arr, title)
 
-    canvas = FigureCanvasTkAgg(fig, master=frame)
-    canvas.draw()
-    canvas.get_tk_widget().pack(fill="both", expand=True)
-    plt.close(fig)
-
-def plot_service(frame, env, product: str, root_outbound):
-    clear_frame(frame)
-    k = compute_service_jit_for_product(root_outbound)
+def plot_service(frame, env, product: str, root_outbound, kpis: dict | None = None):
+    k = kpis if kpis is not None else compute_service_jit_for_product(root_outbound)
 
     txt = (
         f"Service (Leaf JIT)\n\n"
@@ -403,60 +219,35 @@ def plot_service(frame, env, product: str, root_outbound):
         f"Avg Late (weeks)    : {k['avg_late_weeks']:.2f}\n"
         f"Avg Early (weeks)   : {k['avg_early_weeks']:.2f}\n"
     )
-    lab = tk.Label(frame, text=txt, justify="left", font=("Segoe UI", 11))
-    lab.pack(anchor="w", padx=10, pady=10)
-
-def plot_cashflow(frame, df_cash, title: str, node_name: str | None = None):
-    clear_frame(frame)
-
-    week_cols = [c for c in df_cash.columns if c.startswith("w")]
-    d = df_cash
-    if node_name is not None:
-        d = d[d["node_name"] == node_name]
-
+    lab = getattr(frame, "_wom_label", None)
+    if lab is None or not lab.winfo_exists():
+        clear_frame(frame)
+        lab = frame._wom_label = tk.Label(frame, justify="left", font=("Segoe UI", 11))
+        lab.pack(anchor="w", padx=10, pady=10)
+    lab.configure(text=txt)
+
+def plot_cashflow(frame, cash: CashflowResult, title: str, node_name: str | None = None):
     # sum across rows for each attribute
-    def series(attr):
-        dd = d[d["PSI_attribute"] == attr]
-        if dd.empty:
-            return np.zeros(len(week_cols))
-        return dd[week_cols].sum(axis=0).astype(float).values
-
-    cash_in = series("IN")
-    cash_out = series("OUT")
-    net = series("NET")
+    cash_in = cash.series("IN", node_name)
+    cash_out = cash.series("OUT", node_name)
+    net = cash.series("NET", node_name)
 
-    W = len(week_cols)
+    W = cash.weeks
     x = np.arange(1, W + 1)
 
-    fig, ax1 = plt.subplots(figsize=(8.6, 3.2), dpi=110)
-    bar_w = 0.35
-    ax1.bar(x - bar_w / 2, cash_in, width=bar_w, alpha=0.7, label="Cash In")
-    ax1.bar(x + bar_w / 2, cash_out, width=bar_w, alpha=0.7, label="Cash Out")
-    ax2 = ax1.twinx()
-    ax2.plot(x, net, marker="o", linewidth=1, markersize=2, label="Net Cash")
-
-    ax1.set_title(title)
-    ax1.set_xlabel("Week")
-    ax1.set_ylabel("Cash In/Out")
-    ax2.set_ylabel("Net Cash")
-
-    ax1.legend(loc="upper left", fontsize=9)
-    ax2.legend(loc="upper right", fontsize=9)
-
-    canvas = FigureCanvasTkAgg(fig, master=frame)
-    canvas.draw()
-    canvas.get_tk_widget().pack(fill="both", expand=True)
-    plt.close(fig)
+    # 棒は set_height、Net は set_data（本数が変わった時だけ棒を作り直す）
+    chart_for(frame, CashChart).update(x, cash_in, cash_out, net, title)
 
 
 # ----------------------------
 # Cockpit UI
 # ----------------------------
 class WOMCockpit(tk.Tk):
-    def __init__(self, env, rerun_fn=None):
+    def __init__(self, env, rerun_fn=None, workers=None):
         super().__init__()
         self.env = env
         self.rerun_fn = rerun_fn  # ★ injected from main4cockpit.py
+        self.workers = workers    # decoupling sweep の process 数（None: PYSI_WORKERS）
         self.title("WOM Cockpit (Minimal)")
         self.geometry("1100x700")
 
@@ -525,8 +316,19 @@ class WOMCockpit(tk.Tk):
         ttk.Radiobutton(self.frame_cash_controls, text="Total (Outbound sum)", variable=self.var_cash_mode, value="TOTAL", command=self.refresh).pack(side="left")
         ttk.Radiobutton(self.frame_cash_controls, text="Selected MOM", variable=self.var_cash_mode, value="MOM", command=self.refresh).pack(side="left", padx=10)
 
-        # cached cash df
-        self.df_cash = None
+        # cached cashflow (CashflowResult)
+        self.cash = None
+
+        # KPI キャッシュ（product, plan_version ごと）と、パネルごとの描画済みキー
+        self.kpi_cache = KPICache()
+        self.panels = PanelKeys()
+
+        # 再計画は worker thread（UI は止めない。連打したら最新の依頼だけ反映）
+        self.replan = None
+        if callable(self.rerun_fn):
+            self.replan = ReplanService(self, self._call_rerun, on_result=self._on_replan_done,
+                                        on_progress=self._on_replan_progress, on_error=self._on_replan_error)
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
 
         # initial draw
         self.refresh()
@@ -546,6 +348,12 @@ class WOMCockpit(tk.Tk):
         self.cb_mom.bind("<<ComboboxSelected>>", lambda e: self.refresh())
 
         ttk.Button(frm, text="Run (recompute)", command=self.run_and_refresh).pack(side="right")
+        self.var_status = tk.StringVar(value="")
+        ttk.Label(frm, textvariable=self.var_status, width=34, anchor="e").pack(side="right", padx=(8, 4))
+        ttk.Button(frm, text="Decouple Sweep", command=self.run_decoupling_sweep).pack(side="right", padx=8)
+        self.var_workers = tk.StringVar(value=str(self.workers if self.workers is not None else 1))
+        ttk.Spinbox(frm, from_=0, to=64, width=4, textvariable=self.var_workers).pack(side="right")
+        ttk.Label(frm, text="Workers:").pack(side="right", padx=(8, 2))
         ttk.Button(frm, text="World Map", command=self.open_world_map).pack(side="right", padx=8)
         ttk.Button(frm, text="Network",   command=self.open_network).pack(side="right", padx=8)
         ttk.Button(frm, text="Select Node", command=self.open_node_selector).pack(side="right", padx=8)
@@ -641,19 +449,13 @@ class WOMCockpit(tk.Tk):
 
     def l1_draw_mini_from_node(self, node):
         """Default mini view: last 10 weeks of S/I/P lot counts (supply layer)."""
-        def cnt(x):
-            return len(x) if x else 0
-
         psi4 = getattr(node, "psi4supply", None) or []
         W = min(10, len(psi4))
         lines = [f"node: {getattr(node, 'name', '')}", ""]
+        # 先頭 W 週だけ数える（PSIView なら offsets の差分だけ）
+        counts = psi_count_matrix(psi4[:W] if isinstance(psi4, list) else psi4, W)
         for w in range(W):
-            try:
-                S = cnt(psi4[w][0])
-                I = cnt(psi4[w][2])
-                P = cnt(psi4[w][3])
-            except Exception:
-                S = I = P = 0
+            S, _, I, P = (int(c) for c in counts[w])
             lines.append(f"w{w+1:02d}  S:{S:4d}  I:{I:4d}  P:{P:4d}")
         if W == 0:
             lines.append("(psi4supply is empty)")
@@ -880,46 +682,102 @@ class WOMCockpit(tk.Tk):
 
     def run_and_refresh(self):
         """
-        ★ rerun_fn があれば：pipeline を再実行して env を差し替え
-        ★ なければ：従来フォールバック（軽量再計算）
+        ★ rerun_fn があれば：pipeline を worker thread で再実行し、終わったら env を差し替え
+        ★ なければ：従来フォールバック（軽量再計算、main thread）
         """
         prod = self.var_product.get()
 
-        if callable(self.rerun_fn):
-            try:
-                new_env = self.rerun_fn(product=prod)
-            except TypeError:
-                # 互換用（万が一 positional のみだった場合）
-                new_env = self.rerun_fn(prod)
-
-            if new_env is not None:
-                # env swap
-                self.env = new_env
-
-                # lists refresh (product / mom)
-                self.products = sorted(list((getattr(self.env, "prod_tree_dict_OT", {}) or {}).keys())) or self.products
-                self.moms_geo = self._load_moms_from_geo()
-                self.moms = self._resolve_moms()
-
-                # combobox update
-                self.cb_product["values"] = self.products
-                self.cb_mom["values"] = self.moms
-
-                # keep selection stable
-                if self.products and prod not in self.products:
-                    prod = self.products[0]
-                self.var_product.set(prod)
-                self.env.product_selected = prod
-
-                if self.moms:
-                    if self.var_mom.get() not in self.moms:
-                        self.var_mom.set(self.moms[0])
-        else:
-            # fallback: only call evaluation if exists
-            if hasattr(self.env, "demand_leveling4multi_prod"):
-                self.env.demand_leveling4multi_prod()
+        if self.replan is not None:
+            # 実行中の再計画があれば superseded（結果は捨てる）
+            self.replan.submit(product=prod)
+            return
+
+        # fallback: only call evaluation if exists
+        if hasattr(self.env, "demand_leveling4multi_prod"):
+            self.env.demand_leveling4multi_prod()
 
+        # Run は常に計画が変わった扱い（KPI を取り直す）
+        bump_plan_version(self.env)
+        self.refresh()
+
+    def _call_rerun(self, product: str, progress=None):
+        # worker thread で呼ばれる（Tk には触らない）
+        if progress is not None and accepts_progress(self.rerun_fn):
+            return self.rerun_fn(product=product, progress=progress)
+        try:
+            return self.rerun_fn(product=product)
+        except TypeError:
+            # 互換用（万が一 positional のみだった場合）
+            return self.rerun_fn(product)
+
+    def _on_replan_progress(self, msg: str, kw: dict):
+        self.var_status.set(f"Replanning {kw.get('product', '')}: {msg}")
+
+    def _on_replan_error(self, exc: BaseException, kw: dict):
+        self.var_status.set(f"Replan failed: {exc}")
+        print(f"[cockpit] replan failed for {kw.get('product')}: {exc!r}")
+
+    def _on_replan_done(self, new_env, kw: dict):
+        # main thread（after コールバック）で env を丸ごと差し替える
+        prod = kw.get("product") or self.var_product.get()
+        self.var_status.set("")
+
+        if new_env is not None:
+            # env swap
+            self.env = new_env
+
+            # lists refresh (product / mom)
+            self.products = sorted(list((getattr(self.env, "prod_tree_dict_OT", {}) or {}).keys())) or self.products
+            self.moms_geo = self._load_moms_from_geo()
+            self.moms = self._resolve_moms()
+
+            # combobox update
+            self.cb_product["values"] = self.products
+            self.cb_mom["values"] = self.moms
+
+            # keep selection stable
+            if self.products and prod not in self.products:
+                prod = self.products[0]
+            self.var_product.set(prod)
+            self.env.product_selected = prod
+
+            if self.moms:
+                if self.var_mom.get() not in self.moms:
+                    self.var_mom.set(self.moms[0])
+
+        # Run は常に計画が変わった扱い（KPI を取り直す）
+        bump_plan_version(self.env)
+        self.refresh()
+
+    def _on_close(self):
+        if self.replan is not None:
+            self.replan.shutdown()
+        self.destroy()
+
+    def run_decoupling_sweep(self):
+        """
+        選択 product の decoupling pattern を一括評価して L1 に一覧表示する。
+        Workers: 1=serial, 2以上=process pool, 0=CPU数
+        """
+        prod = self.var_product.get()
+        if not prod or not hasattr(self.env, "eval_buffer_stock4multi_product"):
+            return
+        try:
+            workers = int(self.var_workers.get())
+        except ValueError:
+            workers = self.workers
+        self.env.product_selected = prod
+        dic = self.env.eval_buffer_stock4multi_product(workers=workers)
+
+        # sweep 後は PSI がsupply planning前の状態なので、既定の decouple で計画し直す
+        if hasattr(self.env, "supply_planning4multi_product"):
+            self.env.supply_planning4multi_product()
+
+        lines = [f"Decoupling sweep: {prod}  ({len(dic)} patterns)"]
+        for i, (revenue, profit, names) in sorted(dic.items()):
+            lines.append(f"  #{i}: revenue={revenue:,.0f} profit={profit:,.0f}  {names}")
         self.refresh()
+        self.l1_show_text("\n".join(lines))
 
     def refresh(self):
         prod = self.var_product.get()
@@ -938,36 +796,73 @@ class WOMCockpit(tk.Tk):
         selected_node = getattr(self.state, "selected_node", None)
         node_for_plot = selected_node or mom
 
+        # KPI は (product, plan_version) ごとにキャッシュ。パネルは入力キーが変わった時だけ描き直す
+        # （ノード選択だけが変わった時は PSI プロットだけ）
+        cache = self.kpi_cache
+        cache.bind(self.env)
+        ver = plan_version(self.env)
+        output_period = 53 * int(getattr(root_ot, "plan_range", 1))
+        mode = self.var_cash_mode.get()
+
+        need_kpi = self.panels.changed("kpi", (prod, mom, ver))
+        need_service = self.panels.changed("service", (prod, ver))
+        need_cash = self.panels.changed("cash", (prod, ver, mode, mom if mode != "TOTAL" else None))
+
+        if need_kpi or need_cash:
+            # Cashflow (product / plan_version ごと)
+            self.cash = cache.get("cash", prod, output_period,
+                                  compute=lambda: build_cashflow_outbound(root_ot, output_period=output_period))
+
+        if need_kpi:
+            self._update_kpi_labels(prod, mom, root_ot)
+
+        # plots
+        if self.panels.changed("psi", (prod, node_for_plot, ver)):
+            plot_mom_psi_cap(self.frame_psi_plot, self.env, prod, node_for_plot, root_ot)
+        if need_service:
+            svc = cache.get("service", prod, compute=lambda: compute_service_jit_for_product(root_ot))
+            plot_service(self.frame_service, self.env, prod, root_ot, kpis=svc)
+
+        if need_cash:
+            if mode == "TOTAL":
+                plot_cashflow(self.frame_cash_total, self.cash, title=f"Cashflow TOTAL (Outbound sum) : {prod}", node_name=None)
+            else:
+                plot_cashflow(self.frame_cash_total, self.cash, title=f"Cashflow MOM : {prod} / {mom}", node_name=mom)
+
+    def _evaluate_profit(self):
         # update eval profit
         if hasattr(self.env, "update_evaluation_results4multi_product"):
             try:
                 self.env.update_evaluation_results4multi_product()
             except Exception:
                 pass
+        return float(getattr(self.env, "total_profit", 0) or 0), float(getattr(self.env, "total_revenue", 0) or 0)
 
-        total_profit = float(getattr(self.env, "total_profit", 0) or 0)
-        total_revenue = float(getattr(self.env, "total_revenue", 0) or 0)
+    def _update_kpi_labels(self, prod: str, mom: str, root_ot):
+        cache = self.kpi_cache
+        total_profit, total_revenue = cache.get("eval", prod, compute=self._evaluate_profit)
         profit_ratio = (total_profit / total_revenue) if total_revenue else 0.0
 
         # Service
-        svc = compute_service_jit_for_product(root_ot)
+        svc = cache.get("service", prod, compute=lambda: compute_service_jit_for_product(root_ot))
         jit_mad = svc["jit_mad_weeks"]
         unfilled = svc["unfilled_lots"]
 
+        # lot 数行列（product / plan_version ごとに 1 回だけ木を走査）
+        counts = cache.get("counts", prod, compute=lambda: compute_psi_counts(root_ot))
+
         # Inventory
-        inv_last, inv_avg = compute_total_inventory_lots(root_ot)
+        inv_last, inv_avg = cache.get("inventory", prod, compute=lambda: compute_total_inventory_lots(root_ot, counts=counts))
 
         # Utilization (series mean)
-        used, util = compute_utilization_series(self.env, prod, mom, root_ot)
+        used, util = cache.get("util", prod, mom,
+                               compute=lambda: compute_utilization_series(self.env, prod, mom, root_ot, counts=counts))
         util_mean = float(util.mean()) if util is not None and len(util) else 0.0
 
-        # Cashflow DF (cache per refresh)
-        output_period = 53 * int(getattr(root_ot, "plan_range", 1))
-        self.df_cash = build_cashflow_df_outbound(root_ot, output_period=output_period)
-
         # Cash KPIs: total + mom
-        cash_total = cashflow_kpis_from_df(self.df_cash, node_name=None)
-        cash_mom = cashflow_kpis_from_df(self.df_cash, node_name=mom) if mom else {"net_cash_min": 0, "cum_net_cash_min": 0}
+        cash_total = cache.get("cash_kpi", prod, None, compute=lambda: cashflow_kpis(self.cash, node_name=None))
+        cash_mom = (cache.get("cash_kpi", prod, mom, compute=lambda: cashflow_kpis(self.cash, node_name=mom))
+                    if mom else {"net_cash_min": 0, "cum_net_cash_min": 0})
 
         # KPI labels
         self.kpi_labels["Profit"].configure(text=f"Profit: {total_profit:,.0f}   (Rev {total_revenue:,.0f}, Margin {profit_ratio*100:.1f}%)")
@@ -980,16 +875,6 @@ class WOMCockpit(tk.Tk):
                  f"{mom}: min {cash_mom['net_cash_min']:,.0f}, cum_min {cash_mom['cum_net_cash_min']:,.0f}"
         )
 
-        # plots
-        plot_mom_psi_cap(self.frame_psi_plot, self.env, prod, node_for_plot, root_ot)
-        plot_service(self.frame_service, self.env, prod, root_ot)
-
-        mode = self.var_cash_mode.get()
-        if mode == "TOTAL":
-            plot_cashflow(self.frame_cash_total, self.df_cash, title=f"Cashflow TOTAL (Outbound sum) : {prod}", node_name=None)
-        else:
-            plot_cashflow(self.frame_cash_total, self.df_cash, title=f"Cashflow MOM : {prod} / {mom}", node_name=mom)
-
 
     #@STOP
     #def open_network(self):
@@ -1008,8 +893,7 @@ class WOMCockpit(tk.Tk):
         if not prod:
             return
         
-        #@STOP
-        #from pysi.gui.network_viewer_patched import show_network_E2E_matplotlib
+        from pysi.gui.network_viewer_patched import show_network_E2E_matplotlib
 
         self._network_viewer = show_network_E2E_matplotlib(
             self.env,
@@ -1052,6 +936,6 @@ class WOMCockpit(tk.Tk):
         self.render_l1_psi_mini()
         self.refresh()
 
-def launch_cockpit(env, rerun_fn=None):
-    app = WOMCockpit(env, rerun_fn=rerun_fn)
+def launch_cockpit(env, rerun_fn=None, workers=None):
+    app = WOMCockpit(env, rerun_fn=rerun_fn, workers=workers)
     app.mainloop()
@@ -0,0 +1,77 @@
+# pysi/gui/kpi_cache.py
+# cockpit 用 KPI キャッシュ（dirty tracking）
+#  - env.plan_version は計画を書き換える WOMEnv のメソッド（engine）と cockpit の Run で進む
+#  - KPI は (kind, product, plan_version, *extra) をキーに 1 回だけ計算する
+#  - PanelKeys は「このパネルは何を入力に描いたか」を覚え、入力が変わったパネルだけ描き直させる
+from __future__ import annotations
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+def plan_version(env) -> int:
+    return int(getattr(env, "plan_version", 0) or 0)
+def bump_plan_version(env) -> int:
+    """env の計画が変わったことを知らせる（WOMEnv 以外の env でも動くように）"""
+    fn = getattr(env, "bump_plan_version", None)
+    if callable(fn):
+        return fn()
+    env.plan_version = plan_version(env) + 1
+    return env.plan_version
+class KPICache:
+    """
+    (kind, product, plan_version, *extra) → 値。
+
+        cache.bind(env)
+        svc = cache.get("service", prod, compute=lambda: compute_service_jit_for_product(root))
+
+    env が差し替わったら全部捨てる。plan_version が進んだ product の古い版も捨てる。
+    """
+    def __init__(self):
+        self._env = None
+        self._data: Dict[Tuple[Hashable, ...], Any] = {}
+        self._version: Dict[Hashable, int] = {}      # product → 最後に見た plan_version
+        self.hits = 0
+        self.misses = 0
+    def bind(self, env) -> None:
+        if env is not self._env:
+            self._env = env
+            self.clear()
+    def clear(self) -> None:
+        self._data.clear()
+        self._version.clear()
+    def version(self) -> int:
+        return plan_version(self._env)
+    def get(self, kind: str, product: Hashable, *extra: Hashable, compute: Callable[[], Any]) -> Any:
+        ver = self.version()
+        if self._version.get(product) != ver:
+            # この product の古い版を捨てる
+            self._data = {k: v for k, v in self._data.items() if k[1] != product}
+            self._version[product] = ver
+        key = (kind, product, ver) + extra
+        try:
+            val = self._data[key]
+            self.hits += 1
+            return val
+        except KeyError:
+            pass
+        self.misses += 1
+        val = self._data[key] = compute()
+        return val
+    def invalidate(self, product: Optional[Hashable] = None) -> None:
+        """手動で捨てる（product=None なら全部）"""
+        if product is None:
+            self.clear()
+        else:
+            self._data = {k: v for k, v in self._data.items() if k[1] != product}
+            self._version.pop(product, None)
+class PanelKeys:
+    """パネルごとに最後に描いた入力キーを覚える。changed(panel, key) が True の時だけ描き直す"""
+    def __init__(self):
+        self._drawn: Dict[str, Hashable] = {}
+    def changed(self, panel: str, key: Hashable) -> bool:
+        if self._drawn.get(panel) == key:
+            return False
+        self._drawn[panel] = key
+        return True
+    def reset(self, panel: Optional[str] = None) -> None:
+        if panel is None:
+            self._drawn.clear()
+        else:
+            self._drawn.pop(panel, None)
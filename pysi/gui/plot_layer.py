@@ -0,0 +1,196 @@
+# pysi/gui/plot_layer.py
+# cockpit 用の常駐プロット（Figure / Canvas / Axes / Line / Bar を作り直さずにデータだけ差し替える）
+#  - chart_for(frame, PSIChart) で frame ごとに 1 つの chart を作って使い回す（clear_frame しない）
+#  - 線は set_data、棒は set_height。本数や週数が変わった時だけ artist を作り直す
+#  - 長い期間は間引いて描く：線は bucket ごとの min / max（山・谷を残す）、棒は bucket 合計
+#  - PSIChart の週カーソル（マウス位置の週と S/P/I の値）は blit で描く（図全体は再描画しない）
+#  - pyplot は使わない（Figure を直接作るので plt.close も不要、pyplot のグローバル状態に乗らない）
+#  - frame=None なら Agg canvas（Tk なしで動く。計測 / テスト用）
+from __future__ import annotations
+from typing import Dict, Optional, Sequence, Tuple
+import numpy as np
+from matplotlib.figure import Figure
+MAX_LINE_POINTS = 800         # これを超える線は min / max で間引く
+MAX_BARS = 260                # これを超える棒は bucket にまとめる
+def decimate_minmax(x: np.ndarray, y: np.ndarray, max_points: int = MAX_LINE_POINTS) -> Tuple[np.ndarray, np.ndarray]:
+    """bucket ごとに min と max の点だけを残す（位置順）。NaN は欠損として扱う"""
+    n = len(y)
+    if n <= max_points or max_points < 4:
+        return x, y
+    bins = max_points // 2
+    size = -(-n // bins)
+    bins = -(-n // size)
+    pad = bins * size - n
+    yy = np.concatenate([np.asarray(y, dtype=float), np.full(pad, np.nan)]).reshape(bins, size)
+    finite = ~np.isnan(yy)
+    lo = np.where(finite, yy, np.inf).argmin(axis=1)
+    hi = np.where(finite, yy, -np.inf).argmax(axis=1)
+    base = np.arange(bins) * size
+    idx = np.sort(np.stack([base + lo, base + hi], axis=1), axis=1).reshape(-1)
+    idx = idx[idx < n]
+    keep = np.concatenate([[True], idx[1:] != idx[:-1]])
+    idx = idx[keep]
+    return np.asarray(x)[idx], np.asarray(y)[idx]
+def bin_sum(x: np.ndarray, ys: Sequence[np.ndarray], max_bars: int = MAX_BARS) -> Tuple[np.ndarray, list, float]:
+    """棒用：max_bars を超えたら連続する週をまとめて合計。戻り値 (中心 x, [y...], 1 本あたりの週数)"""
+    n = len(x)
+    if n <= max_bars:
+        return np.asarray(x, dtype=float), [np.asarray(y, dtype=float) for y in ys], 1.0
+    size = -(-n // max_bars)
+    bins = -(-n // size)
+    pad = bins * size - n
+    xs = np.concatenate([np.asarray(x, dtype=float), np.full(pad, np.nan)]).reshape(bins, size)
+    out = []
+    for y in ys:
+        yy = np.concatenate([np.asarray(y, dtype=float), np.zeros(pad)]).reshape(bins, size)
+        out.append(yy.sum(axis=1))
+    return np.nanmean(xs, axis=1), out, float(size)
+class PersistentChart:
+    """Figure + canvas を 1 回だけ作り、update() でデータだけ入れ替える基底クラス"""
+    figsize = (8.6, 3.2)
+    dpi = 110
+    def __init__(self, frame=None):
+        self.fig = Figure(figsize=self.figsize, dpi=self.dpi)
+        if frame is not None:
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+            self.canvas = FigureCanvasTkAgg(self.fig, master=frame)
+            self.canvas.get_tk_widget().pack(fill="both", expand=True)
+        else:
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            self.canvas = FigureCanvasAgg(self.fig)
+        self.updates = 0
+        self.rebuilds = 0
+        self._build()
+    def _build(self) -> None:
+        raise NotImplementedError
+    def draw(self) -> None:
+        self.updates += 1
+        self.canvas.draw_idle()
+    @staticmethod
+    def _rescale(ax) -> None:
+        ax.relim(visible_only=True)
+        ax.autoscale_view()
+class PSIChart(PersistentChart):
+    """node の S / P / I（+ capability）の週系列。週カーソルは blit"""
+    def _build(self) -> None:
+        ax = self.ax = self.fig.add_subplot(111)
+        style = dict(marker="o", linewidth=1, markersize=2)
+        self.lines = {
+            "S": ax.plot([], [], label="S (Ship/Sales lots)", **style)[0],
+            "P": ax.plot([], [], label="P (Production lots)", **style)[0],
+            "I": ax.plot([], [], label="I (Inventory lots)", **style)[0],
+            "cap": ax.plot([], [], marker=None, linewidth=2, label="Capability (lots/week)")[0],
+        }
+        ax.set_xlabel("Week")
+        ax.set_ylabel("Lots")
+        self._legend_key = None
+        self._series: Dict[str, np.ndarray] = {}
+        # 週カーソル（animated: 通常の draw では描かれず、blit の時だけ描く）
+        self.cursor = ax.axvline(0, color="0.3", linewidth=1, linestyle=":", animated=True, visible=False)
+        self.readout = ax.text(0.99, 0.97, "", transform=ax.transAxes, ha="right", va="top", fontsize=8,
+                               animated=True, visible=False)
+        self._bg = None
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+        self.canvas.mpl_connect("motion_notify_event", self._on_motion)
+        self.canvas.mpl_connect("axes_leave_event", lambda e: self.highlight_week(None))
+    def update(self, x: np.ndarray, s: np.ndarray, p: np.ndarray, i: np.ndarray,
+               cap: Optional[np.ndarray], title: str) -> None:
+        self._series = {"S": s, "P": p, "I": i}
+        for key, y in (("S", s), ("P", p), ("I", i)):
+            self.lines[key].set_data(*decimate_minmax(x, y))
+        has_cap = cap is not None
+        if has_cap:
+            self.lines["cap"].set_data(*decimate_minmax(x, cap))
+        else:
+            self.lines["cap"].set_data([], [])
+        self.lines["cap"].set_visible(has_cap)
+        if self._legend_key != has_cap:
+            # 凡例は capability の有無が変わった時だけ作り直す
+            self._legend_key = has_cap
+            self.ax.legend(handles=[ln for ln in self.lines.values() if ln.get_visible()], loc="upper left", fontsize=9)
+        self.ax.set_title(title)
+        self._rescale(self.ax)
+        self.draw()
+    def show_message(self, title: str) -> None:
+        for ln in self.lines.values():
+            ln.set_data([], [])
+        self._series = {}
+        self.ax.set_title(title)
+        self.draw()
+    # -- blit cursor ------------------------------------------------------------
+    def _on_draw(self, event) -> None:
+        # 背景（カーソル無し）を覚えておき、カーソル移動はこの上に blit する
+        self._bg = self.canvas.copy_from_bbox(self.fig.bbox)
+    def _on_motion(self, event) -> None:
+        if event.inaxes is not self.ax or event.xdata is None:
+            self.highlight_week(None)
+            return
+        self.highlight_week(int(round(event.xdata)))
+    def highlight_week(self, week: Optional[int]) -> None:
+        """week（1 始まり）に縦線と S/P/I の値を出す。None で消す"""
+        s = self._series.get("S")
+        visible = week is not None and s is not None and 1 <= week <= len(s)
+        if not visible and not self.cursor.get_visible():
+            return
+        self.cursor.set_visible(visible)
+        self.readout.set_visible(visible)
+        if visible:
+            w = week - 1
+            self.cursor.set_xdata([week, week])
+            vals = "  ".join(f"{k}:{int(v[w])}" for k, v in self._series.items())
+            self.readout.set_text(f"w{week}  {vals}")
+        if self._bg is None:
+            return
+        self.canvas.restore_region(self._bg)
+        if visible:
+            self.ax.draw_artist(self.cursor)
+            self.ax.draw_artist(self.readout)
+        self.canvas.blit(self.fig.bbox)
+class CashChart(PersistentChart):
+    """Cash In / Out の棒と Net Cash の線（右軸）"""
+    bar_w = 0.35
+    def _build(self) -> None:
+        ax1 = self.ax1 = self.fig.add_subplot(111)
+        ax2 = self.ax2 = ax1.twinx()
+        self.bars_in = self.bars_out = None
+        self._bar_key = None
+        self.net_line = ax2.plot([], [], marker="o", linewidth=1, markersize=2, label="Net Cash")[0]
+        ax1.set_xlabel("Week")
+        ax1.set_ylabel("Cash In/Out")
+        ax2.set_ylabel("Net Cash")
+        ax2.legend(loc="upper right", fontsize=9)
+    def _make_bars(self, xb: np.ndarray, width: float) -> None:
+        for bars in (self.bars_in, self.bars_out):
+            if bars is not None:
+                bars.remove()
+        w = self.bar_w * width
+        zeros = np.zeros(len(xb))
+        self.bars_in = self.ax1.bar(xb - w / 2, zeros, width=w, alpha=0.7, label="Cash In", color="C0")
+        self.bars_out = self.ax1.bar(xb + w / 2, zeros, width=w, alpha=0.7, label="Cash Out", color="C1")
+        self.ax1.legend(loc="upper left", fontsize=9)
+        self.rebuilds += 1
+    def update(self, x: np.ndarray, cash_in: np.ndarray, cash_out: np.ndarray, net: np.ndarray, title: str) -> None:
+        xb, (yin, yout), width = bin_sum(x, (cash_in, cash_out))
+        key = (len(xb), width, float(xb[0]) if len(xb) else 0.0)
+        if key != self._bar_key:
+            # 棒の本数 / 幅が変わった時だけ作り直す（通常の切り替えは set_height のみ）
+            self._bar_key = key
+            self._make_bars(xb, width)
+        for rect, h in zip(self.bars_in.patches, yin):
+            rect.set_height(h)
+        for rect, h in zip(self.bars_out.patches, yout):
+            rect.set_height(h)
+        self.net_line.set_data(*decimate_minmax(x, net))
+        self.ax1.set_title(title)
+        self._rescale(self.ax1)
+        self._rescale(self.ax2)
+        self.draw()
+def chart_for(frame, cls):
+    """frame に常駐する cls の chart（無い / 別クラスなら frame を空けて作る）"""
+    ch = getattr(frame, "_wom_chart", None)
+    if not isinstance(ch, cls):
+        for w in frame.winfo_children():
+            w.destroy()
+        ch = cls(frame)
+        frame._wom_chart = ch
+    return ch
@@ -0,0 +1,161 @@
+# pysi/gui/replan_service.py
+# cockpit 用の再計画サービス（worker thread で rerun_fn を回し、Tk の main loop を止めない）
+#  - submit(**kw) で再計画を依頼。実行中に新しい依頼が来たら古い方は superseded（結果は捨てる）
+#    rerun_fn が progress= を受け取れる場合は、次の段階の境目で古い実行を打ち切る
+#  - worker は 1 本だけ（runner / bus / io adapter を同時に 2 つの run で触らせない）
+#  - worker → UI は queue 経由。UI 側は widget.after() で queue を吸い上げ、コールバックは必ず main thread で呼ぶ
+#    → env の差し替えは on_result の中で 1 回の代入として行える（描画途中に env が変わらない）
+#
+# event: ("start" | "progress" | "done" | "error" | "superseded", seq, payload)
+from __future__ import annotations
+import inspect
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+logger = logging.getLogger(__name__)
+def accepts_progress(fn: Callable) -> bool:
+    """fn が progress= キーワード（か **kwargs）を受け取れるか"""
+    try:
+        params = inspect.signature(fn).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    return any(p.name == "progress" or p.kind is p.VAR_KEYWORD for p in params)
+class ReplanService:
+    """
+    rerun_fn を worker thread で実行し、結果を Tk の main thread に戻す。
+
+        svc = ReplanService(self, rerun_fn, on_result=self._swap_env, on_progress=self._show_status)
+        svc.submit(product=prod)
+
+    on_result(result, kw) / on_progress(msg, kw) / on_error(exc, kw) はすべて widget.after() から呼ばれる。
+    最新の依頼（seq）以外の結果・進捗は UI に届かない。
+    """
+    def __init__(self, widget, fn: Callable[..., Any], on_result: Callable[[Any, Dict[str, Any]], None],
+                 on_progress: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                 on_error: Optional[Callable[[BaseException, Dict[str, Any]], None]] = None,
+                 poll_ms: int = 100):
+        self.widget = widget
+        self.fn = fn
+        self.on_result = on_result
+        self.on_progress = on_progress
+        self.on_error = on_error
+        self.poll_ms = int(poll_ms)
+        self._with_progress = accepts_progress(fn)
+        self._events: "queue.Queue[Tuple[str, int, Any]]" = queue.Queue()
+        self._cv = threading.Condition()
+        self._seq = 0                                   # 最新の依頼番号
+        self._pending: Optional[Tuple[int, Dict[str, Any]]] = None
+        self._running: Optional[int] = None
+        self._kw: Dict[int, Dict[str, Any]] = {}
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._polling = False
+    # -- main thread ------------------------------------------------------------
+    @property
+    def busy(self) -> bool:
+        with self._cv:
+            return self._running is not None or self._pending is not None
+    def submit(self, **kw: Any) -> int:
+        """再計画を依頼（実行中 / 待ちの依頼は superseded になる）。依頼番号を返す"""
+        with self._cv:
+            if self._closed:
+                raise RuntimeError("ReplanService is shut down")
+            self._seq += 1
+            seq = self._seq
+            if self._pending is not None:
+                self._events.put(("superseded", self._pending[0], None))
+            self._pending = (seq, dict(kw))
+            self._kw[seq] = dict(kw)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="pysi-replan", daemon=True)
+                self._thread.start()
+            self._cv.notify()
+        self._schedule_poll()
+        return seq
+    def cancel(self) -> None:
+        """待ちの依頼を取り消し、実行中の依頼も superseded 扱いにする"""
+        with self._cv:
+            self._seq += 1
+            if self._pending is not None:
+                self._events.put(("superseded", self._pending[0], None))
+                self._pending = None
+    def shutdown(self) -> None:
+        with self._cv:
+            self._closed = True
+            self._seq += 1
+            self._pending = None
+            self._cv.notify()
+    def _schedule_poll(self) -> None:
+        if not self._polling:
+            self._polling = True
+            self.widget.after(self.poll_ms, self._poll)
+    def _poll(self) -> None:
+        self._polling = False
+        # busy を先に見る（worker は event を積んでから _running を外すので、取りこぼさない）
+        busy = self.busy
+        try:
+            while True:
+                kind, seq, payload = self._events.get_nowait()
+                self._dispatch(kind, seq, payload)
+        except queue.Empty:
+            pass
+        if not self._closed and (busy or self.busy):
+            self._schedule_poll()
+    def _dispatch(self, kind: str, seq: int, payload: Any) -> None:
+        kw = self._kw.get(seq, {})
+        if kind in ("done", "error", "superseded"):
+            self._kw.pop(seq, None)
+        if seq != self._seq:
+            logger.info("[replan] #%d %s (superseded)", seq, kind)
+            return
+        try:
+            if kind == "done":
+                self.on_result(payload, kw)
+            elif kind == "error":
+                if self.on_error is not None:
+                    self.on_error(payload, kw)
+                else:
+                    logger.error("[replan] #%d failed: %s", seq, payload)
+            elif kind in ("start", "progress") and self.on_progress is not None:
+                self.on_progress(str(payload), kw)
+        except Exception:
+            logger.exception("[replan] %s callback failed", kind)
+    # -- worker thread ----------------------------------------------------------
+    def _is_current(self, seq: int) -> bool:
+        # _seq の読み出しだけなので lock なし（古い値を読んでも次の境目で止まる）
+        return seq == self._seq and not self._closed
+    def _worker(self) -> None:
+        while True:
+            with self._cv:
+                while self._pending is None and not self._closed:
+                    self._cv.wait()
+                if self._closed:
+                    return
+                seq, kw = self._pending
+                self._pending = None
+                self._running = seq
+            self._run_one(seq, kw)
+            with self._cv:
+                self._running = None
+    def _run_one(self, seq: int, kw: Dict[str, Any]) -> None:
+        t0 = time.perf_counter()
+        events = self._events
+        def progress(msg: str) -> bool:
+            # False を返すと rerun_fn 側（WOMPipelineRunner）が次の段階に進まずに打ち切る
+            if not self._is_current(seq):
+                return False
+            events.put(("progress", seq, f"{msg} ({time.perf_counter() - t0:.1f}s)"))
+            return True
+        events.put(("start", seq, "start"))
+        try:
+            call_kw = dict(kw, progress=progress) if self._with_progress else kw
+            result = self.fn(**call_kw)
+        except BaseException as e:          # noqa: BLE001 - worker は落とさない
+            if not self._is_current(seq):
+                events.put(("superseded", seq, None))
+            else:
+                events.put(("error", seq, e))
+            return
+        events.put(("done" if self._is_current(seq) else "superseded", seq, result))
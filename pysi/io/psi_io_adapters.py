@@ -10,6 +10,7 @@ Step 4: Engine I/O Adapters for Global Weekly PSI Planner (SQLite × PlanNode)
 2) pSi → DB（計算結果の書き戻し）
    - lot_bucket テーブルへ S/CO/I/P を冪等UPSERT
    - 需要層・供給層どちらでもOK
+   - lot_bucket_fp の週ごと fingerprint と比べて、変わった週だけ書き換える
 前提スキーマ（抜粋）
 -------------------
 - calendar_iso(week_index PK, iso_year, iso_week, UNIQUE(iso_year, iso_week))
@@ -24,9 +25,12 @@ Step 4: Engine I/O Adapters for Global Weekly PSI Planner (SQLite × PlanNode)
 """
 from __future__ import annotations
 import ast
+import hashlib
 import json
 import sqlite3
+from contextlib import nullcontext
 from typing import Dict, List, Tuple, Optional
+from pysi.db.calendar_iso import weeks_count_cached
 # PSIバケツの並び（週ごとに [S, CO, I, P]）
 BUCKETS = ("S", "CO", "I", "P")
 BMAP = {"S": 0, "CO": 1, "I": 2, "P": 3}
@@ -153,6 +157,31 @@ def load_leaf_S_and_compute(
 # ----------------------------
 # pSi → DB : 計算結果の書き戻し
 # ----------------------------
+# 週ごとの fingerprint（差分書き戻し用）
+LOT_BUCKET_FP_SQL = """
+CREATE TABLE IF NOT EXISTS lot_bucket_fp (
+  scenario_id INTEGER NOT NULL,
+  layer       TEXT NOT NULL CHECK(layer IN ('demand','supply')),
+  node_id     INTEGER NOT NULL,
+  product_id  INTEGER NOT NULL,
+  week_index  INTEGER NOT NULL,
+  fp          INTEGER NOT NULL,
+  PRIMARY KEY (scenario_id, layer, node_id, product_id, week_index),
+  FOREIGN KEY (scenario_id) REFERENCES scenario(id) ON DELETE CASCADE,
+  FOREIGN KEY (node_id) REFERENCES node(id) ON DELETE CASCADE,
+  FOREIGN KEY (product_id) REFERENCES product(id) ON DELETE CASCADE
+) WITHOUT ROWID
+"""
+def _ensure_fp_table(conn: sqlite3.Connection) -> None:
+    conn.execute(LOT_BUCKET_FP_SQL)
+def week_fingerprint(buckets) -> int:
+    """[S, CO, I, P] 1 週分の fingerprint（lot 順も含む 64bit 符号付き整数）"""
+    h = hashlib.blake2b(digest_size=8)
+    for lots in buckets:
+        if lots:
+            h.update("\x1f".join(lots).encode("utf-8"))
+        h.update(b"\x1e")
+    return int.from_bytes(h.digest(), "big", signed=True)
 def write_layer_to_lot_bucket(
     conn: sqlite3.Connection,
     *,
@@ -160,11 +189,15 @@ def write_layer_to_lot_bucket(
     node_obj,
     product_name: str,
     layer: str = "demand",
-    replace_slice: bool = True,  # Trueなら対象スライスをDELETEしてから挿入（冪等・再現性◎）
+    replace_slice: bool = True,  # Trueなら対象スライスを置換（冪等・再現性◎）
+    diff: bool = True,           # Trueなら fingerprint が変わった週だけ DELETE→INSERT
+    commit: bool = True,         # Falseなら commit は呼び出し側（複数 pair をまとめて commit する writer 用）
 ) -> int:
     """
     指定ノード/製品/層の pSi（バケツ S/CO/I/P）を lot_bucket に書き戻す。
-    戻り値：挿入した行数
+    replace_slice=True のとき、週ごとの fingerprint を lot_bucket_fp と比べ、
+    変わった週だけ入れ替える（fingerprint が無いスライスは従来どおり丸ごと置換）。
+    戻り値：スライスの行数（書き換えなかった週の lot も含む）
     """
     if layer not in ("demand", "supply"):
         raise ValueError("layer must be 'demand' or 'supply'")
@@ -176,7 +209,7 @@ def write_layer_to_lot_bucket(
         raise ValueError(f"{layer} PSI not initialized on node '{node_name}'")
     # --- 安全パッチ：calendar 週数に合わせて週配列を正規化し、
     #                 各週の [S,CO,I,P] を 4 バケツにパディングする ---
-    weeks = conn.execute("SELECT COUNT(*) FROM calendar_iso").fetchone()[0] or 0
+    weeks = weeks_count_cached(conn)
     def _normalize_psi(seq, weeks: int) -> List[List[List[str]]]:
         """
         外側：週配列の長さを calendar に合わせる
@@ -206,24 +239,47 @@ def write_layer_to_lot_bucket(
         return out
     psi_norm = _normalize_psi(psi, weeks)
     # --- 安全パッチ ここまで ---
-    # 対象スライスを丸ごと置換（冪等・決定性のため推奨）
-    if replace_slice:
-        with conn:
-            conn.execute(
-                """DELETE FROM lot_bucket
-                   WHERE scenario_id=? AND layer=? AND node_id=? AND product_id=?""",
-                (scenario_id, layer, node_id, product_id),
-            )
-    # INSERT（ON CONFLICT DO NOTHING）
+    slice_key = (scenario_id, layer, node_id, product_id)
+    total = sum(len(lots) for buckets in psi_norm for lots in buckets)
+    _ensure_fp_table(conn)
+    fps = [week_fingerprint(buckets) for buckets in psi_norm]
+    stored: Dict[int, int] = {}
+    if replace_slice and diff:
+        stored = dict(conn.execute(
+            """SELECT week_index, fp FROM lot_bucket_fp
+               WHERE scenario_id=? AND layer=? AND node_id=? AND product_id=?""",
+            slice_key,
+        ).fetchall())
+    full = replace_slice and not stored
+    if full or not replace_slice:
+        target_weeks = list(range(weeks))
+    else:
+        target_weeks = [w for w in range(weeks) if stored.get(w) != fps[w]]
+    stale_weeks = [w for w in stored if w >= weeks]  # calendar が縮んだ分
     rows = []
-    for w, buckets in enumerate(psi_norm):
+    for w in target_weeks:
+        buckets = psi_norm[w]
         for key, idx in BMAP.items():
             lots = buckets[idx]  # ← ここで IndexError は起きない（必ず4要素）
             if not lots:
                 continue
             for lot in lots:
                 rows.append((scenario_id, layer, node_id, product_id, int(w), key, lot))
-    with conn:
+    with (conn if commit else nullcontext()):
+        if full:
+            # fingerprint が無い → 対象スライスを丸ごと置換
+            conn.execute(
+                """DELETE FROM lot_bucket
+                   WHERE scenario_id=? AND layer=? AND node_id=? AND product_id=?""",
+                slice_key,
+            )
+        elif replace_slice:
+            conn.executemany(
+                """DELETE FROM lot_bucket
+                   WHERE scenario_id=? AND layer=? AND node_id=? AND product_id=? AND week_index=?""",
+                [slice_key + (w,) for w in target_weeks + stale_weeks],
+            )
+        # INSERT（ON CONFLICT DO NOTHING）
         conn.executemany(
             """INSERT INTO lot_bucket
                (scenario_id, layer, node_id, product_id, week_index, bucket, lot_id)
@@ -232,7 +288,29 @@ def write_layer_to_lot_bucket(
                DO NOTHING""",
             rows,
         )
-    return len(rows)
+        if replace_slice:
+            if stale_weeks:
+                conn.executemany(
+                    """DELETE FROM lot_bucket_fp
+                       WHERE scenario_id=? AND layer=? AND node_id=? AND product_id=? AND week_index=?""",
+                    [slice_key + (w,) for w in stale_weeks],
+                )
+            conn.executemany(
+                """INSERT INTO lot_bucket_fp
+                   (scenario_id, layer, node_id, product_id, week_index, fp)
+                   VALUES(?,?,?,?,?,?)
+                   ON CONFLICT(scenario_id, layer, node_id, product_id, week_index)
+                   DO UPDATE SET fp=excluded.fp""",
+                [slice_key + (w, fps[w]) for w in target_weeks],
+            )
+        else:
+            # 追記した分は fingerprint と一致しなくなる → 次回は丸ごと置換
+            conn.execute(
+                """DELETE FROM lot_bucket_fp
+                   WHERE scenario_id=? AND layer=? AND node_id=? AND product_id=?""",
+                slice_key,
+            )
+    return total
 def write_both_layers(
     conn: sqlite3.Connection,
     *,
@@ -240,6 +318,7 @@ def write_both_layers(
     node_obj,
     product_name: str,
     replace_slice: bool = True,
+    commit: bool = True,
 ) -> Tuple[int, int]:
     """
     demand/supply 両レイヤを書き戻すユーティリティ。
@@ -247,11 +326,11 @@ def write_both_layers(
     """
     d = write_layer_to_lot_bucket(
         conn, scenario_id=scenario_id, node_obj=node_obj, product_name=product_name,
-        layer="demand", replace_slice=replace_slice
+        layer="demand", replace_slice=replace_slice, commit=commit
     )
     s = write_layer_to_lot_bucket(
         conn, scenario_id=scenario_id, node_obj=node_obj, product_name=product_name,
-        layer="supply", replace_slice=replace_slice
+        layer="supply", replace_slice=replace_slice, commit=commit
     )
     return d, s
 # ----------------------------
@@ -313,6 +392,6 @@ print("wrote:", d_rows, s_rows, "rows")
 #
 #lot→S の復元は決定的順序（ORDER BY iso_year, iso_week, lot_id）。
 #
-#書き戻しは スライスDELETE→INSERT で冪等・再実行安全。
+#書き戻しは 変わった週だけ DELETE→INSERT（fingerprint 比較）で冪等・再実行安全。
 #
 #休暇週・安全在庫の扱いは、既存の calcS2P() / propagate_postorder_with_calcP2S() に委譲。
@@ -209,11 +209,16 @@ def export_product_trees(
 
 # ---------------------------------------------------------------------
 # 3) psi_events.parquet の export
-#    bucket: "P","CO","S","I"
+#    bucket: "S","CO","I","P"（psi[w] = [S, CO, I, P] の並び。loader の BUCKET_IDX と同じ）
 #    seq   : 週内順序（list index）
 # ---------------------------------------------------------------------
 
-BUCKET_CODES = ["P", "CO", "S", "I"]  # ここは実装に合わせて並び替えてOK
+BUCKET_CODES = ["S", "CO", "I", "P"]
+
+PSI_EVENT_COLUMNS = [
+    "product_name", "bound", "node_name", "iso_index",
+    "bucket", "seq", "lot_id", "qty", "fifo_mode",
+]
 
 
 def collect_psi_events(
@@ -225,6 +230,7 @@ def collect_psi_events(
     各 product OUTツリーから psi4*** を走査し、
     ロング形式の DataFrame を返す。
     fifo_mode は将来拡張用（今は値をそのまま保持するだけ）。
+    ※ 全件をメモリに載せるので、ファイル出力は export_psi_events_parquet（streaming）を使う。
     """
     records: List[dict] = []
 
@@ -261,15 +267,166 @@ def collect_psi_events(
     return pd.DataFrame.from_records(records)
 
 
+def _psi_events_schema():
+    import pyarrow as pa
+
+    dict_str = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("product_name", dict_str),
+        ("bound", dict_str),
+        ("node_name", dict_str),
+        ("iso_index", pa.int32()),
+        ("bucket", dict_str),
+        ("seq", pa.int32()),
+        ("lot_id", pa.string()),
+        ("qty", pa.float64()),
+        ("fifo_mode", dict_str),
+    ])
+
+
+def _node_event_columns(psi, weeks: int):
+    """
+    1 node 分の psi4demand を列にする。
+    戻り値: (lot_ids, iso_index, bucket_idx, seq)  / イベントが無ければ None
+    """
+    import numpy as np
+
+    n_weeks = min(len(psi), weeks)
+    lot_ids: List[str] = []
+    sizes = np.zeros(n_weeks * 4, dtype=np.int64)
+    slot = 0
+    for w in range(n_weeks):
+        week = psi[w]
+        for b in range(4):
+            lots = week[b] if b < len(week) else None
+            if lots:
+                sizes[slot] = len(lots)
+                lot_ids.extend(lots)
+            slot += 1
+    total = len(lot_ids)
+    if total == 0:
+        return None
+    slots = np.repeat(np.arange(n_weeks * 4, dtype=np.int64), sizes)
+    starts = np.cumsum(sizes) - sizes
+    seq = np.arange(total, dtype=np.int64) - starts[slots]
+    return (lot_ids, (slots // 4).astype(np.int32), (slots % 4).astype(np.int32),
+            seq.astype(np.int32))
+
+
+def iter_psi_event_batches(
+    prod_roots_out: Dict[str, Optional[Node]],
+    weeks: int,
+    fifo_mode: str = "FIFO",
+):
+    """
+    (product, node) ごとに psi_events の pyarrow.RecordBatch を yield する。
+    product/node/bound/fifo_mode/bucket は dictionary 列（1 batch 内では定数 or 4 値）。
+    """
+    import numpy as np
+    import pyarrow as pa
+
+    schema = _psi_events_schema()
+    bucket_dict = pa.array(BUCKET_CODES, type=pa.string())
+
+    def _const(value: str, n: int):
+        return pa.DictionaryArray.from_arrays(
+            pa.array(np.zeros(n, dtype=np.int32)), pa.array([value], type=pa.string()))
+
+    for product, root in prod_roots_out.items():
+        if not root:
+            continue
+        for node in walk_nodes(root):
+            psi = getattr(node, "psi4demand", None)
+            if psi is None:
+                continue
+            cols = _node_event_columns(psi, weeks)
+            if cols is None:
+                continue
+            lot_ids, iso_index, bucket_idx, seq = cols
+            n = len(lot_ids)
+            yield pa.RecordBatch.from_arrays([
+                _const(product, n),
+                _const("OUT", n),
+                _const(node.name, n),
+                pa.array(iso_index, type=pa.int32()),
+                pa.DictionaryArray.from_arrays(pa.array(bucket_idx), bucket_dict),
+                pa.array(seq, type=pa.int32()),
+                pa.array(lot_ids, type=pa.string()),
+                pa.array(np.ones(n, dtype=np.float64)),  # lot=1単位
+                _const(fifo_mode, n),
+            ], schema=schema)
+
+
+class _HashingFile:
+    """書き込んだ bytes をそのまま SHA-256 に流す file-like（parquet writer 用）"""
+
+    def __init__(self, f) -> None:
+        self._f = f
+        self.sha256 = hashlib.sha256()
+        self._pos = 0
+        self.closed = False
+
+    def write(self, b) -> int:
+        self.sha256.update(b)
+        self._pos += len(b)
+        return self._f.write(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        self._f.flush()
+
+    def writable(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        self.closed = True
+
+
 def export_psi_events_parquet(
     prod_roots_out: Dict[str, Optional[Node]],
     weeks: int,
     path: str,
     fifo_mode: str = "FIFO",
-) -> None:
-    df = collect_psi_events(prod_roots_out, weeks, fifo_mode=fifo_mode)
+    digests: Optional[Dict[str, str]] = None,
+) -> int:
+    """
+    psi_events.parquet を (product, node) ごとの row group で streaming 出力する。
+    全レコードの list / DataFrame は作らない。row group ごとに列統計を書くので、
+    読み側は product_name / node_name で row group を pruning できる。
+    digests を渡すと、書き出しながら計算した内容の SHA-256 を digests[path] に入れる
+    （state manifest 用。書き終えたファイルを読み直さない）。
+    pyarrow が無い環境では従来の DataFrame.to_parquet にフォールバック。
+    戻り値: 書き出したイベント行数
+    """
     os.makedirs(os.path.dirname(path), exist_ok=True)
-    df.to_parquet(path, index=False)
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        df = collect_psi_events(prod_roots_out, weeks, fifo_mode=fifo_mode)
+        df.to_parquet(path, index=False)
+        return len(df)
+
+    rows = 0
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as raw:
+        sink = _HashingFile(raw)
+        with pq.ParquetWriter(
+            pa.PythonFile(sink, mode="w"),
+            _psi_events_schema(),
+            use_dictionary=["product_name", "bound", "node_name", "bucket", "fifo_mode"],
+            write_statistics=True,
+            compression="snappy",
+        ) as writer:
+            for batch in iter_psi_event_batches(prod_roots_out, weeks, fifo_mode=fifo_mode):
+                writer.write_batch(batch, row_group_size=batch.num_rows)
+                rows += batch.num_rows
+    os.replace(tmp, path)
+    if digests is not None:
+        digests[os.path.abspath(path)] = sink.sha256.hexdigest()
+    return rows
 
 
 # ---------------------------------------------------------------------
@@ -284,12 +441,101 @@ def write_json(path: str, payload: dict, default_schema: str) -> None:
         json.dump(p, f, ensure_ascii=False, indent=2)
 
 
-def compute_state_hash(base_dir: str) -> str:
-    """base_dir 以下の全ファイルから SHA-256 を計算する。"""
+STATE_HASH_FILE = "state_hash.txt"
+STATE_MANIFEST_FILE = "state_manifest.json"
+_HASH_EXCLUDE = {STATE_HASH_FILE, STATE_MANIFEST_FILE}
+
+LEGACY_HASH_PREFIX = "sha256:"      # 全ファイル内容を連結した旧 hash
+MANIFEST_HASH_PREFIX = "sha256m:"   # manifest（ファイルごとの digest）から作る hash
+
+
+def _iter_state_files(base_dir: str):
+    """hash 対象ファイルを (rel, full) で rel 順に返す。"""
+    out = []
+    for root, _, files in os.walk(base_dir):
+        for name in files:
+            if name in _HASH_EXCLUDE or name.endswith(".tmp"):
+                continue
+            full = os.path.join(root, name)
+            rel = os.path.relpath(full, base_dir).replace("\\", "/")
+            out.append((rel, full))
+    out.sort()
+    return out
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_state_manifest(base_dir: str) -> dict:
+    """state_manifest.json を読む（無い・壊れている場合は空の manifest）。"""
+    path = os.path.join(base_dir, STATE_MANIFEST_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {"schema_version": "psi_state_manifest_v1", "files": {}}
+    manifest.setdefault("files", {})
+    return manifest
+
+
+def update_state_manifest(
+    base_dir: str,
+    manifest: Optional[dict] = None,
+    digests: Optional[Dict[str, str]] = None,
+) -> dict:
+    """
+    base_dir 以下のファイルについて manifest を最新化する（ファイルには書かない）。
+    size / mtime_ns が manifest と同じファイルは digest を再利用し、
+    digests（絶対パス → 書き出し時に計算済みの digest）にあるものはそれを使う。
+    それ以外のファイルだけ読み直して hash する。
+    """
+    old = (manifest if manifest is not None else load_state_manifest(base_dir)).get("files", {})
+    digests = digests or {}
+    files = {}
+    for rel, full in _iter_state_files(base_dir):
+        st = os.stat(full)
+        prev = old.get(rel)
+        digest = digests.get(os.path.abspath(full))
+        if digest is None:
+            if prev and prev.get("size") == st.st_size and prev.get("mtime_ns") == st.st_mtime_ns:
+                digest = prev["sha256"]
+            else:
+                digest = _file_sha256(full)
+        files[rel] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+    return {"schema_version": "psi_state_manifest_v1", "files": files}
+
+
+def state_hash_from_manifest(manifest: dict) -> str:
+    """manifest の (rel, digest) 列から top-level hash を作る。"""
+    h = hashlib.sha256()
+    for rel in sorted(manifest.get("files", {})):
+        h.update(rel.encode("utf-8"))
+        h.update(b"\0")
+        h.update(manifest["files"][rel]["sha256"].encode("ascii"))
+        h.update(b"\n")
+    return MANIFEST_HASH_PREFIX + h.hexdigest()
+
+
+def compute_state_hash(base_dir: str, legacy: bool = False) -> str:
+    """
+    base_dir 以下の全ファイルから state hash を計算する。
+    既定は manifest 方式（変わったファイルだけ読み直す）。
+    legacy=True なら従来どおり全ファイル内容を連結した SHA-256（"sha256:..."）。
+    """
+    if not legacy:
+        return state_hash_from_manifest(update_state_manifest(base_dir))
     h = hashlib.sha256()
     for root, _, files in os.walk(base_dir):
         for name in sorted(files):
-            if name == "state_hash.txt":
+            if name in _HASH_EXCLUDE:
                 continue
             full = os.path.join(root, name)
             rel = os.path.relpath(full, base_dir).replace("\\", "/")
@@ -300,11 +546,15 @@ def compute_state_hash(base_dir: str) -> str:
                     if not chunk:
                         break
                     h.update(chunk)
-    return "sha256:" + h.hexdigest()
+    return LEGACY_HASH_PREFIX + h.hexdigest()
 
 
-def write_state_hash(base_dir: str, path: str) -> str:
-    sh = compute_state_hash(base_dir)
+def write_state_hash(base_dir: str, path: str,
+                     digests: Optional[Dict[str, str]] = None) -> str:
+    """manifest を更新して state_manifest.json と state_hash.txt を書く。"""
+    manifest = update_state_manifest(base_dir, digests=digests)
+    sh = state_hash_from_manifest(manifest)
+    write_json(os.path.join(base_dir, STATE_MANIFEST_FILE), manifest, "psi_state_manifest_v1")
     os.makedirs(os.path.dirname(path), exist_ok=True)
     with open(path, "w", encoding="utf-8") as f:
         f.write(sh + "\n")
@@ -351,12 +601,14 @@ def export_psi_state(
         os.path.join(base, "product_tree_inbound.json"),
     )
 
-    # PSI events
+    # PSI events（内容の digest は書き出しながら計算）
+    digests: Dict[str, str] = {}
     export_psi_events_parquet(
         prod_roots_out,
         weeks,
         os.path.join(base, "psi_events.parquet"),
         fifo_mode=fifo_mode,
+        digests=digests,
     )
 
     # parameters / metadata
@@ -364,5 +616,5 @@ def export_psi_state(
     write_json(os.path.join(base, "metadata.json"), meta, "psi_metadata_v1")
 
     # state_hash
-    state_hash = write_state_hash(base, os.path.join(base, "state_hash.txt"))
+    state_hash = write_state_hash(base, os.path.join(base, STATE_HASH_FILE), digests=digests)
     return state_hash
@@ -3,9 +3,10 @@ from __future__ import annotations
 
 import os
 import json
-from dataclasses import dataclass
-from typing import Dict, Optional, List, Tuple, Iterable
+from dataclasses import dataclass, field
+from typing import Dict, Optional, List, Set, Tuple, Iterable
 
+import numpy as np
 import pandas as pd
 
 from pysi.network.node_base import Node
@@ -19,6 +20,9 @@ except ImportError:  # CSV版など
 
 BUCKET_IDX = {"S": 0, "CO": 1, "I": 2, "P": 3}
 
+_REQUIRED_EVENT_COLUMNS = {"product_name", "node_name", "iso_index", "bucket", "lot_id"}
+_EVENT_READ_COLUMNS = ["product_name", "node_name", "iso_index", "bucket", "seq", "lot_id"]
+
 
 # ---------------------------------------------------------
 # 共通ユーティリティ
@@ -283,16 +287,193 @@ def _build_name_map_per_product(prod_tree_dict: Dict[str, PlanNode]) -> Dict[str
     return result
 
 
+def _parquet_max_iso_index(pf) -> Optional[int]:
+    """row group statistics から iso_index の最大値を取る（統計が欠けていれば None）"""
+    md = pf.metadata
+    if md.num_row_groups == 0:
+        return -1
+    rg0 = md.row_group(0)
+    col = next((j for j in range(rg0.num_columns)
+                if rg0.column(j).path_in_schema == "iso_index"), None)
+    if col is None:
+        return None
+    max_w = -1
+    for i in range(md.num_row_groups):
+        st = md.row_group(i).column(col).statistics
+        if st is None or not st.has_min_max:
+            return None
+        max_w = max(max_w, int(st.max))
+    return max_w
+
+
+def _events_filters(products, nodes) -> Optional[list]:
+    filters = []
+    if products is not None:
+        filters.append(("product_name", "in", list(products)))
+    if nodes is not None:
+        filters.append(("node_name", "in", list(nodes)))
+    return filters or None
+
+
+def _arrow_codes(col) -> Tuple[np.ndarray, list]:
+    """dictionary 列 → (codes, values)。null は values 末尾の None を指す"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    arr = col.combine_chunks() if isinstance(col, pa.ChunkedArray) else col
+    if not pa.types.is_dictionary(arr.type):
+        arr = pc.dictionary_encode(arr)
+    values = arr.dictionary.to_pylist()
+    codes = pc.fill_null(arr.indices, len(values)).to_numpy(zero_copy_only=False)
+    return codes.astype(np.int64, copy=False), values + [None]
+
+
+def _pandas_codes(series: pd.Series) -> Tuple[np.ndarray, list]:
+    codes, uniques = pd.factorize(series)
+    values = list(uniques)
+    codes = np.where(codes < 0, len(values), codes).astype(np.int64)
+    return codes, values + [None]
+
+
+def _read_psi_events(path: str, products, nodes):
+    """
+    psi_events.parquet を必要な列・行だけ読む。
+    戻り値: (cols, take_lots, to_frame, max_week)
+      cols      : product/node/bucket の (codes, values)、iso_index/seq の numpy 配列
+      take_lots : 行番号配列 → lot_id list
+      to_frame  : 読んだ行の DataFrame を作る関数
+      max_week  : ファイル全体の iso_index 最大値（空なら -1）
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:  # pyarrow 無し → pandas（fastparquet 等）で読む
+        pq = None
+
+    if pq is not None:
+        pf = pq.ParquetFile(path)
+        present = set(pf.schema_arrow.names)
+        if pf.metadata.num_rows == 0:
+            return None, None, lambda: pf.read().to_pandas(), -1
+        max_week = _parquet_max_iso_index(pf)
+        _check_event_columns(present)
+        columns = [c for c in _EVENT_READ_COLUMNS if c in present]
+        # product/node で row group を pruning、列は projection
+        table = pq.read_table(path, columns=columns,
+                              filters=_events_filters(products, nodes))
+        table = table.unify_dictionaries()
+        if max_week is None:
+            import pyarrow.compute as pc
+            iso_all = pq.read_table(path, columns=["iso_index"]).column("iso_index")
+            max_week = int(pc.max(iso_all).as_py())
+        cols = {
+            "product_name": _arrow_codes(table.column("product_name")),
+            "node_name": _arrow_codes(table.column("node_name")),
+            "bucket": _arrow_codes(table.column("bucket")),
+            "iso_index": table.column("iso_index").to_numpy().astype(np.int64, copy=False),
+            "seq": (table.column("seq").to_numpy().astype(np.int64, copy=False)
+                    if "seq" in present else None),
+        }
+        lot_col = table.column("lot_id")
+        return cols, (lambda rows: lot_col.take(rows).to_pylist()), table.to_pandas, max_week
+
+    df_all = pd.read_parquet(path)
+    if df_all.empty:
+        return None, None, lambda: df_all, -1
+    _check_event_columns(set(df_all.columns))
+    max_week = int(df_all["iso_index"].max())
+    mask = np.ones(len(df_all), dtype=bool)
+    if products is not None:
+        mask &= df_all["product_name"].isin(list(products)).to_numpy()
+    if nodes is not None:
+        mask &= df_all["node_name"].isin(list(nodes)).to_numpy()
+    df = df_all[mask].reset_index(drop=True)
+    cols = {
+        "product_name": _pandas_codes(df["product_name"]),
+        "node_name": _pandas_codes(df["node_name"]),
+        "bucket": _pandas_codes(df["bucket"]),
+        "iso_index": df["iso_index"].to_numpy().astype(np.int64),
+        "seq": df["seq"].to_numpy().astype(np.int64) if "seq" in df.columns else None,
+    }
+    lot_arr = df["lot_id"].to_numpy(dtype=object)
+    return cols, (lambda rows: lot_arr[rows].tolist()), (lambda: df), max_week
+
+
+def _check_event_columns(present) -> None:
+    # 最小必須列チェック
+    missing = _REQUIRED_EVENT_COLUMNS - set(present)
+    if missing:
+        raise ValueError(f"psi_events.parquet is missing columns: {missing}")
+
+
+def _assign_events(cols, take_lots, name_map, weeks: int) -> int:
+    """
+    イベントを (product, node, iso_index, bucket, seq) で 1 回 sort し、
+    同じ (node, week, bucket) の連続区間を psi4demand[w][b] に slice で入れる。
+    戻り値: 付与した lot 数
+    """
+    p_codes, p_values = cols["product_name"]
+    n_codes, n_values = cols["node_name"]
+    b_codes, b_values = cols["bucket"]
+    iso = cols["iso_index"]
+    if len(iso) == 0:
+        return 0
+
+    # (product, node) → PlanNode は組み合わせごとに 1 回だけ引く
+    pair = p_codes * len(n_values) + n_codes
+    uniq_pair, node_uid = np.unique(pair, return_inverse=True)
+    node_uid = node_uid.reshape(-1)
+    uid_nodes = []
+    for key in uniq_pair.tolist():
+        nm2node = name_map.get(p_values[key // len(n_values)])
+        uid_nodes.append(nm2node.get(n_values[key % len(n_values)]) if nm2node else None)
+    uid_ok = np.array([n is not None for n in uid_nodes], dtype=bool)
+
+    # bucket コードは従来どおり None → "S"、大文字化して解決（未知は捨てる）
+    b_map = np.array([BUCKET_IDX.get(str(v or "S").upper(), -1) for v in b_values],
+                     dtype=np.int64)
+    bucket = b_map[b_codes]
+
+    keep = np.flatnonzero(uid_ok[node_uid] & (iso >= 0) & (iso < weeks) & (bucket >= 0))
+    if len(keep) == 0:
+        return 0
+
+    uid = node_uid[keep]
+    w = iso[keep]
+    b = bucket[keep]
+    seq = cols["seq"][keep] if cols["seq"] is not None else np.zeros(len(keep), dtype=np.int64)
+    # 安定 sort: 同じ seq はファイル順のまま
+    order = np.lexsort((seq, b, w, uid))
+    rows = keep[order]
+    lots = take_lots(rows)
+
+    slot = (uid[order] * weeks + w[order]) * 4 + b[order]
+    starts = np.flatnonzero(np.r_[True, slot[1:] != slot[:-1]])
+    ends = np.r_[starts[1:], len(slot)]
+    slot_l = slot[starts].tolist()
+    for s, e, sl in zip(starts.tolist(), ends.tolist(), slot_l):
+        u, wb = divmod(sl, weeks * 4)
+        uid_nodes[u].psi4demand[wb // 4][wb % 4] = lots[s:e]
+    return len(rows)
+
+
 def attach_psi_events_from_parquet(
     base_dir: str,
     prod_tree_dict_OT: Dict[str, PlanNode],
     weeks_hint: Optional[int] = None,
     logger=None,
+    products: Optional[Iterable[str]] = None,
+    nodes: Optional[Iterable[str]] = None,
+    return_df: bool = True,
 ) -> Optional[pd.DataFrame]:
     """
     psi_state/psi_events.parquet を読み込み、
     OUT側 product ツリーに psi4demand[w][bucket_idx] を復元する。
 
+    products / nodes を渡すとその分だけ読む（parquet の row group pruning）。
+    psi4demand を初期化するのは対象 product の node だけ。
+    週数はファイル全体の iso_index 最大値から決める（filter の有無で変わらない）。
+    return_df=False なら DataFrame は作らず None を返す。
+
     ※ inbound 側にも付与したければ、必要に応じて拡張可能。
     """
     psi_dir = os.path.join(base_dir, "psi_state")
@@ -302,65 +483,45 @@ def attach_psi_events_from_parquet(
             logger.warning("[psi_state_loader] psi_events.parquet not found; PSI attach skipped")
         return None
 
-    df = pd.read_parquet(path)
+    if products is not None:
+        products = [p for p in products if p in prod_tree_dict_OT]
+    target = (prod_tree_dict_OT if products is None
+              else {p: prod_tree_dict_OT[p] for p in products})
+
+    if nodes is not None:
+        nodes = list(nodes)
+    cols, take_lots, to_frame, max_index = _read_psi_events(path, products, nodes)
 
-    if df.empty:
+    if cols is None:
         if logger:
             logger.info("[psi_state_loader] psi_events.parquet is empty; PSI attach skipped")
-        return df
-
-    # 最小必須列チェック
-    required_cols = {"product_name", "node_name", "iso_index", "bucket", "lot_id"}
-    missing = required_cols - set(df.columns)
-    if missing:
-        raise ValueError(f"psi_events.parquet is missing columns: {missing}")
+        return to_frame() if return_df else None
 
     # 週数決定
-    max_week = int(df["iso_index"].max()) + 1
+    max_week = max_index + 1
     weeks = weeks_hint if weeks_hint and weeks_hint > max_week else max_week
 
     # product -> node_name -> PlanNode
-    name_map = _build_name_map_per_product(prod_tree_dict_OT)
+    name_map = _build_name_map_per_product(target)
 
-    # まず全ノードの psi4demand を初期化
-    for prod, root in prod_tree_dict_OT.items():
+    # まず対象ノードの psi4demand を初期化
+    only = set(nodes) if nodes is not None else None
+    for prod, root in target.items():
         if not root:
             continue
         for n in _walk_nodes(root):
+            if only is not None and n.name not in only:
+                continue
             n.psi4demand = [[[] for _ in range(4)] for __ in range(weeks)]
 
-    # イベントを流し込む
-    # CO/FIFO順位を表す seq 列などがあれば、あとで使えるようにそのまま残す。
-    for rec in df.itertuples(index=False):
-        prod = getattr(rec, "product_name")
-        node_nm = getattr(rec, "node_name")
-        w = int(getattr(rec, "iso_index"))
-        bucket_code = str(getattr(rec, "bucket") or "S").upper()
-        lot_id = getattr(rec, "lot_id")
-        qty = getattr(rec, "qty", 1.0)
-
-        nm2node = name_map.get(prod)
-        if not nm2node:
-            continue
-        node = nm2node.get(node_nm)
-        if not node:
-            continue
-        if not (0 <= w < weeks):
-            continue
-
-        idx = BUCKET_IDX.get(bucket_code)
-        if idx is None:
-            continue
-
-        # 今は lot_id をそのまま push（qty は別途集計用に使う想定）
-        node.psi4demand[w][idx].append(lot_id)
-
-        # 将来: seq や FIFO/LIFO制御したければ、ここで順序を意識
+    # イベントを流し込む（CO/FIFO順位は seq 順）
+    attached = _assign_events(cols, take_lots, name_map, weeks)
 
     if logger:
-        logger.info(f"[psi_state_loader] PSI events attached for {len(prod_tree_dict_OT)} products, weeks={weeks}")
+        logger.info(f"[psi_state_loader] PSI events attached for {len(target)} products, "
+                    f"lots={attached}, weeks={weeks}")
 
-    return df
+    return to_frame() if return_df else None
 
 
 # ---------------------------------------------------------
@@ -392,20 +553,23 @@ def load_state_hash(base_dir: str) -> Optional[str]:
 def verify_state_hash(base_dir: str, logger=None) -> Tuple[Optional[str], Optional[str]]:
     """
     state_hash.txt と 実計算値を比較する。
+    manifest 方式の hash なら size / mtime が変わったファイルだけ読み直す。
+    旧形式（"sha256:..."）の hash は従来どおり全ファイルを読んで比較する。
     戻り値: (stored_hash, computed_hash)
     """
     stored = load_state_hash(base_dir)
 
     try:
         # 保存側の compute_state_hash を再利用
-        from pysi.io.psi_state_io import compute_state_hash
+        from pysi.io.psi_state_io import compute_state_hash, LEGACY_HASH_PREFIX
     except Exception:
         if logger:
             logger.warning("[psi_state_loader] compute_state_hash not available; skip verification")
         return stored, None
 
     psi_dir = os.path.join(base_dir, "psi_state")
-    computed = compute_state_hash(psi_dir)
+    legacy = bool(stored and stored.startswith(LEGACY_HASH_PREFIX))
+    computed = compute_state_hash(psi_dir, legacy=legacy)
 
     if logger:
         if stored and computed and stored != computed:
@@ -431,15 +595,36 @@ class PsiState:
     metadata: dict
     state_hash: Optional[str] = None
     psi_events_df: Optional[pd.DataFrame] = None
+    psi_attached: Set[str] = field(default_factory=set)
 
     @property
     def product_name_list(self) -> List[str]:
         return sorted(self.prod_tree_dict_OT.keys())
 
+    def ensure_psi_attached(self, product_name: str, logger=None) -> bool:
+        """
+        product_name の psi4demand が未付与なら psi_events.parquet から付与する（lazy attach）。
+        付与した場合 True。
+        """
+        if product_name in self.psi_attached or product_name not in self.prod_tree_dict_OT:
+            return False
+        attach_psi_events_from_parquet(
+            self.base_dir, self.prod_tree_dict_OT,
+            weeks_hint=self.parameters.get("calendar", {}).get("weeks"),
+            logger=logger, products=[product_name], return_df=False,
+        )
+        self.psi_attached.add(product_name)
+        return True
+
 
-def load_psi_state(base_dir: str, attach_psi: bool = True, logger=None) -> PsiState:
+def load_psi_state(base_dir: str, attach_psi: bool = True, logger=None,
+                   products: Optional[Iterable[str]] = None,
+                   keep_events_df: bool = False) -> PsiState:
     """
     psi_state ディレクトリ一式から PsiState を組み立てるメイン関数。
+    products を渡すとその product の PSI だけ付与し、残りは
+    PsiState.ensure_psi_attached(product) で必要になった時に付与する。
+    keep_events_df=True なら読んだ events を psi_events_df に残す。
     """
     # 1) 物理ツリー
     physical_out, physical_in = load_physical_trees(base_dir)
@@ -454,8 +639,13 @@ def load_psi_state(base_dir: str, attach_psi: bool = True, logger=None) -> PsiSt
 
     # 4) PSI events（必要なら付与）
     df = None
+    attached: Set[str] = set()
     if attach_psi and prod_ot:
-        df = attach_psi_events_from_parquet(base_dir, prod_ot, weeks_hint=params.get("calendar", {}).get("weeks"), logger=logger)
+        if products is not None:
+            products = [p for p in products if p in prod_ot]
+        df = attach_psi_events_from_parquet(base_dir, prod_ot, weeks_hint=params.get("calendar", {}).get("weeks"), logger=logger,
+                                            products=products, return_df=keep_events_df)
+        attached = set(prod_ot if products is None else products)
 
     state = PsiState(
         base_dir=base_dir,
@@ -467,6 +657,7 @@ def load_psi_state(base_dir: str, attach_psi: bool = True, logger=None) -> PsiSt
         metadata=meta,
         state_hash=st_hash,
         psi_events_df=df,
+        psi_attached=attached,
     )
 
     # 5) 任意: state_hash 検証（ここでは必須にしない）
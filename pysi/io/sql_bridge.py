@@ -7,6 +7,7 @@ from pysi.db.sqlite_bridge import (
     upsert_node, upsert_node_product, upsert_tariff,
     persist_node_psi, set_price_tag
 )
+from pysi.db.psi_bulk import PSIBulkWriter
 # ---- ざっくり最小スキーマ（存在しなければ作成） -----------------
 SCHEMA_SQL = r"""
 CREATE TABLE IF NOT EXISTS product(
@@ -119,41 +120,45 @@ def _sku_attrs(n, product_name: str):
         pass
     return lot_size, cs
 # ---- 公開API ------------------------------------------------------------
-def persist_all_psi(psi_env, db_path: str):
+def persist_all_psi(psi_env, db_path: str, lot_handles: bool = False):
     """
     現在の計画結果（COPY版）を DB（psi / price_tag / node / node_product）へ保存。
     - psi_env.prod_tree_dict_OT: {product_name: root_node}
     - root/leaf の price タグもあれば保存（ASIS=root, TOBE=leaf）
+    - PSI は PSIBulkWriter で executemany、全製品を 1 transaction で書く
+    - lot_handles=True なら PSI は psi_lot（整数 lot handle, WITHOUT ROWID）へ
     """
     # DBディレクトリが無ければ作成
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
     with connect(db_path) as con:
         init_schema(con, schema_sql=SCHEMA_SQL)
+        writer = PSIBulkWriter(con, source="demand", lot_handles=lot_handles)
         # 製品ごとにツリーを走査
         prod_roots: Dict[str, object] = getattr(psi_env, "prod_tree_dict_OT", {}) or {}
-        for product_name, root in prod_roots.items():
-            # まず node / node_product をupsert（メタ）
-            for n in _iter_nodes(root):
-                na = _node_attrs(n)
-                upsert_node(con, **na)
-                lot_size, cs = _sku_attrs(n, product_name)
-                upsert_node_product(
-                    con, na["node_name"], product_name, lot_size=lot_size, **cs
-                )
-            # PSI（demand面）を保存
-            for n in _iter_nodes(root):
-                persist_node_psi(con, n, product_name, source="demand")
-            # price tags（存在すれば）
-            # ルートの ASIS
-            root_price = getattr(root, "offering_price_ASIS", None)
-            if root_price is not None:
-                set_price_tag(con, root.name, product_name, "ASIS", float(root_price))
-            # 葉の TOBE
-            for n in _iter_nodes(root):
-                if not getattr(n, "children", []):
-                    p = getattr(n, "offering_price_TOBE", None)
-                    if p is not None:
-                        set_price_tag(con, n.name, product_name, "TOBE", float(p))
+        with writer:
+            for product_name, root in prod_roots.items():
+                # まず node / node_product をupsert（メタ）
+                for n in _iter_nodes(root):
+                    na = _node_attrs(n)
+                    upsert_node(con, **na)
+                    lot_size, cs = _sku_attrs(n, product_name)
+                    upsert_node_product(
+                        con, na["node_name"], product_name, lot_size=lot_size, **cs
+                    )
+                # PSI（demand面）を保存
+                for n in _iter_nodes(root):
+                    writer.add_node(n, product_name)
+                # price tags（存在すれば）
+                # ルートの ASIS
+                root_price = getattr(root, "offering_price_ASIS", None)
+                if root_price is not None:
+                    set_price_tag(con, root.name, product_name, "ASIS", float(root_price))
+                # 葉の TOBE
+                for n in _iter_nodes(root):
+                    if not getattr(n, "children", []):
+                        p = getattr(n, "offering_price_TOBE", None)
+                        if p is not None:
+                            set_price_tag(con, n.name, product_name, "TOBE", float(p))
 def persist_tariff_table(db_path: str, tariff_table: Dict[tuple, float] | Iterable[tuple]):
     """
     tariff_table: {(product_name, from_node, to_node): rate} もしくは
@@ -11,6 +11,7 @@ from pysi.io.psi_io_adapters import (
     get_node_id,
     get_product_id,
 )
+from pysi.db.calendar_iso import weeks_count_cached
 # ******************************************
 # 本物の PlanNode を使う
 # ******************************************
@@ -230,14 +231,13 @@ def _build_plan_node(node_name: str, attrs: Dict) -> PlanNode:
         if hasattr(n, k):
             setattr(n, k, v)
     return n
-def write_both_layers_for_pair(conn: sqlite3.Connection,
-                               scenario_id: int,
-                               node_name: str,
-                               product_name: str) -> Dict[str, int]:
+def compute_pair_node(conn: sqlite3.Connection,
+                      scenario_id: int,
+                      node_name: str,
+                      product_name: str) -> PlanNode:
     """
-    1) lot から S を leaf ノードへ注入 → 2) calcS2P() で P/I/CO 計算
-    → 3) lot_bucket へ demand/supply 両レイヤ書戻し。
-    戻り値: {"d_rows": ..., "s_rows": ..., "weeks": ...}
+    1) lot から S を leaf ノードへ注入 → 2) calcS2P() で P/I/CO 計算 までの読み取り側。
+    DB へは書かないので、読み取り専用の接続でも呼べる（並列 orchestrator 用）。
     """
     # 属性を取得して PlanNode 構築
     attrs = _read_node_attrs(conn, node_name, product_name)
@@ -250,6 +250,17 @@ def write_both_layers_for_pair(conn: sqlite3.Connection,
         product_name=product_name,
         layer="demand",
     )
+    return node
+def write_both_layers_for_pair(conn: sqlite3.Connection,
+                               scenario_id: int,
+                               node_name: str,
+                               product_name: str) -> Dict[str, int]:
+    """
+    1) lot から S を leaf ノードへ注入 → 2) calcS2P() で P/I/CO 計算
+    → 3) lot_bucket へ demand/supply 両レイヤ書戻し。
+    戻り値: {"d_rows": ..., "s_rows": ..., "weeks": ...}
+    """
+    node = compute_pair_node(conn, scenario_id, node_name, product_name)
     # demand/supply 両方を書き戻し
     d_rows, s_rows = write_both_layers(
         conn,
@@ -258,7 +269,7 @@ def write_both_layers_for_pair(conn: sqlite3.Connection,
         product_name=product_name,
         replace_slice=True,
     )
-    # 週数は calendar（すでに DB 側が正）に依存：手軽に数える
-    weeks = conn.execute("SELECT COUNT(*) FROM calendar_iso").fetchone()[0] or 0
+    # 週数は calendar（すでに DB 側が正）に依存：接続ごとのキャッシュを使う
+    weeks = weeks_count_cached(conn)
     return {"d_rows": int(d_rows), "s_rows": int(s_rows), "weeks": int(weeks)}
 # ******************************************
@@ -10,6 +10,10 @@ from pysi.utils.file_io import read_tree_file
 #from pysi.plan.demand_processing import *
 #from plan.demand_processing import shiftS2P_LV
 from pysi.plan.operations import *
+#@ ADD compact PSI store (lot handle + CSR buckets)
+from pysi.network.psi_store import PSIStore, PSIView, PSI_LAYERS, LOT_TABLE, psi_counts
+#@ ADD O(n) PS->I roll-forward kernel
+from pysi.plan.ps2i_kernel import roll_forward_I, use_fast_kernel
 #from pysi.plan.operations import calcS2P, set_S2psi, get_set_childrenP2S2psi, shiftS2P_LV
 #@250820 copied from pysi.pla.operations
 # 同一node内のS2Pの処理
@@ -111,8 +115,9 @@ class Node:
         # [S, CO, I, P] 用の 4 要素リストを用意
         self.psi4demand = [ [[], [], [], []] for _ in range(length) ]
         self.psi4supply = [ [[], [], [], []] for _ in range(length) ]
-        self.psi4couple = [ [[], [], [], []] for _ in range(length) ]
-        self.psi4accume = [ [[], [], [], []] for _ in range(length) ]
+        # couple/accume は GUI の set_dict2tree_psi で丸ごと差し替えるだけなので空の圧縮ビューで持つ
+        self.psi4couple = PSIView(PSIStore.empty(length))
+        self.psi4accume = PSIView(PSIStore.empty(length))
         #self.psi4demand = None
         #self.psi4supply = None
         #self.psi4couple = None
@@ -552,6 +557,29 @@ class Node:
         ]
         for child in self.children:
             child.set_plan_range_all_buffers(plan_range, plan_year_st)
+    # ***********************
+    # compact PSI store
+    # ***********************
+    def compact_psi(self, layers=PSI_LAYERS, lot_table=LOT_TABLE) -> int:
+        """list の PSI を PSIView(CSR) に置換。戻り値は配列バイト数"""
+        nbytes = 0
+        for layer in layers:
+            psi = getattr(self, layer, None)
+            if psi is None:
+                continue
+            view = psi if isinstance(psi, PSIView) else PSIView(PSIStore.from_lists(psi, lot_table))
+            setattr(self, layer, view)
+            nbytes += view.store.nbytes
+        return nbytes
+    def expand_psi(self, layers=PSI_LAYERS):
+        """PSIView を書き込み可能な list に戻す（計画エンジンを回す前に呼ぶ）"""
+        for layer in layers:
+            psi = getattr(self, layer, None)
+            if isinstance(psi, PSIView):
+                setattr(self, layer, psi.to_lists())
+    def psi_counts(self, layer: str = "psi4supply"):
+        """(weeks, 4) の lot 数行列。圧縮済みなら offsets の差分だけで求まる"""
+        return psi_counts(getattr(self, layer))
     #@250818 ADD
     def set_S2psi(self, pSi):
         # ここが唯一の正本
@@ -678,8 +706,7 @@ class Node:
         # lot_counts の長さを合わせる（足りなければ伸ばす／長ければ切る）
         if len(getattr(self, "lot_counts", [])) != plan_len:
             self.lot_counts = [0 for _ in range(plan_len)]
-        for w in range(plan_len):
-            self.lot_counts[w] = len(self.psi4supply[w][3])  # P
+        self.lot_counts = self.psi_counts("psi4supply")[:, 3].tolist()  # P
         self.lot_counts_all = sum(self.lot_counts)
     def EvalPlanSIP_cost(self):
         L = self.lot_counts_all    # nodeの全ロット数 # psi[w][3]=PO
@@ -786,6 +813,9 @@ class Node:
     # ******************************
     #@250818 UPDATE
     def calcPS2I4demand(self):
+        if use_fast_kernel():
+            roll_forward_I(self.psi4demand, dedup=False)
+            return
         plan_len = len(self.psi4demand)
         for w in range(1, plan_len):
             s  = self.psi4demand[w][0]
@@ -814,6 +844,9 @@ class Node:
             print("s = self.psi4demand[w][0]", w, s, "&[w][3]", p, "&[w][2]", i1)
     #@250818 UPDATE
     def calcPS2I4supply(self):
+        if use_fast_kernel():
+            roll_forward_I(self.psi4supply, dedup=True)
+            return
         plan_len = len(self.psi4supply)
         for w in range(1, plan_len):
             s  = self.psi4supply[w][0]
@@ -852,6 +885,9 @@ class Node:
         for w in range(plan_len):
             self.psi4supply[w][0] = self.psi4demand[w][0].copy()
         # その上で supply 側の PS→I を計算
+        if use_fast_kernel():
+            roll_forward_I(self.psi4supply, dedup=False)
+            return
         for w in range(1, plan_len):
             s  = self.psi4supply[w][0]
             co = self.psi4supply[w][1]
@@ -908,11 +944,8 @@ class Node:
         lot_all_demand = 0
         # どちらも参照するので min（両者を同長に保っているなら len(self.psi4demand) でもOK）
         plan_len = min(len(self.psi4demand), len(self.psi4supply))
-        lot_counts_I_supply = [0] * plan_len
-        lot_counts_I_demand = [0] * plan_len
-        for w in range(plan_len):
-            lot_counts_I_supply[w] = len(self.psi4supply[w][2])  # I
-            lot_counts_I_demand[w] = len(self.psi4demand[w][2])  # I
+        lot_counts_I_supply = self.psi_counts("psi4supply")[:plan_len, 2].tolist()  # I
+        lot_counts_I_demand = self.psi_counts("psi4demand")[:plan_len, 2].tolist()  # I
         if self.name == "HAM":
             print("lot_counts_I_supply", lot_counts_I_supply)
         lot_all_supply = sum(lot_counts_I_supply)
@@ -1045,13 +1078,18 @@ class PlanNode(Node):
 # *************************
 # class SKU
 # *************************
+def _empty_psi_row():
+    # module level (not lambda) so that SKU / node trees stay picklable
+    return {"I": 0, "P": 0, "S": 0, "CO": 0}
+
+
 class SKU:
     def __init__(self, product_name, node_name):
         self.product_name = product_name
         self.node_name = node_name
         # node_dict[sku.node_name] でNodeへアクセスできる
         self.psi_node_ref = None
-        self.psi_table = defaultdict(lambda: {"I": 0, "P": 0, "S": 0, "CO": 0})  # week単位
+        self.psi_table = defaultdict(_empty_psi_row)  # week単位
         # *******************
         # move Node 2 SKU
         # *******************
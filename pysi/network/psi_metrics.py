@@ -0,0 +1,205 @@
+# pysi/network/psi_metrics.py
+# -*- coding: utf-8 -*-
+"""
+PSI の集計カーネル（cockpit の KPI 用）
+
+cockpit の在庫 / 稼働率 / サービス KPI は、これまで週ごとに木を辿り直し、
+バケツごとに len() を取っていた（在庫は 木 × 週 回の走査）。ここでは
+ - PSICounts : 木を 1 回だけ辿って (node, week, {S,CO,I,P}) の lot 数を
+               int64 の密行列に持つ。在庫合計・平均・ノード別系列は NumPy の reduce だけ
+               圧縮済み（PSIView）ノードは CSR の offsets 差分なので lot list を見ない
+ - service_jit : leaf の S バケツを lot handle 配列にし、np.unique / searchsorted で
+               需要週と出荷週を突き合わせる（lot_id の dict を作らない）
+を提供する。
+
+計画エンジンが一部のノード / 週だけ書き換えた場合は PSICounts.update_node() で
+その行だけ数え直せる（木全体を走査し直さない）。
+"""
+from __future__ import annotations
+
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from pysi.network.psi_store import BUCKETS, LOT_TABLE, LotTable, PSIView, psi_counts
+
+S, CO, I, P = range(BUCKETS)
+
+
+def _iter_tree(root):
+    # cockpit の iter_nodes と同じ順（stack の後ろから）
+    stack = [root]
+    while stack:
+        n = stack.pop()
+        if n is None:
+            continue
+        yield n
+        stack.extend(getattr(n, "children", []) or [])
+
+
+def _counts(psi) -> np.ndarray:
+    """psi_counts の list 向け高速版（[S, CO, I, P] が揃っていれば map(len) 1 回）"""
+    if isinstance(psi, PSIView):
+        return psi.counts()
+    try:
+        flat = np.fromiter(map(len, chain.from_iterable(psi)), dtype=np.int64)
+    except TypeError:                       # None のバケツが混じっている
+        return psi_counts(psi)
+    if flat.size != len(psi) * BUCKETS:     # バケツ数が 4 でない週がある
+        return psi_counts(psi)
+    return flat.reshape(len(psi), BUCKETS)
+
+
+def _fit(counts: np.ndarray, weeks: int) -> np.ndarray:
+    """(w, 4) を (weeks, 4) に切り詰め / 0 埋め"""
+    if counts.shape[0] == weeks:
+        return counts
+    out = np.zeros((weeks, BUCKETS), dtype=np.int64)
+    n = min(weeks, counts.shape[0])
+    out[:n] = counts[:n]
+    return out
+
+
+def psi_count_matrix(psi, weeks: int) -> np.ndarray:
+    """1 ノード 1 レイヤの (weeks, 4) lot 数行列（list / PSIView どちらでも、足りない週は 0）"""
+    if not psi:
+        return np.zeros((weeks, BUCKETS), dtype=np.int64)
+    return _fit(_counts(psi), weeks)
+
+
+# ---------------------------------------------------------------------------
+# count matrices
+# ---------------------------------------------------------------------------
+class PSICounts:
+    """
+    1 レイヤ分の lot 数行列。counts[i, w, b] = nodes[i] の week w, bucket b の lot 数。
+
+        pc = PSICounts.from_tree(root_outbound)       # 木を 1 回だけ走査
+        last, avg = pc.inventory_summary()
+        used = pc.series("MOM_A", P)
+    """
+
+    def __init__(self, nodes: List[str], counts: np.ndarray, layer: str = "psi4supply") -> None:
+        self.nodes = nodes
+        self.index: Dict[str, int] = {}
+        for i, name in enumerate(nodes):
+            self.index.setdefault(name, i)          # 同名ノードは走査順で最初のもの
+        self.counts = counts
+        self.layer = layer
+
+    @property
+    def weeks(self) -> int:
+        return int(self.counts.shape[1])
+
+    @classmethod
+    def from_tree(cls, root, layer: str = "psi4supply", weeks: Optional[int] = None) -> "PSICounts":
+        nodes = list(_iter_tree(root))
+        if weeks is None:
+            weeks = len(getattr(root, layer, None) or [])
+        counts = np.zeros((len(nodes), weeks, BUCKETS), dtype=np.int64)
+        for i, n in enumerate(nodes):
+            psi = getattr(n, layer, None)
+            if psi:
+                counts[i] = psi_count_matrix(psi, weeks)
+        return cls([getattr(n, "name", "") for n in nodes], counts, layer)
+
+    # -- incremental ----------------------------------------------------------
+    def update_node(self, node, weeks: Optional[Iterable[int]] = None) -> None:
+        """node の行（weeks 指定ならその週だけ）を数え直す"""
+        i = self.index.get(getattr(node, "name", None))
+        if i is None:
+            return
+        psi = getattr(node, self.layer, None) or []
+        if weeks is None:
+            self.counts[i] = psi_count_matrix(psi, self.weeks)
+            return
+        row = self.counts[i]
+        for w in weeks:
+            if 0 <= w < self.weeks:
+                week = psi[w] if w < len(psi) else ()
+                row[w] = [len(week[b]) if b < len(week) and week[b] else 0 for b in range(BUCKETS)]
+
+    # -- reductions -----------------------------------------------------------
+    def total(self, bucket: int) -> np.ndarray:
+        """全ノード合計の週系列"""
+        return self.counts[:, :, bucket].sum(axis=0)
+
+    def series(self, node_name: str, bucket: int) -> Optional[np.ndarray]:
+        i = self.index.get(node_name)
+        return None if i is None else self.counts[i, :, bucket]
+
+    def inventory_summary(self) -> Tuple[int, float]:
+        """(最終週の在庫 lot 合計, 週平均)"""
+        if self.weeks <= 0:
+            return 0, 0.0
+        inv = self.total(I)
+        return int(inv[-1]), float(inv.mean())
+
+
+# ---------------------------------------------------------------------------
+# service (JIT)
+# ---------------------------------------------------------------------------
+def _bucket_handles(psi, bucket: int, weeks: int, lot_table: LotTable) -> Tuple[np.ndarray, np.ndarray]:
+    """psi の bucket を (handle, week) の平行配列に（week 昇順、バケツ内の順序を保つ）"""
+    if isinstance(psi, PSIView) and psi.store.lot_table is lot_table:
+        st = psi.store
+        sizes = np.diff(st.offsets)
+        slot = np.repeat(np.arange(sizes.size), sizes)
+        keep = (slot % BUCKETS == bucket) & (slot // BUCKETS < weeks)
+        return st.handles[keep].astype(np.int64), (slot[keep] // BUCKETS).astype(np.int64)
+    flat: List[str] = []
+    lens = np.zeros(min(weeks, len(psi)), dtype=np.int64)
+    for w in range(lens.size):
+        lots = psi[w][bucket]
+        if lots:
+            lens[w] = len(lots)
+            flat.extend(lots)
+    return lot_table.intern_many(flat).astype(np.int64), np.repeat(np.arange(lens.size), lens)
+
+
+def _first_week(leaves, layer: str, weeks: int, lot_table: LotTable) -> Tuple[np.ndarray, np.ndarray]:
+    """leaf 順 → week 順で最初に現れた week（lot handle 昇順の unique, week）"""
+    hs, ws = [], []
+    for lf in leaves:
+        psi = getattr(lf, layer, None)
+        if psi:
+            h, w = _bucket_handles(psi, S, weeks, lot_table)
+            hs.append(h)
+            ws.append(w)
+    if not hs:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    h = np.concatenate(hs)
+    w = np.concatenate(ws)
+    uniq, first = np.unique(h, return_index=True)
+    return uniq, w[first]
+
+
+def service_jit(root_outbound, weeks_count: Optional[int] = None, lot_table: LotTable = LOT_TABLE) -> Dict[str, float]:
+    """leaf の需要週（psi4demand の S）と出荷週（psi4supply の S）のずれ"""
+    W = weeks_count or len(root_outbound.psi4demand)
+    leaves = [n for n in _iter_tree(root_outbound) if not (getattr(n, "children", []) or [])]
+
+    dh, dw = _first_week(leaves, "psi4demand", W, lot_table)
+    sh, sw = _first_week(leaves, "psi4supply", W, lot_table)
+
+    pos = np.searchsorted(sh, dh)
+    found = pos < sh.size
+    found[found] = sh[pos[found]] == dh[found]
+    d = sw[pos[found]] - dw[found]
+
+    diffs_abs = np.sort(np.abs(d))
+    late = d[d > 0]
+    early = -d[d < 0]
+    n = int(diffs_abs.size)
+    k = max(0, min(n - 1, int(round((n - 1) * 0.95)))) if n else 0
+
+    return {
+        "jit_mad_weeks": float(diffs_abs.mean()) if n else 0.0,
+        "jit_p95_weeks": float(diffs_abs[k]) if n else 0.0,
+        "unfilled_lots": int(dh.size - n),
+        "filled_lots": n,
+        "total_demand_lots": int(dh.size),
+        "avg_late_weeks": float(late.mean()) if late.size else 0.0,
+        "avg_early_weeks": float(early.mean()) if early.size else 0.0,
+    }
@@ -0,0 +1,134 @@
+# pysi/network/psi_snapshot.py
+# -*- coding: utf-8 -*-
+"""
+PSI snapshot（PSI バケツだけの in-memory バックアップ）
+
+decoupling パターン評価（eval_buffer_stock）は、パターンごとに
+psi_restore_from_file('psi_backup.pkl') で Node 木全体を unpickle していた。
+変わるのは PSI バケツだけなので、ここでは
+
+ - capture(root) : 木を DFS 順に node index 付けし、各 node × layer × week × bucket の
+                   lot_id を 1 本の flat list と CSR offsets に詰める
+                   （lot_id 文字列は共有。コピーされるのは参照だけ）
+ - restore(root) : 同じ構造の木に対して slice copy で [[S, CO, I, P], ...] を作り直す
+                   names を渡せばその node だけ戻す（触った node だけ払う使い方）
+
+とし、N パターン評価を「木 1 回 + 軽い restore N 回」にしている。
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+BUCKETS = 4  # 0:S, 1:CO, 2:I, 3:P
+SNAPSHOT_LAYERS = ("psi4demand", "psi4supply")
+
+
+def _iter_tree(root):
+    # 前順 DFS（children の並び順どおり）
+    stack = [root]
+    while stack:
+        n = stack.pop()
+        if n is None:
+            continue
+        yield n
+        stack.extend(reversed(getattr(n, "children", []) or []))
+
+
+class PSISnapshot:
+    """node index × layer ごとの PSI バケツを CSR で保持する。"""
+
+    __slots__ = ("names", "layers", "weeks", "slot_base", "offsets", "lots",
+                 "_index", "_off")
+
+    def __init__(self, names: List[str], layers: Sequence[str], weeks: np.ndarray,
+                 slot_base: np.ndarray, offsets: np.ndarray, lots: List[str]) -> None:
+        self.names = names
+        self.layers = tuple(layers)
+        self.weeks = weeks            # int64 (n_nodes, n_layers)
+        self.slot_base = slot_base    # int64 (n_nodes, n_layers) 先頭 slot
+        self.offsets = offsets        # int64 (total_slots + 1)
+        self.lots = lots              # flat lot_id list
+        self._index: Dict[str, int] = {nm: i for i, nm in enumerate(names)}
+        self._off = offsets.tolist()  # restore のループ用
+
+    # -- build ----------------------------------------------------------------
+    @classmethod
+    def capture(cls, root, layers: Sequence[str] = SNAPSHOT_LAYERS) -> "PSISnapshot":
+        names: List[str] = []
+        weeks: List[List[int]] = []
+        bases: List[List[int]] = []
+        sizes: List[int] = []
+        flat: List[str] = []
+        for n in _iter_tree(root):
+            names.append(n.name)
+            w_row, b_row = [], []
+            for layer in layers:
+                psi = getattr(n, layer, None) or []
+                b_row.append(len(sizes))
+                w_row.append(len(psi))
+                for week in psi:
+                    for b in range(BUCKETS):
+                        lots = week[b]
+                        if lots:
+                            sizes.append(len(lots))
+                            flat.extend(lots)
+                        else:
+                            sizes.append(0)
+            weeks.append(w_row)
+            bases.append(b_row)
+        offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+        if sizes:
+            np.cumsum(np.asarray(sizes, dtype=np.int64), out=offsets[1:])
+        shape = (len(names), len(layers))
+        return cls(names, layers,
+                   np.asarray(weeks, dtype=np.int64).reshape(shape),
+                   np.asarray(bases, dtype=np.int64).reshape(shape),
+                   offsets, flat)
+
+    # -- restore --------------------------------------------------------------
+    def layer_lists(self, i: int, k: int) -> list:
+        """node index i, layer index k の PSI を新しい list-of-lists で返す"""
+        lots = self.lots
+        off = self._off
+        slot = int(self.slot_base[i, k])
+        out = []
+        for _ in range(int(self.weeks[i, k])):
+            out.append([lots[off[slot]:off[slot + 1]],
+                        lots[off[slot + 1]:off[slot + 2]],
+                        lots[off[slot + 2]:off[slot + 3]],
+                        lots[off[slot + 3]:off[slot + 4]]])
+            slot += BUCKETS
+        return out
+
+    def restore(self, root, names: Optional[Iterable[str]] = None,
+                layers: Optional[Sequence[str]] = None) -> int:
+        """
+        capture 時と同じ構造の木に PSI を書き戻す（node は in place、PSI list は新規）。
+        names: 戻す node 名（None なら全 node）。戻り値は戻した node 数。
+        """
+        only = set(names) if names is not None else None
+        use = self.layers if layers is None else tuple(layers)
+        ks = [self.layers.index(layer) for layer in use]
+        restored = 0
+        for i, n in enumerate(_iter_tree(root)):
+            if i >= len(self.names) or n.name != self.names[i]:
+                raise ValueError(
+                    f"PSI snapshot does not match tree at node #{i}: {n.name!r}")
+            if only is not None and n.name not in only:
+                continue
+            for k in ks:
+                setattr(n, self.layers[k], self.layer_lists(i, k))
+            restored += 1
+        return restored
+
+    # -- misc -----------------------------------------------------------------
+    def index_of(self, name: str) -> int:
+        return self._index[name]
+
+    @property
+    def nbytes(self) -> int:
+        """配列部分 + flat list 本体（lot_id 文字列は共有なので含めない）"""
+        return int(self.offsets.nbytes + self.weeks.nbytes + self.slot_base.nbytes
+                   + 8 * len(self.lots))
@@ -0,0 +1,294 @@
+# pysi/network/psi_store.py
+# -*- coding: utf-8 -*-
+"""
+Compact PSI store（配列ベースの PSI バケツ）
+
+Node.psi4demand / psi4supply は [[S, CO, I, P] for w in weeks] の Python list で、
+各バケツに lot_id 文字列がそのまま入っている。ノード数×製品数×週数が増えると
+小さな list が数百万個になり、メモリと GC 時間を食う。
+
+ここでは
+ - LotTable : lot_id(str) -> int handle の intern 表（プロセス共通 LOT_TABLE）
+ - PSIStore : 1 ノード 1 レイヤ分の CSR 形式バケツ
+              offsets(int64, weeks*4+1) + handles(int32)
+ - PSIView  : 既存コードの psi[w][b] 読み出しをそのまま通す互換ビュー
+を提供する。
+
+書き込み系エンジン（calcPS2I4supply, feedback_psi_lists など）は従来どおり list 上で
+動かし、計画後に Node.compact_psi() で圧縮、再計画前に Node.expand_psi() で戻す。
+"""
+from __future__ import annotations
+
+from collections.abc import Sequence
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+BUCKETS = 4  # 0:S, 1:CO, 2:I, 3:P
+PSI_LAYERS = ("psi4demand", "psi4supply", "psi4couple", "psi4accume")
+
+
+# ---------------------------------------------------------------------------
+# lot table
+# ---------------------------------------------------------------------------
+class LotTable:
+    """lot_id 文字列を int handle に intern する表（追記のみ）。"""
+
+    def __init__(self) -> None:
+        self._ids: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def intern(self, lot_id: str) -> int:
+        h = self._index.get(lot_id)
+        if h is None:
+            h = len(self._ids)
+            self._index[lot_id] = h
+            self._ids.append(lot_id)
+        return h
+
+    def intern_many(self, lot_ids: Iterable[str]) -> np.ndarray:
+        intern = self.intern
+        return np.fromiter((intern(x) for x in lot_ids), dtype=np.int32)
+
+    def lookup(self, lot_id: str) -> Optional[int]:
+        """登録済みなら handle、未登録なら None（intern はしない）"""
+        return self._index.get(lot_id)
+
+    def lot_id(self, handle: int) -> str:
+        return self._ids[handle]
+
+    def lot_ids(self, handles: Iterable[int]) -> List[str]:
+        ids = self._ids
+        return [ids[h] for h in handles]
+
+
+# process-wide table shared by every node/product
+LOT_TABLE = LotTable()
+
+
+# ---------------------------------------------------------------------------
+# CSR store
+# ---------------------------------------------------------------------------
+class PSIStore:
+    """
+    1 レイヤ分の PSI を CSR で保持する。
+    slot = w * 4 + b のバケツは handles[offsets[slot]:offsets[slot+1]]。
+    """
+
+    __slots__ = ("weeks", "offsets", "handles", "lot_table")
+
+    def __init__(self, weeks: int, offsets: np.ndarray, handles: np.ndarray,
+                 lot_table: LotTable = LOT_TABLE) -> None:
+        self.weeks = int(weeks)
+        self.offsets = offsets
+        self.handles = handles
+        self.lot_table = lot_table
+
+    @classmethod
+    def empty(cls, weeks: int, lot_table: LotTable = LOT_TABLE) -> "PSIStore":
+        return cls(weeks, np.zeros(weeks * BUCKETS + 1, dtype=np.int64),
+                   np.zeros(0, dtype=np.int32), lot_table)
+
+    @classmethod
+    def from_lists(cls, psi, lot_table: LotTable = LOT_TABLE) -> "PSIStore":
+        """[[S, CO, I, P], ...] 形式（list または PSIView）から構築"""
+        if isinstance(psi, PSIView) and psi.store.lot_table is lot_table:
+            return psi.store
+        weeks = len(psi)
+        sizes = np.zeros(weeks * BUCKETS, dtype=np.int64)
+        flat: List[str] = []
+        slot = 0
+        for week in psi:
+            for b in range(BUCKETS):
+                lots = week[b] if b < len(week) else None
+                if lots:
+                    sizes[slot] = len(lots)
+                    flat.extend(lots)
+                slot += 1
+        offsets = np.zeros(weeks * BUCKETS + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        return cls(weeks, offsets, lot_table.intern_many(flat), lot_table)
+
+    # -- fast path ------------------------------------------------------------
+    def bucket(self, w: int, b: int) -> np.ndarray:
+        """handle 配列（コピーしない slice）"""
+        slot = w * BUCKETS + b
+        return self.handles[self.offsets[slot]:self.offsets[slot + 1]]
+
+    def counts(self) -> np.ndarray:
+        """(weeks, 4) の lot 数行列"""
+        return np.diff(self.offsets).reshape(self.weeks, BUCKETS)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.offsets.nbytes + self.handles.nbytes)
+
+    # -- decode ---------------------------------------------------------------
+    def lots(self, w: int, b: int) -> List[str]:
+        return self.lot_table.lot_ids(self.bucket(w, b).tolist())
+
+    def to_lists(self) -> list:
+        ids = self.lot_table._ids
+        hs = self.handles.tolist()
+        off = self.offsets.tolist()
+        out = []
+        slot = 0
+        for _ in range(self.weeks):
+            week = []
+            for _b in range(BUCKETS):
+                week.append([ids[h] for h in hs[off[slot]:off[slot + 1]]])
+                slot += 1
+            out.append(week)
+        return out
+
+
+# ---------------------------------------------------------------------------
+# compatibility views (read only)
+# ---------------------------------------------------------------------------
+class LotBucketView(Sequence):
+    """psi[w][b] 互換の読み出し専用ビュー。append 等の書き込みは AttributeError。"""
+
+    __slots__ = ("_store", "_w", "_b")
+
+    def __init__(self, store: PSIStore, w: int, b: int) -> None:
+        self._store = store
+        self._w = w
+        self._b = b
+
+    def _handles(self) -> np.ndarray:
+        return self._store.bucket(self._w, self._b)
+
+    def __len__(self) -> int:
+        slot = self._w * BUCKETS + self._b
+        off = self._store.offsets
+        return int(off[slot + 1] - off[slot])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self._store.lot_table.lot_ids(self._handles()[i].tolist())
+        return self._store.lot_table.lot_id(int(self._handles()[i]))
+
+    def __iter__(self):
+        return iter(self._store.lots(self._w, self._b))
+
+    def __contains__(self, lot_id) -> bool:
+        h = self._store.lot_table.lookup(lot_id)
+        return h is not None and bool((self._handles() == h).any())
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, LotBucketView)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def copy(self) -> List[str]:
+        return list(self)
+
+    def handles(self) -> np.ndarray:
+        return self._handles()
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+class _PSIWeekView(Sequence):
+    __slots__ = ("_store", "_w")
+
+    def __init__(self, store: PSIStore, w: int) -> None:
+        self._store = store
+        self._w = w
+
+    def __len__(self) -> int:
+        return BUCKETS
+
+    def __getitem__(self, b):
+        if isinstance(b, slice):
+            return [self[i] for i in range(BUCKETS)[b]]
+        if b < 0:
+            b += BUCKETS
+        if not 0 <= b < BUCKETS:
+            raise IndexError(b)
+        return LotBucketView(self._store, self._w, b)
+
+    def __setitem__(self, b, value):
+        raise TypeError("compacted PSI is read-only; call node.expand_psi() before planning")
+
+
+class PSIView(Sequence):
+    """node.psi4xxx の代わりに置く互換ビュー（len / psi[w][b] / iteration）"""
+
+    __slots__ = ("store",)
+
+    def __init__(self, store: PSIStore) -> None:
+        self.store = store
+
+    def __len__(self) -> int:
+        return self.store.weeks
+
+    def __getitem__(self, w):
+        if isinstance(w, slice):
+            return [self[i] for i in range(self.store.weeks)[w]]
+        if w < 0:
+            w += self.store.weeks
+        if not 0 <= w < self.store.weeks:
+            raise IndexError(w)
+        return _PSIWeekView(self.store, w)
+
+    def counts(self) -> np.ndarray:
+        return self.store.counts()
+
+    def to_lists(self) -> list:
+        return self.store.to_lists()
+
+
+# ---------------------------------------------------------------------------
+# helpers
+# ---------------------------------------------------------------------------
+def psi_counts(psi) -> np.ndarray:
+    """list / PSIView どちらでも (weeks, 4) の lot 数行列を返す"""
+    if isinstance(psi, PSIView):
+        return psi.counts()
+    if not psi:
+        return np.zeros((0, BUCKETS), dtype=np.int64)
+    return np.array([[len(week[b]) if b < len(week) and week[b] else 0
+                      for b in range(BUCKETS)] for week in psi], dtype=np.int64)
+
+
+def is_compact(psi) -> bool:
+    return isinstance(psi, PSIView)
+
+
+def _iter_tree(root):
+    stack = [root]
+    while stack:
+        n = stack.pop()
+        if n is None:
+            continue
+        yield n
+        stack.extend(getattr(n, "children", []) or [])
+
+
+def compact_psi_tree(root, layers=PSI_LAYERS, lot_table: LotTable = LOT_TABLE) -> int:
+    """木の全ノードを圧縮。戻り値は圧縮後の配列バイト数合計"""
+    total = 0
+    for n in _iter_tree(root):
+        if hasattr(n, "compact_psi"):
+            total += n.compact_psi(layers, lot_table=lot_table)
+    return total
+
+
+def expand_psi_tree(root, layers=PSI_LAYERS) -> None:
+    """木の全ノードを list 形式へ戻す（圧縮されていなければ何もしない）"""
+    for n in _iter_tree(root):
+        if hasattr(n, "expand_psi"):
+            n.expand_psi(layers)
@@ -0,0 +1,121 @@
+# pysi/plan/decouple_sweep.py
+# -*- coding: utf-8 -*-
+"""
+Decoupling pattern sweep（eval_buffer_stock の評価ループ）
+
+make_nodes_decouple_all(root) が返す各 decouple_node_names について
+  PSI 初期状態に restore → push_pull_all_psi2i_decouple4supply5 → eval_supply_chain_cost
+を行い、(revenue, profit, decouple_node_names[, kpi]) を返す。
+
+パターン同士は独立なので workers > 1 のときは ProcessPoolExecutor に振り分ける。
+ - 木は pickle して initializer で 1 回だけ worker に渡す（パターンごとには送らない）
+ - worker 側は PSISnapshot で初期状態を持ち、パターンごとに restore する
+ - worker から返すのは数値と decouple_node_names だけ
+serial / parallel どちらも同じ関数（_eval_pattern）で評価するので結果は一致する。
+sweep 後、呼び出し元の木は sweep 前の PSI 状態に戻す。
+"""
+from __future__ import annotations
+
+import logging
+import os
+import pickle
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+from pysi.network.psi_snapshot import PSISnapshot
+from pysi.network.tree import eval_supply_chain_cost
+from pysi.psi_planner_mvp.init_load_plan_data import push_pull_all_psi2i_decouple4supply5
+
+logger = logging.getLogger(__name__)
+
+SweepResult = Tuple  # (revenue, profit, decouple_node_names) or (..., kpi)
+
+
+def resolve_workers(workers: Optional[int] = None) -> int:
+    """workers 未指定なら環境変数 PYSI_WORKERS（既定 1）。0 以下は CPU 数。"""
+    if workers is None:
+        try:
+            workers = int(os.getenv("PYSI_WORKERS", "1"))
+        except ValueError:
+            workers = 1
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def inventory_lots_by_week(root) -> List[int]:
+    """木全体の supply I lot 数を週ごとに合計した KPI ベクトル"""
+    total: List[int] = []
+    stack = [root]
+    while stack:
+        n = stack.pop()
+        psi = n.psi4supply
+        if len(total) < len(psi):
+            total.extend([0] * (len(psi) - len(total)))
+        for w, week in enumerate(psi):
+            total[w] += len(week[2])
+        stack.extend(n.children)
+    return total
+
+
+def _eval_pattern(root, snapshot: PSISnapshot, decouple_node_names, with_kpi: bool) -> SweepResult:
+    snapshot.restore(root)
+    push_pull_all_psi2i_decouple4supply5(root, decouple_node_names)
+    revenue, profit = eval_supply_chain_cost(root)
+    if with_kpi:
+        return revenue, profit, decouple_node_names, inventory_lots_by_week(root)
+    return revenue, profit, decouple_node_names
+
+
+# ---------------------------------------------------------------------------
+# worker side
+# ---------------------------------------------------------------------------
+_W_ROOT = None
+_W_SNAPSHOT: Optional[PSISnapshot] = None
+
+
+def _init_worker(payload: bytes, quiet: bool) -> None:
+    global _W_ROOT, _W_SNAPSHOT
+    if quiet:
+        # push_pull 側の print を worker ごとに重ねて出さない
+        sys.stdout = open(os.devnull, "w")
+    _W_ROOT = pickle.loads(payload)
+    _W_SNAPSHOT = PSISnapshot.capture(_W_ROOT)
+
+
+def _run_worker(args) -> SweepResult:
+    decouple_node_names, with_kpi = args
+    return _eval_pattern(_W_ROOT, _W_SNAPSHOT, decouple_node_names, with_kpi)
+
+
+# ---------------------------------------------------------------------------
+# entry point
+# ---------------------------------------------------------------------------
+def sweep_decoupling_patterns(root, patterns: Sequence[Sequence[str]], *,
+                              workers: Optional[int] = None,
+                              with_kpi: bool = False,
+                              snapshot: Optional[PSISnapshot] = None,
+                              quiet_workers: bool = True) -> List[SweepResult]:
+    """
+    patterns の順に評価結果を返す。
+    snapshot: 評価の起点となる PSI 状態（None なら現在の root から capture）。
+    """
+    patterns = [list(p) for p in patterns]
+    if snapshot is None:
+        snapshot = PSISnapshot.capture(root)
+    workers = min(resolve_workers(workers), max(len(patterns), 1))
+
+    if workers <= 1:
+        results = [_eval_pattern(root, snapshot, p, with_kpi) for p in patterns]
+        snapshot.restore(root)
+        return results
+
+    # worker には起点状態の木を 1 回だけ送る
+    snapshot.restore(root)
+    payload = pickle.dumps(root, protocol=pickle.HIGHEST_PROTOCOL)
+    logger.info("decoupling sweep: %d patterns, %d workers, payload %.1f MB",
+                len(patterns), workers, len(payload) / 1e6)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(payload, quiet_workers)) as ex:
+        return list(ex.map(_run_worker, [(p, with_kpi) for p in patterns]))
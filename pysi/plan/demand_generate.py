@@ -1,5 +1,6 @@
 
 #### ** "psi.plan.demand_generate.py" **
+import functools
 import math
 import pandas as pd
 import numpy as np
@@ -68,6 +69,165 @@ def _normalize_monthly_demand_df_sku(df: pd.DataFrame) -> pd.DataFrame:
     df = df.dropna(subset=["year"]).copy()
     df["year"] = df["year"].astype(int)
     return df[required]
+# *********************************
+# month -> ISO week day-weight matrix
+# *********************************
+MONTH_COLS = [f"m{i}" for i in range(1, 13)]
+_LOT_SEQ = []  # "0001", "0002", ... （lot_id 末尾の連番文字列キャッシュ）
+@functools.lru_cache(maxsize=32)
+def month_week_weight_matrix(year_st: int, year_end: int):
+    """
+    year_st..year_end の (year, month) 行 × ISO週 列の「日数」行列。
+    戻り値: (W, iso_year, iso_week)
+      W        : float64 (12*n_years, n_weeks)  W[(y-year_st)*12 + m-1, k] = その月の k週の日数
+      iso_year : int64 (n_weeks,)  列 k の ISO年
+      iso_week : int64 (n_weeks,)  列 k の ISO週（列は時系列順）
+    """
+    days = pd.date_range(f"{year_st}-01-01", f"{year_end}-12-31", freq="D")
+    iso = days.isocalendar()
+    row = (days.year.to_numpy() - year_st) * 12 + days.month.to_numpy() - 1
+    key = iso["year"].to_numpy().astype(np.int64) * 100 + iso["week"].to_numpy().astype(np.int64)
+    week_keys, col = np.unique(key, return_inverse=True)
+    W = np.zeros((12 * (year_end - year_st + 1), len(week_keys)), dtype=np.float64)
+    np.add.at(W, (row, col), 1.0)
+    W.setflags(write=False)
+    iso_year = week_keys // 100
+    iso_week = week_keys % 100
+    iso_year.setflags(write=False)
+    iso_week.setflags(write=False)
+    return W, iso_year, iso_week
+def _group_sum_kahan(values: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    連続区間 [starts[g], starts[g]+lengths[g]) ごとの和を、pandas groupby.sum と同じ
+    補正付き加算（Kahan）で順に求める。NaN は加算しない。
+    区間長（= 週の日数 × 重なる月数）は小さいので、区間内の位置ごとにベクトル化する。
+    """
+    n = len(starts)
+    total = np.zeros(n, dtype=np.float64)
+    comp = np.zeros(n, dtype=np.float64)
+    for p in range(int(lengths.max(initial=0))):
+        g = np.nonzero(lengths > p)[0]
+        v = values[starts[g] + p]
+        ok = ~np.isnan(v)
+        g, v = g[ok], v[ok]
+        y = v - comp[g]
+        t = total[g] + y
+        c = (t - total[g]) - y
+        comp[g] = np.where(np.isnan(c), 0.0, c)
+        total[g] = t
+    return total
+@functools.lru_cache(maxsize=32)
+def _week_month_terms(year_st: int, year_end: int):
+    """
+    weight 行列の列ごとの非ゼロ（1 週はたかだか 2 ヶ月にまたがる）。
+    戻り値: (row_a, days_a, row_b, days_b)  2 ヶ月目が無い週は days_b = 0
+    """
+    W, _, _ = month_week_weight_matrix(year_st, year_end)
+    nz = W > 0
+    row_a = nz.argmax(axis=0)
+    row_b = W.shape[0] - 1 - nz[::-1].argmax(axis=0)
+    cols = np.arange(W.shape[1])
+    days_a = W[row_a, cols]
+    days_b = np.where(row_b != row_a, W[row_b, cols], 0.0)
+    return row_a, days_a.astype(np.longdouble), row_b, days_b.astype(np.longdouble)
+def monthly_to_weekly_values(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    月次 (product_name, node_name, year, m1..m12) → 週次 (product_name, node_name, iso_year, iso_week, value)
+    旧実装（月ごとに日次へばらして ISO 週で groupby）と同じ結果を、日次 DataFrame を作らずに返す:
+     - 行は (product_name, node_name, iso_year, iso_week) 昇順
+     - 0 でない月の日を 1 日でも含む週だけを出す（値の合計が 0 でも行は残る）
+     - value は旧実装と同じ加算順（melt 順 = 月優先・行順、日ごと）・同じ補正付き加算で
+       計算するので、小数の需要でも bit 単位で一致する
+    (year, month) → ISO週 の対応と日数は month_week_weight_matrix から引く。
+    """
+    cols = ["product_name", "node_name", "iso_year", "iso_week", "value"]
+    if df.empty:
+        return pd.DataFrame(columns=cols)
+    grp = df.groupby(["product_name", "node_name"], sort=True)
+    pair_code = grp.ngroup().to_numpy()
+    pairs = grp.size().index
+    years = df["year"].to_numpy().astype(np.int64)
+    V = df[MONTH_COLS].to_numpy(dtype=np.float64)
+    year_st, year_end = int(years.min()), int(years.max())
+    W, iso_year, iso_week = month_week_weight_matrix(year_st, year_end)
+    n_weeks = W.shape[1]
+
+    # (year, month) 行ごとの (週列, 日数) を CSR で
+    w_row, w_col = np.nonzero(W)
+    w_days = W[w_row, w_col].astype(np.int64)
+    w_start = np.searchsorted(w_row, np.arange(W.shape[0]))
+    w_len = np.bincount(w_row, minlength=W.shape[0])
+
+    # melt 順（月優先 → 行順）で 0 でない (行, 月) を並べる
+    m_idx, r_idx = np.nonzero((V != 0).T)
+    keep = pair_code[r_idx] >= 0
+    m_idx, r_idx = m_idx[keep], r_idx[keep]
+    if len(r_idx) == 0:
+        return pd.DataFrame(columns=cols)
+    wr = (years[r_idx] - year_st) * 12 + m_idx
+    val = V[r_idx, m_idx]
+
+    # (行, 月) → 重なる週ごとの寄与（日数つき）
+    rep = w_len[wr]
+    e = np.repeat(np.arange(len(wr)), rep)
+    pos = np.arange(len(e)) - np.repeat(np.cumsum(rep) - rep, rep)
+    k = w_start[wr[e]] + pos
+    cell = pair_code[r_idx[e]] * n_weeks + w_col[k]
+    days = w_days[k]
+    v = val[e]
+
+    # cell（= product,node,週）順に安定ソートして日ごとの値に展開
+    order = np.argsort(cell, kind="stable")
+    cell, days, v = cell[order], days[order], v[order]
+    terms = np.repeat(v, days)
+    term_cell = np.repeat(cell, days)
+    cells, starts, lengths = np.unique(term_cell, return_index=True, return_counts=True)
+    value = _group_sum_kahan(terms, starts, lengths)
+
+    pi, ki = np.divmod(cells, n_weeks)
+    return pd.DataFrame({
+        "product_name": pairs.get_level_values(0).to_numpy()[pi],
+        "node_name":    pairs.get_level_values(1).to_numpy()[pi],
+        "iso_year":     iso_year[ki],
+        "iso_week":     iso_week[ki],
+        "value":        value,
+    })
+def resolve_lot_sizes(df_weekly: pd.DataFrame, lot_size_lookup) -> np.ndarray:
+    """lot_size_lookup(product_name, node_name) を (product,node) ごとに 1 回だけ呼ぶ（失敗・1未満は 1）"""
+    cache = {}
+    out = np.empty(len(df_weekly), dtype=np.int64)
+    for i, key in enumerate(zip(df_weekly["product_name"], df_weekly["node_name"])):
+        ls = cache.get(key)
+        if ls is None:
+            try:
+                ls = max(1, int(lot_size_lookup(*key)))
+            except Exception:
+                ls = 1
+            cache[key] = ls
+        out[i] = ls
+    return out
+def lot_id_lists(product_name, node_name, iso_year, iso_week, s_lot) -> list:
+    """
+    行ごとの lot_id list（形式: NODE-PRODUCT-YYYYWWNNNN, 週ごとに 0001 から）をまとめて作る。
+    prefix は (product,node) ごと、連番文字列はプロセス共通キャッシュを使う。
+    """
+    n_max = int(max(s_lot, default=0))
+    if n_max > len(_LOT_SEQ):
+        _LOT_SEQ.extend(f"{i:04d}" for i in range(len(_LOT_SEQ) + 1, n_max + 1))
+    seq = _LOT_SEQ
+    prefix_cache = {}
+    out = []
+    for pn, nn, y, w, cnt in zip(product_name, node_name, iso_year, iso_week, s_lot):
+        cnt = int(cnt)
+        if cnt <= 0:
+            out.append([])
+            continue
+        pfx = prefix_cache.get((pn, nn))
+        if pfx is None:
+            pfx = prefix_cache[(pn, nn)] = f"{_sanitize_token(nn)}{LOT_SEP}{_sanitize_token(pn)}{LOT_SEP}"
+        base = f"{pfx}{int(y)}{int(w):02d}"
+        out.append([base + x for x in seq[:cnt]])
+    return out
 def convert_monthly_to_weekly_sku(df: pd.DataFrame, lot_size_lookup) -> tuple[pd.DataFrame, int, int]:
     """
     月次を週次に変換。行ごとの lot_size は lot_size_lookup(product_name, node_name) で解決。
@@ -75,66 +235,19 @@ def convert_monthly_to_weekly_sku(df: pd.DataFrame, lot_size_lookup) -> tuple[pd
     """
     # 計画レンジ
     plan_range, plan_year_st = check_plan_range(df.rename(columns={"year":"year"}))
-    # 縦持ち化
-    df_melt = df.melt(
-        id_vars=["product_name", "node_name", "year"],
-        var_name="month", value_name="value"
-    )
-    # 'm1'→1
-    df_melt["month"] = df_melt["month"].str[1:].astype(int)
-    # 日次にばらし → 週番号で集計
-    frames = []
-    for _, r in df_melt.iterrows():
-        y = int(r["year"]); m = int(r["month"]); v = float(r["value"])
-        if v == 0:
-            continue
-        try:
-            days = pd.Timestamp(y, m, 1).days_in_month
-        except Exception:
-            continue
-        dates = pd.date_range(f"{y}-{m:02d}-01", periods=days, freq="D")
-        frames.append(pd.DataFrame({
-            "product_name": r["product_name"],
-            "node_name":    r["node_name"],
-            "date":         dates,
-            "value":        v
-        }))
-    if frames:
-        df_daily = pd.concat(frames, ignore_index=True)
-    else:
-        df_daily = pd.DataFrame(columns=["product_name","node_name","date","value"])
-    if df_daily.empty:
+    # 月→ISO週（日数重み行列で一括集計）
+    df_weekly = monthly_to_weekly_values(df)
+    if df_weekly.empty:
         # 空でも落ちないように最低限の列を返す
         return (pd.DataFrame(columns=["product_name","node_name","iso_year","iso_week","value","S_lot","lot_id_list"]),
                 plan_range, plan_year_st)
-    iso = df_daily["date"].dt.isocalendar()
-    df_daily["iso_year"] = iso.year.astype(int)
-    df_daily["iso_week"] = iso.week.astype(int)
-    df_weekly = (
-        df_daily.groupby(["product_name","node_name","iso_year","iso_week"], as_index=False)["value"]
-        .sum()
+    # lot_size を (product,node) ごとに解決して S_lot と lot_id を作成
+    df_weekly["lot_size"] = resolve_lot_sizes(df_weekly, lot_size_lookup)
+    df_weekly["S_lot"]    = np.ceil(df_weekly["value"].to_numpy() / df_weekly["lot_size"].to_numpy()).astype(int)
+    df_weekly["lot_id_list"] = lot_id_lists(
+        df_weekly["product_name"], df_weekly["node_name"],
+        df_weekly["iso_year"], df_weekly["iso_week"], df_weekly["S_lot"],
     )
-    # lot_size を行ごとに解決して S_lot と lot_id を作成
-    def _row_lot_size(row):
-        try:
-            return max(1, int(lot_size_lookup(row["product_name"], row["node_name"])))
-        except Exception:
-            return 1
-    df_weekly["lot_size"] = df_weekly.apply(_row_lot_size, axis=1)
-    df_weekly["S_lot"]    = (df_weekly["value"] / df_weekly["lot_size"]).apply(np.ceil).astype(int)
-    # 既存: df_weekly["S_lot"] = ...
-    # ここから lot_id 生成の関数を差し替え
-    def _mk_lots(row):
-        y   = int(row["iso_year"])
-        w   = int(row["iso_week"])
-        nn  = _sanitize_token(row["node_name"])
-        pn  = _sanitize_token(row["product_name"])
-        cnt = int(row["S_lot"])
-        if cnt <= 0:
-            return []
-        # 形式: NODE-PRODUCT-YYYYWWNNNN
-        return [f"{nn}{LOT_SEP}{pn}{LOT_SEP}{y}{w:02d}{i+1:04d}" for i in range(cnt)]
-    df_weekly["lot_id_list"] = df_weekly.apply(_mk_lots, axis=1)
     # 互換のため: iso_week は "02" 文字列
     df_weekly["iso_week"] = df_weekly["iso_week"].astype(str).str.zfill(2)
     return df_weekly, plan_range, plan_year_st
@@ -12,6 +12,7 @@ Engine hardening: idempotent PSI rebuild helpers
 """
 from __future__ import annotations
 from typing import List, Iterable
+from pysi.plan.ps2i_kernel import roll_forward_I, use_fast_kernel
 BUCKET = {"S":0, "CO":1, "I":2, "P":3}
 # ---------- LV helpers ----------
 def _is_vacation_week(vac_weeks: Iterable[int], w: int) -> bool:
@@ -67,16 +68,19 @@ def calc_PS2I_idempotent(psi: List[List[List[str]]]) -> None:
     # Iをゼロから再構成
     if W == 0: return
     # w=0 の I は“初期在庫”があれば尊重、なければ空のまま
-    for w in range(1, W):
-        prev_I = psi[w-1][BUCKET["I"]]
-        P      = psi[w][BUCKET["P"]]
-        S      = psi[w][BUCKET["S"]]
-        # FIFO：結合→Sを消し込み（順序維持）
-        inv = (prev_I or []) + (P or [])
-        if S:
-            sset = set(S)
-            inv = [lot for lot in inv if lot not in sset]
-        psi[w][BUCKET["I"]] = inv
+    if use_fast_kernel():
+        roll_forward_I(psi, dedup=False)
+    else:
+        for w in range(1, W):
+            prev_I = psi[w-1][BUCKET["I"]]
+            P      = psi[w][BUCKET["P"]]
+            S      = psi[w][BUCKET["S"]]
+            # FIFO：結合→Sを消し込み（順序維持）
+            inv = (prev_I or []) + (P or [])
+            if S:
+                sset = set(S)
+                inv = [lot for lot in inv if lot not in sset]
+            psi[w][BUCKET["I"]] = inv
     # w=0 も念のためユニーク化
     psi[0][BUCKET["I"]] = list(dict.fromkeys(psi[0][BUCKET["I"]])) if psi[0][BUCKET["I"]] else []
 # ---------- clear helpers ----------
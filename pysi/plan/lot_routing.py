@@ -0,0 +1,135 @@
+# pysi/plan/lot_routing.py
+# -*- coding: utf-8 -*-
+"""
+Lot routing for feedback_psi_lists（親の確定S → 出荷先 child の P/S へ展開）
+
+従来の feedback_psi_lists は lot ごとに
+  extract_node_name → find_path_to_leaf_with_parent（leaf から親まで再帰）→ reverse → path[1]
+を繰り返していたため O(lots × depth) だった。ここでは
+ - build_routing_index(root): {ancestor_name: {leaf_name: next_hop_child}} を木ごとに 1 回だけ構築
+ - place_lots_in_supply_LT(w, child, lots): 同じ (w, child) の lot をまとめて LT shift して配置
+ - feedback_psi_lists_routed(node, nodes, extract_leaf): 上記を使った feedback_psi_lists 本体
+とし、lot あたりの処理を「leaf 名の抽出 + dict 参照 2 回」にしている。
+child ごとのバケツ内の lot 順は従来（lot 単位 append）と同じ。
+"""
+from __future__ import annotations
+
+import logging
+from typing import Callable, Dict, List, Optional
+
+from pysi.plan.operations import check_lv_week_fw
+
+logger = logging.getLogger(__name__)
+
+LOT_SEP = "-"
+
+RoutingIndex = Dict[str, Dict[str, object]]
+
+
+def leaf_name_from_lot_id(lot_id: str) -> str:
+    """NODE-PRODUCT-YYYYWWNNNN 形式の lot_id から leaf(node) 名を取り出す"""
+    return lot_id.split(LOT_SEP, 1)[0]
+
+
+def _subtree_names(node) -> List[str]:
+    out = []
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        out.append(n.name)
+        stack.extend(getattr(n, "children", []) or [])
+    return out
+
+
+def build_routing_index(root, nodes: Optional[Dict[str, object]] = None) -> RoutingIndex:
+    """
+    木全体について「祖先ノード名 → {子孫ノード名: 次ホップの子ノード}」を作る。
+    （lot_id の node は通常 leaf だが、従来の parent 遡りと同じく中間ノードも引ける）
+    nodes（name→node 辞書）を渡した場合、子ノードは nodes 側の実体に解決する
+    （従来の nodes[path[1]] と同じ参照先）。
+    """
+    index: RoutingIndex = {}
+    stack = [root]
+    while stack:
+        n = stack.pop()
+        children = getattr(n, "children", []) or []
+        if not children:
+            continue
+        hop: Dict[str, object] = {}
+        for child in children:
+            target = nodes.get(child.name, child) if nodes is not None else child
+            for leaf_name in _subtree_names(child):
+                hop[leaf_name] = target
+        index[n.name] = hop
+        stack.extend(children)
+    return index
+
+
+def place_lots_in_supply_LT(w: int, child, lots: List[str]) -> None:
+    """
+    place_P_in_supply_LT の lot まとめ版。
+    P: w + leadtime（非稼働週なら次週）、S: P週 + safety_stock_week（同上）
+    """
+    if not lots:
+        return
+    lv_week = child.long_vacation_weeks
+    eta_shift = check_lv_week_fw(lv_week, w + child.leadtime)
+    ship_shift = check_lv_week_fw(lv_week, eta_shift + child.safety_stock_week)
+    child.psi4supply[eta_shift][3].extend(lots)
+    child.psi4supply[ship_shift][0].extend(lots)
+
+
+def feedback_psi_lists_routed(node, nodes: Dict[str, object],
+                              extract_leaf: Callable[[str], str] = leaf_name_from_lot_id,
+                              index: Optional[RoutingIndex] = None) -> None:
+    """
+    親 node の確定S(psi4supply[w][0]) を、lot_id の leaf への次ホップ child の
+    psi4supply の P/S に LT shift で置く（children の S/P は事前にクリア）。木全体を再帰。
+    """
+    if index is None:
+        index = build_routing_index(node, nodes)
+    debug = logger.isEnabledFor(logging.DEBUG)
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        children = n.children
+        if not children:
+            continue
+        plan_len = 53 * n.plan_range
+        # replace lot するために、出荷先となるすべての children の S[w][0] と P[w][3] をクリア
+        for child in children:
+            psi = child.psi4supply
+            for w in range(plan_len):
+                psi[w][0] = []
+                psi[w][3] = []
+        hop = index[n.name]
+        route_cache: Dict[str, object] = {}
+        for w in range(plan_len):
+            confirmed_S_lots = n.psi4supply[w][0]  # 親の確定出荷confS lot
+            if not confirmed_S_lots:
+                continue
+            # 出荷先 child ごとに lot をまとめる（child 内の順序は lot 順のまま）
+            groups: Dict[int, list] = {}
+            targets: Dict[int, object] = {}
+            for lot in confirmed_S_lots:
+                if lot == []:
+                    continue
+                leaf_name = extract_leaf(lot)
+                ship2node = route_cache.get(leaf_name)
+                if ship2node is None:
+                    ship2node = hop[leaf_name]
+                    route_cache[leaf_name] = ship2node
+                key = id(ship2node)
+                bucket = groups.get(key)
+                if bucket is None:
+                    bucket = groups[key] = []
+                    targets[key] = ship2node
+                bucket.append(lot)
+            for key, lots in groups.items():
+                ship2node = targets[key]
+                if debug:
+                    logger.debug("feedback_psi_lists: %s w=%d -> %s lots=%d",
+                                 n.name, w, ship2node.name, len(lots))
+                place_lots_in_supply_LT(w, ship2node, lots)
+        # 従来どおり children を先頭から順に処理（深さ優先・前順）
+        stack.extend(reversed(children))
@@ -7,12 +7,23 @@ from typing import Iterable, List, Optional
 # --- ADD: ISO week → internal index helpers -------------------------------
 from datetime import date
 import ast
+_ISO_WEEK_MAP_CACHE: dict[tuple[int, int], tuple[dict[tuple[int,str], int], int]] = {}
+def _iso_week_index_map_cached(plan_year_st: int, plan_range: int) -> tuple[dict[tuple[int,str], int], int]:
+    """_build_iso_week_index_map の (plan_year_st, plan_range) 単位キャッシュ（返す dict は読み取り専用扱い）"""
+    key = (int(plan_year_st), int(plan_range))
+    hit = _ISO_WEEK_MAP_CACHE.get(key)
+    if hit is None:
+        hit = _ISO_WEEK_MAP_CACHE[key] = _build_iso_week_index_map_uncached(*key)
+    return hit
 def _build_iso_week_index_map(plan_year_st: int, plan_range: int) -> tuple[dict[tuple[int,str], int], int]:
     """
     (iso_year, 'WW') → 0-based index の写像を作る。
     年度跨ぎ/存在しない週(53週が無い年)を自然にスキップして詰める。
-    返り値: (mapping, weeks_count)
+    返り値: (mapping, weeks_count)  ※ mapping は呼び出し側で変更してよいコピー
     """
+    mapping, idx = _iso_week_index_map_cached(plan_year_st, plan_range)
+    return dict(mapping), idx
+def _build_iso_week_index_map_uncached(plan_year_st: int, plan_range: int) -> tuple[dict[tuple[int,str], int], int]:
     mapping: dict[tuple[int,str], int] = {}
     idx = 0
     year_end = plan_year_st + int(plan_range)  # ハミ出し分は plan_range 側が面倒を見る前提
@@ -41,18 +52,61 @@ def _make_lot_id_list_slots_iso(df_weekly, node_name: str,
         if idx is None or idx < 0 or idx >= weeks_count:
             print(f"[WARN] {node_name}: ISO week {key} → idx={idx} is out of range(0..{weeks_count-1}); skipped.")
             continue
-        lots = r.get("lot_id_list", [])
         # 万一、文字列で入ってきた場合に復元（例: "[ 'A', 'B' ]"）
-        if not isinstance(lots, list):
-            if isinstance(lots, str):
-                try:
-                    lots = ast.literal_eval(lots)
-                except Exception:
-                    print(f"[WARN] {node_name}: lot_id_list not list-like -> {lots!r}; treated as empty.")
-                    lots = []
-            else:
-                lots = []
-        pSi[idx].extend(lots)
+        pSi[idx].extend(_as_lot_list(r.get("lot_id_list", []), node_name))
+    return pSi
+def _as_lot_list(lots, node_name: str) -> list:
+    """lot_id_list セルを list に正規化（文字列なら literal_eval、それ以外は空）"""
+    if isinstance(lots, list):
+        return lots
+    if isinstance(lots, str):
+        try:
+            return ast.literal_eval(lots)
+        except Exception:
+            print(f"[WARN] {node_name}: lot_id_list not list-like -> {lots!r}; treated as empty.")
+    return []
+def build_leaf_demand_index(df_weekly) -> dict[str, tuple[list, Optional[int]]]:
+    """
+    df_weekly を 1 回だけ走査して node_name → ([(iso_year, 'WW', lot_id_list), ...], S_lot合計) を作る。
+    行の順序は df_weekly の順（node 内で _make_lot_id_list_slots_iso と同じ extend 順）。
+    S_lot 列が無い場合、合計は None。
+    """
+    index: dict[str, tuple[list, Optional[int]]] = {}
+    if df_weekly is None or len(df_weekly) == 0:
+        return index
+    n = len(df_weekly)
+    names = df_weekly["node_name"].tolist()
+    years = df_weekly["iso_year"].tolist()
+    weeks = df_weekly["iso_week"].tolist()
+    lots_col = df_weekly["lot_id_list"].tolist() if "lot_id_list" in df_weekly.columns else [[]] * n
+    has_s = "S_lot" in df_weekly.columns
+    s_lot = df_weekly["S_lot"].tolist() if has_s else None
+    rows_by_node: dict[str, list] = {}
+    exp_by_node: dict[str, int] = {}
+    for i in range(n):
+        nm = names[i]
+        rows = rows_by_node.get(nm)
+        if rows is None:
+            rows = rows_by_node[nm] = []
+            exp_by_node[nm] = 0
+        rows.append((int(years[i]), str(weeks[i]).zfill(2), lots_col[i]))
+        if has_s:
+            exp_by_node[nm] += s_lot[i]
+    for nm, rows in rows_by_node.items():
+        index[nm] = (rows, int(exp_by_node[nm]) if has_s else None)
+    return index
+def _make_lot_id_list_slots_indexed(rows: list, node_name: str,
+                                    week_index_map: dict[tuple[int,str], int],
+                                    weeks_count: int) -> list[list[str]]:
+    """build_leaf_demand_index の 1 node 分から pSi を作る（_make_lot_id_list_slots_iso と同じ結果）"""
+    pSi: list[list[str]] = [[] for _ in range(weeks_count)]
+    for y, w, lots in rows:
+        key = (y, w)
+        idx = week_index_map.get(key, None)
+        if idx is None or idx < 0 or idx >= weeks_count:
+            print(f"[WARN] {node_name}: ISO week {key} → idx={idx} is out of range(0..{weeks_count-1}); skipped.")
+            continue
+        pSi[idx].extend(_as_lot_list(lots, node_name))
     return pSi
 def _validate_pSi_vs_df(df_weekly, node_name: str, pSi: list[list[str]]):
     """投入検証：期待Lot数（S_lot合計）と実Lot数（pSi合計）を照合。"""
@@ -146,16 +200,20 @@ def make_lot_id_list_list(df_weekly, node_name):
 #_make_lot_id_list_slots_iso(..., weeks_count) でフル長の pSi を作る
 #その pSi を **node.set_S2psi(pSi)（Nodeメソッドの正本）**で投入
 #親側の P→S 集約は 実配列長で回る実装に（※後述のヘルパ差し替え）
-def set_df_Slots2psi4demand(node, df_weekly):
+def set_df_Slots2psi4demand(node, df_weekly, _demand_index=None):
     """
     LEAF→ROOT の後行順で PSI を構築。
     - LEAF: df_weekly から (iso_year, iso_week) → 内部 index にマップし、フル長 pSi を生成→S投入→S→P
     - 非LEAF: 子の P を LT 分だけ早めて自分の S に集約→S→P
     最後に S を供給側へ初期転写（node.copy_demand_to_supply）
+    df_weekly は最上位の呼び出しで 1 回だけ node_name 別 index（build_leaf_demand_index）にし、
+    再帰ではその index を渡す（leaf ごとに df を再フィルタしない）。
     """
+    if _demand_index is None:
+        _demand_index = build_leaf_demand_index(df_weekly)
     # 1) まず子を処理（後行順）
     for child in node.children:
-        set_df_Slots2psi4demand(child, df_weekly)
+        set_df_Slots2psi4demand(child, df_weekly, _demand_index)
     # 2) 自ノードの週数（実長）
     weeks_count = len(getattr(node, "psi4demand", []))
     if weeks_count == 0:
@@ -168,14 +226,19 @@ def set_df_Slots2psi4demand(node, df_weekly):
     if not node.children:
         # === LEAF：需要の投入 ===
         # Nodeに付いていればそれを使い、無ければ df からフォールバック
-        plan_year_st = int(getattr(node, "plan_year_st", df_weekly["iso_year"].min()))
+        # （getattr の既定値は毎回評価されるので、df の min は属性が無いときだけ取る）
+        plan_year_st = getattr(node, "plan_year_st", None)
+        plan_year_st = int(plan_year_st if plan_year_st is not None else df_weekly["iso_year"].min())
         plan_range   = int(getattr(node, "plan_range", max(1, (weeks_count + 52) // 53)))
         # ISO週→内部 index 写像（年を跨ぐ欠番は自然にスキップ）
-        week_index_map, _ = _build_iso_week_index_map(plan_year_st, plan_range)
+        week_index_map, _ = _iso_week_index_map_cached(plan_year_st, plan_range)
         # 実長 weeks_count に合わせて pSi（各週の lot_id 配列）を作る
-        pSi = _make_lot_id_list_slots_iso(df_weekly, node.name, week_index_map, weeks_count)
+        rows, exp = _demand_index.get(node.name, ([], 0 if "S_lot" in df_weekly.columns else None))
+        pSi = _make_lot_id_list_slots_indexed(rows, node.name, week_index_map, weeks_count)
         # 期待 lot 数と実 lot 数の簡易照合（警告のみ）
-        _validate_pSi_vs_df(df_weekly, node.name, pSi)
+        act = sum(len(x) for x in pSi)
+        if exp is not None and exp != act:
+            print(f"[WARN] {node.name}: expected S_lot={exp}, placed lots={act} (mismatch).")
         # 厳密チェック（Node.set_S2psi 側にも assert を入れておくと二重で安全）
         if len(pSi) != weeks_count:
             raise RuntimeError(
@@ -0,0 +1,78 @@
+# pysi/plan/ps2i_kernel.py
+# -*- coding: utf-8 -*-
+"""
+PS->I roll-forward kernel（在庫の週次繰越し）
+
+  I(w) = I(w-1) + P(w) - S(w)   （FIFO 順 = I(w-1) の後ろに P(w) を連結した順）
+
+従来の Node.calcPS2I4demand / calcPS2I4supply は `x not in s` を list に対して
+評価していたため 1 週あたり O(|I|·|S|)。ここでは
+ - S は hash set（週ごとに clear して使い回す）
+ - dedup は dict.fromkeys（C 実装、最初の出現順を保持）
+ - 週ごとの closure 生成なし
+で O(|I|+|P|+|S|) にしている。順序と重複の扱いは従来と完全に同じ:
+ - dedup=False : calcPS2I4demand / calcPS2I_decouple4supply / calc_PS2I_idempotent
+ - dedup=True  : calcPS2I4supply（fifo_lot_diff 相当）
+
+カーネルは環境変数 PYSI_PS2I_KERNEL ("fast" | "legacy") か set_ps2i_kernel() で切替。
+"""
+from __future__ import annotations
+
+import os
+from typing import List
+
+_KERNELS = ("fast", "legacy")
+_kernel = os.getenv("PYSI_PS2I_KERNEL", "fast").lower()
+if _kernel not in _KERNELS:
+    _kernel = "fast"
+
+
+def set_ps2i_kernel(name: str) -> None:
+    """"fast"（既定）/ "legacy"（旧 list 差分）を切替える"""
+    global _kernel
+    name = str(name).lower()
+    if name not in _KERNELS:
+        raise ValueError(f"unknown PS2I kernel: {name!r} (expected one of {_KERNELS})")
+    _kernel = name
+
+
+def get_ps2i_kernel() -> str:
+    return _kernel
+
+
+def use_fast_kernel() -> bool:
+    return _kernel == "fast"
+
+
+def roll_forward_I(psi: List[list], *, dedup: bool = False, start: int = 1) -> None:
+    """
+    psi[w][2] (I) を w=start..W-1 について前週 I と当週 P, S から再計算する（in place）。
+    psi[start-1][2] は初期在庫としてそのまま使う。
+    """
+    W = len(psi)
+    if W <= start:
+        return
+    sset = set()  # scratch: 当週 S（週ごとに clear して再利用）
+    prev = psi[start - 1][2] or []
+    for w in range(start, W):
+        week = psi[w]
+        s = week[0]
+        p = week[3]
+        if dedup:
+            work = dict.fromkeys(prev)
+            if p:
+                work.update(dict.fromkeys(p))
+        else:
+            work = prev + p if p else list(prev)
+        if s:
+            try:
+                sset.clear()
+                sset.update(s)
+                inv = [x for x in work if x not in sset]
+            except TypeError:
+                # unhashable な要素が混ざっている場合は旧ロジック
+                inv = [x for x in work if x not in s]
+        else:
+            inv = list(work) if dedup else work
+        week[2] = inv
+        prev = inv
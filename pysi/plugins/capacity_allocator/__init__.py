@@ -1,2 +1,4 @@
-# pysi/plugins/__init__.py
-# (empty)
+# pysi/plugins/capacity_allocator/__init__.py
+# Pipeline は既定 allocator をここから import する
+from .plugin import capacity_constraint_allocator
+from .constraints import WeeklyConstraintProvider, get_constraint_provider
@@ -0,0 +1,158 @@
+# pysi/plugins/capacity_allocator/constraints.py
+# weekly_constraints.json の provider（1 回だけ parse して週ごとに引く）
+#  - キー "('MOMJPN', 'PADJPN')" は文字列として分解する（eval しない）
+#  - 値はスカラー（全週共通）または valid_from_week から始まる週次リスト
+#  - 週 × キー の配列に展開しておき、週ごとの dict はキャッシュして返す
+#  - mtime/size が変わった時だけ読み直し、中身の hash が同じなら parse もしない
+from __future__ import annotations
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+DEFAULT_CONSTRAINTS_FILE = "weekly_constraints.json"
+Arc = Tuple[str, ...]
+def parse_key_tuple(key: str) -> Optional[Arc]:
+    """
+    "('MOMJPN', 'PADJPN')" / "(MOMJPN, PADJPN)" / "MOMJPN,PADJPN" → ('MOMJPN', 'PADJPN')
+    形にならないキーは None。
+    """
+    s = str(key).strip()
+    if s.startswith("(") and s.endswith(")"):
+        s = s[1:-1]
+    parts = [p.strip().strip("'\"").strip() for p in s.split(",")]
+    parts = [p for p in parts if p]
+    if len(parts) < 2:
+        return None
+    return tuple(parts)
+def _week_values(v, n_weeks: int) -> np.ndarray:
+    """スカラー → 全週同値、リスト → 週次（足りない分は最後の値で埋める）"""
+    if isinstance(v, (list, tuple)):
+        vals = [float(x) for x in v] or [float("inf")]
+        if len(vals) < n_weeks:
+            vals += [vals[-1]] * (n_weeks - len(vals))
+        return np.asarray(vals[:n_weeks], dtype=float)
+    return np.full(n_weeks, float(v), dtype=float)
+@dataclass
+class WeeklyConstraints:
+    """週 × 拠点 / 週 × レーン の能力配列（week 0 = valid_from_week）"""
+    valid_from_week: int = 1
+    nodes: List[str] = field(default_factory=list)
+    arcs: List[Arc] = field(default_factory=list)
+    node_cap: np.ndarray = field(default_factory=lambda: np.zeros((1, 0)))
+    edge_cap: np.ndarray = field(default_factory=lambda: np.zeros((1, 0)))
+    _by_row: Dict[int, Tuple[Dict[str, float], Dict[Arc, float]]] = field(default_factory=dict, repr=False)
+    @classmethod
+    def from_json(cls, data: dict) -> "WeeklyConstraints":
+        node_raw = data.get("node_capacity", {}) or {}
+        edge_raw = data.get("edge_flow", {}) or {}
+        v_from = int(data.get("valid_from_week", 1) or 1)
+        v_to = data.get("valid_to_week")
+        lens = [len(v) for v in list(node_raw.values()) + list(edge_raw.values())
+                if isinstance(v, (list, tuple))]
+        n_weeks = max([int(v_to) - v_from + 1 if v_to else 1] + lens)
+        n_weeks = max(1, n_weeks)
+        nodes, node_cols = [], []
+        for k, v in node_raw.items():
+            try:
+                node_cols.append(_week_values(v, n_weeks))
+                nodes.append(str(k))
+            except (TypeError, ValueError):
+                continue
+        arcs, edge_cols = [], []
+        for k, v in edge_raw.items():
+            arc = parse_key_tuple(k)
+            if arc is None:
+                print(f"[Capacity Allocator] edge_flow のキーを解釈できません: {k!r}")
+                continue
+            try:
+                edge_cols.append(_week_values(v, n_weeks))
+                arcs.append(arc)
+            except (TypeError, ValueError):
+                continue
+        def _stack(cols):
+            return np.stack(cols, axis=1) if cols else np.zeros((n_weeks, 0))
+        return cls(v_from, nodes, arcs, _stack(node_cols), _stack(edge_cols))
+    @property
+    def weeks(self) -> int:
+        return int(self.node_cap.shape[0])
+    def for_week(self, week_idx: int) -> Tuple[Dict[str, float], Dict[Arc, float]]:
+        """
+        pipeline の week_idx（0 始まり）に効く (node_cap, edge_cap)。
+        範囲外の週は端の週の値をそのまま使う（スカラー指定なら全週同じ）。
+        """
+        row = int(week_idx) + 1 - self.valid_from_week
+        row = min(max(row, 0), self.weeks - 1)
+        hit = self._by_row.get(row)
+        if hit is None:
+            node_cap = dict(zip(self.nodes, self.node_cap[row].tolist()))
+            edge_cap = dict(zip(self.arcs, self.edge_cap[row].tolist()))
+            hit = self._by_row[row] = (node_cap, edge_cap)
+        return hit
+EMPTY_CONSTRAINTS = WeeklyConstraints()
+class WeeklyConstraintProvider:
+    """
+    weekly_constraints.json を保持する provider。
+
+        provider = get_constraint_provider()
+        node_cap, edge_cap = provider.for_week(week_idx)
+
+    呼ばれるたびに os.stat だけ確認し、変化があった時だけ読み直す。
+    """
+    def __init__(self, path: str = DEFAULT_CONSTRAINTS_FILE):
+        self.path = path
+        self.loads = 0                  # 実際に parse した回数
+        self._stat: Optional[Tuple[int, int]] = None
+        self._digest: Optional[str] = None
+        self._constraints: WeeklyConstraints = EMPTY_CONSTRAINTS
+        self._missing_reported = False
+    def _refresh(self) -> None:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            if not self._missing_reported:
+                print(f"[Capacity Allocator] {os.path.basename(self.path)} が見つかりません。無制限で動作します。")
+                self._missing_reported = True
+            self._stat = self._digest = None
+            self._constraints = EMPTY_CONSTRAINTS
+            return
+        key = (st.st_mtime_ns, st.st_size)
+        if key == self._stat:
+            return
+        self._stat = key
+        self._missing_reported = False
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+        except OSError as e:
+            print(f"[Capacity Allocator] JSON読み込み失敗: {e}")
+            self._digest = None
+            self._constraints = EMPTY_CONSTRAINTS
+            return
+        digest = hashlib.sha256(raw).hexdigest()
+        if digest == self._digest:
+            return                      # touch されただけ
+        self._digest = digest
+        try:
+            data = json.loads(raw.decode("utf-8-sig"))
+            self._constraints = WeeklyConstraints.from_json(data)
+            self.loads += 1
+            print(f"[Capacity Allocator] 制約を読み込みました（week {data.get('valid_from_week', '?')}〜{data.get('valid_to_week', '?')}, "
+                  f"node: {len(self._constraints.nodes)}拠点, edge: {len(self._constraints.arcs)}レーン）")
+        except Exception as e:
+            print(f"[Capacity Allocator] JSON読み込み失敗: {e}。無制限で動作します。")
+            self._constraints = EMPTY_CONSTRAINTS
+    def get(self) -> WeeklyConstraints:
+        self._refresh()
+        return self._constraints
+    def for_week(self, week_idx: int) -> Tuple[Dict[str, float], Dict[Arc, float]]:
+        return self.get().for_week(week_idx)
+_PROVIDERS: Dict[str, WeeklyConstraintProvider] = {}
+def get_constraint_provider(path: str = DEFAULT_CONSTRAINTS_FILE) -> WeeklyConstraintProvider:
+    """絶対パスごとに provider を 1 つだけ作って使い回す"""
+    key = os.path.abspath(path)
+    prov = _PROVIDERS.get(key)
+    if prov is None:
+        prov = _PROVIDERS[key] = WeeklyConstraintProvider(key)
+    return prov
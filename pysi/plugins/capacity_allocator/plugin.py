@@ -5,60 +5,68 @@
 # pysi/plugins/capacity_allocator/plugin.py
 # SCN Optimiser ↔ PSI Planner 完全連携プラグイン（2025.11.21 確定版）
 
-import json
-import os
 from typing import Dict, Any
 
-def _load_constraints() -> Dict[str, Any]:
-    json_path = "weekly_constraints.json"
-    if not os.path.exists(json_path):
-        print("[Capacity Allocator] weekly_constraints.json が見つかりません。無制限で動作します。")
-        return {}
-    try:
-        with open(json_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        print(f"[Capacity Allocator] 制約を読み込みました（week {data.get('valid_from_week', '?')}〜{data.get('valid_to_week', '?')}）")
-        return data
-    except Exception as e:
-        print(f"[Capacity Allocator] JSON読み込み失敗: {e}")
-        return {}
+from .constraints import DEFAULT_CONSTRAINTS_FILE, get_constraint_provider
 
-def register_hooks(hook_bus):
-    @hook_bus.filter("plan:allocate:capacity")
-    def capacity_allocator(graph, week_idx: int, demand_map, tickets=None, **ctx) -> Dict[str, Any]:
-        constraints = _load_constraints()
-        node_cap = {str(k): float(v) for k, v in constraints.get("node_capacity", {}).items()}
-        edge_cap = {}
-        for k, v in constraints.get("edge_flow", {}).items():
-            try:
-                arc = eval(k) if k.startswith("(") else tuple(k.strip("()").replace("'", "").split(", "))
-                edge_cap[arc] = float(v)
-            except:
-                continue
+def _load_constraints(week_idx: int = 0, path: str = DEFAULT_CONSTRAINTS_FILE):
+    """
+    (node_cap, edge_cap) を返す。
+    provider が 1 回だけ parse して保持し、ファイルが変わった時だけ読み直す（eval は使わない）。
+    """
+    return get_constraint_provider(path).for_week(week_idx)
+
+def _clip_shipments(proposed, node_cap, edge_cap, keep_original: bool = False) -> Dict[Any, Dict[str, Any]]:
+    """拠点能力（出発地）とレーン能力で proposed_shipments を先着順にクリップする"""
+    actual = {}
+    used_node = {n: 0.0 for n in node_cap}
+    used_edge = {arc: 0.0 for arc in edge_cap}
 
-        proposed = ctx.get("proposed_shipments", {})
-        actual = {}
-        used_node = {n: 0.0 for n in node_cap}
-        used_edge = {arc: 0.0 for arc in edge_cap}
+    for (src, dst, prod), val in proposed.items():
+        qty = float(val.get("qty", 0) if isinstance(val, dict) else val)
+        if qty <= 0: continue
 
-        for (src, dst, prod), val in proposed.items():
-            qty = float(val.get("qty", 0) if isinstance(val, dict) else val)
-            if qty <= 0: continue
+        # 拠点能力
+        src_limit = node_cap.get(src, float("inf"))
+        remain_node = max(0.0, src_limit - used_node.get(src, 0.0))
 
-            # 拠点能力
-            src_limit = node_cap.get(src, float("inf"))
-            remain_node = max(0.0, src_limit - used_node.get(src, 0.0))
+        # レーン能力
+        arc = (src, dst)
+        lane_limit = edge_cap.get(arc, float("inf"))
+        remain_edge = max(0.0, lane_limit - used_edge.get(arc, 0.0))
 
-            # レーン能力
-            arc = (src, dst)
-            lane_limit = edge_cap.get(arc, float("inf"))
-            remain_edge = max(0.0, lane_limit - used_edge.get(arc, 0.0))
+        allowed = min(qty, remain_node, remain_edge)
+        if allowed > 0:
+            actual[(src, dst, prod)] = {"qty": allowed}
+            if keep_original:
+                actual[(src, dst, prod)].update(original_qty=qty, constrained=allowed < qty)
+            used_node[src] = used_node.get(src, 0.0) + allowed
+            used_edge[arc] = used_edge.get(arc, 0.0) + allowed
+    return actual
 
-            allowed = min(qty, remain_node, remain_edge)
-            if allowed > 0:
-                actual[(src, dst, prod)] = {"qty": allowed}
-                used_node[src] = used_node.get(src, 0.0) + allowed
-                used_edge[arc] = used_edge.get(arc, 0.0) + allowed
+def capacity_constraint_allocator(graph, week_idx: int, demand_map, tickets=None, **ctx) -> Dict[str, Any]:
+    """
+    SCN Optimiser の weekly_constraints.json を厳守する allocator（Pipeline の既定値）
+    ctx["constraints_path"] で JSON の場所を変えられる。
+    """
+    node_cap, edge_cap = _load_constraints(week_idx, ctx.get("constraints_path", DEFAULT_CONSTRAINTS_FILE))
+    actual = _clip_shipments(ctx.get("proposed_shipments", {}), node_cap, edge_cap, keep_original=True)
+    if actual:
+        shipped = sum(v["qty"] for v in actual.values())
+        cut = sum(v["original_qty"] - v["qty"] for v in actual.values() if v["constrained"])
+        print(f"[Week {week_idx}] 能力制約適用後：出荷量 {shipped:.1f}（制約で削減された量: {cut:.1f}）")
+    return {
+        "shipments": actual,
+        "receipts": {},                     # 入荷は別途処理
+        "demand_map": demand_map,
+        "tickets": tickets or [],
+    }
+
+def register_hooks(hook_bus):
+    @hook_bus.filter("plan:allocate:capacity")
+    def capacity_allocator(graph, week_idx: int, demand_map, tickets=None, **ctx) -> Dict[str, Any]:
+        node_cap, edge_cap = _load_constraints(week_idx, ctx.get("constraints_path", DEFAULT_CONSTRAINTS_FILE))
+        actual = _clip_shipments(ctx.get("proposed_shipments", {}), node_cap, edge_cap)
 
         return {
             "shipments": actual,
@@ -77,8 +77,12 @@ def demand_provider_monthly_csv_to_weekly(env=None, root=None, **kwargs):
     df_month_raw = pd.read_csv(month_csv, encoding="utf-8-sig")
 
     # sampleを見た限り year が float の場合があるので、ここで確実にint化
+    # year 空欄の行（CSV末尾の空行など）は落とす。year=0 のまま残すと plan_range が
+    # 2000年超になり、init_psi_spaces_and_demand の初回確保が 53*2028 週 × 全ノードになる
     if "year" in df_month_raw.columns:
-        df_month_raw["year"] = pd.to_numeric(df_month_raw["year"], errors="coerce").fillna(0).astype(int)
+        df_month_raw["year"] = pd.to_numeric(df_month_raw["year"], errors="coerce")
+        df_month_raw = df_month_raw.dropna(subset=["year"]).copy()
+        df_month_raw["year"] = df_month_raw["year"].astype(int)
 
     # 正規化（列名ゆれ吸収）
     df_month = _normalize_monthly_demand_df_sku(df_month_raw)
@@ -3,6 +3,8 @@ from __future__ import annotations
 import csv
 from pathlib import Path
 
+from pysi.core.move_log import MOVE_COLUMNS, MoveLog
+
 def register(bus):
 
     def _export_moves(result, **ctx):
@@ -16,10 +18,19 @@ def register(bus):
         out_path = p / "moves.csv"
 
         # ヘッダ：可変フィールドもなるべく吸収
-        fieldnames = [
-            "week_idx","kind","src","dst","node","product","qty",
-            "avg_urgency","urgency","ticket_id","lot_ids"
-        ]
+        fieldnames = list(MOVE_COLUMNS)
+
+        # MoveLog: チャンク単位で追記（全件を dict 化してメモリに載せない）
+        if isinstance(moves, MoveLog):
+            with out_path.open("w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(fieldnames)
+                for df in moves.iter_chunks():
+                    # list の lot_ids は "A|B|C" などに連結
+                    df["lot_ids"] = ["|".join(map(str, v)) if isinstance(v, (list, tuple)) else v
+                                     for v in df["lot_ids"]]
+                    df.to_csv(f, header=False, index=False, columns=fieldnames, lineterminator="\r\n")
+            return
+
         with out_path.open("w", newline="", encoding="utf-8") as f:
             w = csv.DictWriter(f, fieldnames=fieldnames)
             w.writeheader()
@@ -39,6 +39,7 @@ from pysi.utils.file_io import *
 from pysi.utils.calendar445 import Calendar445
 from pysi.plan.demand_generate import convert_monthly_to_weekly
 from pysi.plan.operations import *
+from pysi.plan.lot_routing import feedback_psi_lists_routed
 from pysi.network.node_base import Node, PlanNode, GUINode
 from pysi.network.tree import *
 from pysi.evaluate.evaluate_cost_models_v2 import gui_run_initial_propagation, propagate_cost_to_plan_nodes, load_tobe_prices, assign_tobe_prices_to_leaf_nodes, load_asis_prices, assign_asis_prices_to_root_nodes
@@ -1128,75 +1129,11 @@ def extract_node_name(stringA):
 # main function is this: place_P_in_supply_LT(w, ship2node, lot)
 def feedback_psi_lists(node, nodes):
 #def feedback_psi_lists(node, node_psi_dict, nodes):
-    # キーが存在する場合は対応する値valueが返り、存在しない場合はNoneが返る。
-    if node.children == []:  # 子nodeがないleaf nodeの場合
-        pass
-    else:
-        # ************************************
-        # clearing children P[w][3] and S[w][0]
-        # ************************************
-        # replace lotするために、事前に、
-        # 出荷先となるすべてのchildren nodesのS[w][0]とP[w][3]をクリア
-        for child in node.children:
-            for w in range(53 * node.plan_range):
-                child.psi4supply[w][0] = []
-                child.psi4supply[w][3] = []
-        # lotidから、leaf_nodeを特定し、出荷先ship2nodeに出荷することは、
-        # すべての子nodeに出荷することになる
-        # ************************************
-        # setting mother_confirmed_S
-        # ************************************
-        # このnode内での子nodeへの展開
-        for w in range(53 * node.plan_range):
-            #@STOP
-            #print("node.psi4supply", node.psi4supply)
-            
-            confirmed_S_lots = node.psi4supply[w][0]  # 親の確定出荷confS lot
+    # lot_idのleaf_nodeから出荷先ship2node(=nodeの次node)を引く表を木ごとに1回だけ作り、
+    # (w, ship2node)単位でconfirmed_S lotsをまとめてLT shiftで置く
+    # （旧: lotごとに find_path_to_leaf_with_parent → path[1] → place_P_in_supply_LT）
+    feedback_psi_lists_routed(node, nodes, extract_leaf=extract_node_name)
 
-            #@STOP
-            #print("confirmed_S_lots", confirmed_S_lots)
-            
-            # 出荷先nodeを特定して
-            # 一般には、下記のLT shiftだが・・・・・
-            # 出荷先の ETA = LT_shift(ETD) でP place_lot
-            # 工程中の ETA = SS_shift(ETD) でS place_lot
-            # 本モデルでは、輸送工程 = modal_nodeを想定して・・・・・
-            # 出荷先の ETA = 出荷元ETD        でP place_lot
-            # 工程中の ETA = LT&SS_shift(ETD) でS place_lot
-            # というイビツなモデル定義・・・・・
-            # 直感的なPO=INVOICEという考え方に戻すべきかも・・・・・
-            #
-            # modal shiftのmodelingをLT_shiftとの拡張で考える???
-            # modal = BOAT/AIR/QURIE
-            # LT_shift(modal, w, ,,,,
-            for lot in confirmed_S_lots:
-                if lot == []:
-                    pass
-                else:
-                    # *********************************************************
-                    # child#ship2node = find_node_to_ship(node, lot)
-                    # lotidからleaf_nodeのpointerを返す
-                    print("lot_ID", lot)
-                    leaf_node_name = extract_node_name(lot)
-                    print("lot_ID leaf_node_name", lot, leaf_node_name )
-                    leaf_node = nodes[leaf_node_name]
-                    # 末端からあるnodeAまでleaf_nodeまでのnode_listをpathで返す
-                    current_path = []
-                    path = []
-                    path = find_path_to_leaf_with_parent(node, leaf_node, current_path)
-                    # nodes_listを逆にひっくり返す
-                    path.reverse()
-                    # 出荷先nodeはnodeAの次node、path[1]になる
-                    ship2node_name = path[1]
-                    ship2node = nodes[ship2node_name]
-                    # ここでsupply planを更新している
-                    # lot: 親nodeの確定出荷confirmed_S lotsを
-                    # ship2node: 子nodeの出荷先を(lot_IDから)特定してある
-                    # 出荷先node psiのPとSに、confirmed_SのlotsをLT shiftで置く
-                    place_P_in_supply_LT(w, ship2node, lot)
-    for child in node.children:
-        feedback_psi_lists(child, nodes)
-        #feedback_psi_lists(child, node_psi_dict, nodes)
 def copy_P_demand2supply(node): # TOBE 240926
 #def update_child_PS(node): # TOBE 240926
     # 明示的に.copyする。
@@ -0,0 +1,56 @@
+# pysi/utils/startup.py
+# 起動時 import の計測（main.py --import-report / tools/bench_startup.py 用）
+#  - import_report(t0): t0 からの経過 ms、読み込み済みモジュール数、重いモジュールが読まれたか
+#  - measure_import(target): 別プロセスで python -X importtime を走らせて top-level の累積時間を集計
+from __future__ import annotations
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+# 起動時に読まれていたら遅い / headless では読まれてはいけないもの
+HEAVY_MODULES = ("tkinter", "matplotlib", "networkx", "pandas", "cartopy", "pysi.gui.app", "pulp", "scipy")
+def loaded_heavy(names=HEAVY_MODULES) -> List[str]:
+    return [m for m in names if m in sys.modules]
+def import_report(t0: float) -> Dict[str, object]:
+    """time.perf_counter() の t0（プロセス先頭で取る）からここまでの import 状況"""
+    return {
+        "elapsed_ms": round((time.perf_counter() - t0) * 1e3, 1),
+        "modules": len(sys.modules),
+        "heavy": loaded_heavy(),
+    }
+def format_report(rep: Dict[str, object], label: str = "startup") -> str:
+    heavy = ", ".join(rep["heavy"]) or "-"
+    return f"[{label}] imports {rep['elapsed_ms']:.1f} ms, {rep['modules']} modules, heavy: {heavy}"
+def _parse_importtime(stderr: str) -> Dict[str, int]:
+    """-X importtime の出力 → {module: cumulative usec}"""
+    out: Dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        out[parts[2].strip()] = int(parts[1])
+    return out
+def measure_import(target: str, cwd: Optional[str] = None, python: Optional[str] = None) -> Dict[str, object]:
+    """
+    新しいプロセスで `import target` だけを実行して計測する。
+    戻り値: {"target", "total_ms", "modules": {name: cumulative_ms}, "heavy": [...]}
+    """
+    code = (f"import sys, time; t0 = time.perf_counter(); import {target}; "
+            f"print(round((time.perf_counter() - t0) * 1e3, 1)); "
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="0")
+    proc = subprocess.run([python or sys.executable, "-X", "importtime", "-c", code],
+                          cwd=cwd, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {target} failed:\n{proc.stderr[-2000:]}")
+    lines = proc.stdout.strip().splitlines()
+    times = _parse_importtime(proc.stderr)
+    return {
+        "target": target,
+        "total_ms": float(lines[-2]),
+        "modules": {k: v / 1e3 for k, v in times.items()},
+        "heavy": [m for m in lines[-1].split(",") if m],
+    }
@@ -16,6 +16,7 @@ import csv, os
 # library import
 # ********************************
 import copy
+import functools
 import pickle
 # ********************************
 # library import
@@ -53,6 +54,9 @@ from pysi.plan.operations import set_df_Slots2psi4demand
 from pysi.network.node_base import Node, PlanNode, GUINode
 
 from pysi.network.tree import calc_all_psi2i4demand, eval_supply_chain_cost
+from pysi.network.psi_store import compact_psi_tree, expand_psi_tree
+from pysi.network.psi_snapshot import PSISnapshot
+from pysi.plan.decouple_sweep import sweep_decoupling_patterns
 
 from pysi.psi_planner_mvp.init_load_plan_data import demand_leveling_on_ship, feedback_psi_lists, make_nodes_decouple_all, push_pull_all_psi2i_decouple4supply5
 
@@ -72,6 +76,15 @@ class _MiniPlanNode:
     def add_child(self, c: "_MiniPlanNode"):
         c.parent = self
         self.children.append(c)
+def _bumps_plan_version(fn):
+    """計画（PSI）を書き換えるメソッド：終わったら plan_version を進める（cockpit の KPI キャッシュ用）"""
+    @functools.wraps(fn)
+    def _wrapped(self, *args, **kwargs):
+        try:
+            return fn(self, *args, **kwargs)
+        finally:
+            self.bump_plan_version()
+    return _wrapped
 # ******************************
 #@250811 chatGPT defined
 # ******************************
@@ -79,7 +92,12 @@ class WOMEnv:
 #class PlanEnv:
     """GUIを剥がした最小の計画モデルホルダ
        - prod_tree_dict_OT/IN に {product_name: PlanNode(root)} を持つ
+       - plan_version: 計画を書き換えるたびに +1（@_bumps_plan_version）
     """
+    plan_version: int = 0
+    def bump_plan_version(self) -> int:
+        self.plan_version += 1
+        return self.plan_version
     def __init__(self, config: Optional):
     #def __init__(self):
         self.base_dir: str = ""
@@ -145,6 +163,9 @@ class WOMEnv:
         self.base_leaf_name = {} # { product_name: leaf_node_name, ,,,}
         # supply_plan / decoupling / buffer stock
         self.decouple_node_dic = {}
+        self.sweep_workers = None  # decoupling sweep の process 数（None: PYSI_WORKERS）
+        self.psi_snapshot = None  # PSISnapshot（demand leveling 後の PSI 初期状態）
+        self.psi_snapshot_byprod = {}  # {product_name: PSISnapshot}
         self.decouple_node_selected = []
 
     # ---- public helpers -------------------------------------------------
@@ -947,6 +968,7 @@ class WOMEnv:
             print(f"[WARN] _run_price_propagation failed: {e}")
 
     # === PlanEnv クラス内に追記 ===
+    @_bumps_plan_version
     def init_psi_spaces_and_demand(self):
         import os
         import pandas as pd
@@ -1158,12 +1180,30 @@ class WOMEnv:
         #self.root.after(1000, self.show_psi_graph)
         #self.show_psi_graph() # this event do not live
 
+    # ******************************
+    # compact PSI store
+    # ******************************
+    def compact_psi_all(self) -> int:
+        """全製品の PSI を圧縮ストアに置換（計画後のメモリ削減）。戻り値は配列バイト数"""
+        nbytes = 0
+        for prod_tree_dict in (self.prod_tree_dict_OT, self.prod_tree_dict_IN):
+            for root in prod_tree_dict.values():
+                nbytes += compact_psi_tree(root)
+        return nbytes
+    def expand_psi_selected(self):
+        """選択製品の PSI を list に戻す（圧縮済みでなければ何もしない）"""
+        for prod_tree_dict in (self.prod_tree_dict_OT, self.prod_tree_dict_IN):
+            root = prod_tree_dict.get(self.product_selected)
+            if root is not None:
+                expand_psi_tree(root)
+    @_bumps_plan_version
     def demand_planning4multi_product(self):
         # Implement forward planning logic here
         print("demand_planning4multi_product planning executed.")
         #@250730 ADD multi_product Focus on Selected Product # root is "supply_point"
         self.root_node_outbound_byprod = self.prod_tree_dict_OT[self.product_selected]
         self.root_node_inbound_byprod  = self.prod_tree_dict_IN[self.product_selected]
+        self.expand_psi_selected()
         #@240903@241106
         calc_all_psi2i4demand(self.root_node_outbound_byprod)
         #self.update_evaluation_results()
@@ -1220,16 +1260,19 @@ class WOMEnv:
         self.update_evaluation_results()
         # PSI計画の初期状態をバックアップ
         self.psi_backup_to_file(self.root_node_outbound, 'psi_backup.pkl')
+        self.psi_snapshot = PSISnapshot.capture(self.root_node_outbound)
         self.view_nx_matlib()
         self.root.after(1000, self.show_psi("outbound", "supply"))
         #self.root.after(1000, self.show_psi_graph)
 
+    @_bumps_plan_version
     def demand_leveling4multi_prod(self):
         # Demand Leveling logic here
         print("Demand Leveling4multi_prod executed.")
         #@250730 ADD multi_product Focus on Selected Product # root is "supply_point"
         self.root_node_outbound_byprod = self.prod_tree_dict_OT[self.product_selected]
         self.root_node_inbound_byprod  = self.prod_tree_dict_IN[self.product_selected]
+        self.expand_psi_selected()
         # *********************************
         # Demand LEVELing on shipping yard / with pre_production week
         # *********************************
@@ -1266,6 +1309,8 @@ class WOMEnv:
             return nodes
         nodes_outbound_byprod = make_nodes(self.root_node_outbound_byprod)
         feedback_psi_lists(self.root_node_outbound_byprod, nodes_outbound_byprod)
+        # decoupling sweep の起点（supply planning 前の PSI 状態）
+        self.psi_snapshot_byprod[self.product_selected] = PSISnapshot.capture(self.root_node_outbound_byprod)
         #feedback_psi_lists(self.root_node_outbound_byprod, self.nodes_outbound)
         #feedback_psi_lists(self.root_node_outbound, node_psi_dict_Ot4Sp, self.nodes_outbound)
         # STOP
@@ -1302,10 +1347,12 @@ class WOMEnv:
             node_backup = pickle.load(file)
         return node_backup
     
+    @_bumps_plan_version
     def supply_planning4multi_product(self):
         #@250730 ADD multi_product Focus on Selected Product # root is "supply_point"
         self.root_node_outbound_byprod = self.prod_tree_dict_OT[self.product_selected]
         self.root_node_inbound_byprod  = self.prod_tree_dict_IN[self.product_selected]
+        self.expand_psi_selected()
         
         # Check if the necessary data is loaded
         #if self.root_node_outbound is None or self.nodes_outbound is None:
@@ -1393,7 +1440,7 @@ class WOMEnv:
         #self.root.after(1000, self.show_psi("outbound", "supply"))
     #def eval_buffer_stock(self):
     #    pass
-    def eval_buffer_stock(self):
+    def eval_buffer_stock(self, workers: Optional[int] = None):
         # Check if the necessary data is loaded
         if self.root_node_outbound is None or self.nodes_outbound is None:
             print("Error: PSI Plan data is not loaded. Please load the data first.")
@@ -1403,24 +1450,49 @@ class WOMEnv:
         # This backup is in "demand leveling"
         ## PSI計画の初期状態をバックアップ
         #self.psi_backup_to_file(self.root_node_outbound, 'psi_backup.pkl')
+        # pattern ごとに pickle から木全体を復元せず、PSI バケツだけを snapshot から戻す
+        snapshot = self.psi_snapshot
+        if snapshot is None:
+            self.root_node_outbound = self.psi_restore_from_file('psi_backup.pkl')
+            snapshot = self.psi_snapshot = PSISnapshot.capture(self.root_node_outbound)
         nodes_decouple_all = make_nodes_decouple_all(self.root_node_outbound)
         print("nodes_decouple_all", nodes_decouple_all)
-        for i, decouple_node_names in enumerate(nodes_decouple_all):
-            print("nodes_decouple_all", nodes_decouple_all)
-            # PSI計画の状態をリストア
-            self.root_node_outbound = self.psi_restore_from_file('psi_backup.pkl')
-            push_pull_all_psi2i_decouple4supply5(self.root_node_outbound, decouple_node_names)
-            self.update_evaluation_results()
+        # 各 pattern を restore → push_pull → eval（workers > 1 なら process pool）
+        results = sweep_decoupling_patterns(
+            self.root_node_outbound, nodes_decouple_all,
+            workers=workers if workers is not None else self.sweep_workers,
+            snapshot=snapshot,
+        )
+        for i, (revenue, profit, decouple_node_names) in enumerate(results):
             print("decouple_node_names", decouple_node_names)
-            print("self.total_revenue", self.total_revenue)
-            print("self.total_profit", self.total_profit)
-            self.decouple_node_dic[i] = [self.total_revenue, self.total_profit, decouple_node_names]
-            ## network area
-            #self.view_nx_matlib()
-            ##@241207 TEST
-            #self.root.after(1000, self.show_psi("outbound", "supply"))
-        self.display_decoupling_patterns()
+            print("self.total_revenue", revenue)
+            print("self.total_profit", profit)
+            self.decouple_node_dic[i] = [revenue, profit, decouple_node_names]
+        if results:
+            self.total_revenue, self.total_profit = results[-1][0], results[-1][1]
+        if hasattr(self, "display_decoupling_patterns"):
+            self.display_decoupling_patterns()
         # PSI area => move to selected_node in window
+
+    @_bumps_plan_version
+    def eval_buffer_stock4multi_product(self, workers: Optional[int] = None):
+        """product_selected の outbound tree で decoupling pattern を一括評価する"""
+        self.root_node_outbound_byprod = self.prod_tree_dict_OT[self.product_selected]
+        self.root_node_inbound_byprod  = self.prod_tree_dict_IN[self.product_selected]
+        self.expand_psi_selected()
+        print("eval_buffer_stock4multi_product with Decoupling points", self.product_selected)
+        nodes_decouple_all = make_nodes_decouple_all(self.root_node_outbound_byprod)
+        results = sweep_decoupling_patterns(
+            self.root_node_outbound_byprod, nodes_decouple_all,
+            workers=workers if workers is not None else self.sweep_workers,
+            snapshot=self.psi_snapshot_byprod.get(self.product_selected),
+        )
+        self.decouple_node_dic = {
+            i: [revenue, profit, decouple_node_names]
+            for i, (revenue, profit, decouple_node_names) in enumerate(results)
+        }
+        return self.decouple_node_dic
+
     def update_evaluation_results4multi_product(self):
         #@250730 ADD Focus on Product Selected
         # root_node is "supply_point"
@@ -1525,4 +1597,5 @@ def main():
     wo.supply_planning4multi_product()
 
 # start
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# tools/bench_startup.py
+# 起動時 import の回帰ベンチ（予算は tools/startup_budget.json）
+#
+# starter
+#python tools/bench_startup.py                  # 全ケース（各 3 回の最小値）
+#python tools/bench_startup.py --case main --repeat 5 --top 15
+#python tools/bench_startup.py --scale 2.0      # 遅いマシンでは上限を緩める
+#python tools/bench_startup.py --json out/startup.json
+#
+# 予算超過 / 禁止モジュールの import があれば exit 1
+
+from __future__ import annotations
+import argparse, json, sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from pysi.utils.startup import measure_import
+
+
+def _forbidden_loaded(modules: dict, forbid: list[str]) -> list[str]:
+    return [f for f in forbid if any(m == f or m.startswith(f + ".") for m in modules)]
+
+
+def run_case(name: str, case: dict, repeat: int, scale: float, top: int) -> dict:
+    runs = [measure_import(case["target"], cwd=str(ROOT)) for _ in range(max(1, repeat))]
+    best = min(runs, key=lambda r: r["total_ms"])
+    limit = float(case.get("max_ms", 0)) * scale
+    bad = _forbidden_loaded(best["modules"], case.get("forbid", []))
+    over = bool(limit) and best["total_ms"] > limit
+    status = "FAIL" if (bad or over) else "ok"
+    print(f"{status:4s} {name:14s} {best['total_ms']:8.1f} ms (limit {limit:.0f})  "
+          f"modules={len(best['modules'])}  heavy={','.join(best['heavy']) or '-'}")
+    if bad:
+        print(f"     forbidden imports: {', '.join(bad)}")
+    if top:
+        # 累積 import 時間の大きいモジュール順
+        heavy = sorted(best["modules"].items(), key=lambda kv: kv[1], reverse=True)[:top]
+        for mod, ms in heavy:
+            print(f"     {ms:8.1f} ms  {mod}")
+    return {"case": name, "target": case["target"], "total_ms": best["total_ms"], "limit_ms": limit,
+            "runs_ms": [r["total_ms"] for r in runs], "forbidden": bad, "status": status}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="startup import benchmark / regression gate")
+    ap.add_argument("--budget", default=str(ROOT / "tools" / "startup_budget.json"))
+    ap.add_argument("--case", action="append", help="run only these cases (repeatable)")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--scale", type=float, default=1.0, help="multiply every max_ms")
+    ap.add_argument("--top", type=int, default=0, help="show the N slowest imported modules per case")
+    ap.add_argument("--json", default=None, help="write results to this JSON file")
+    a = ap.parse_args()
+
+    budget = json.loads(Path(a.budget).read_text(encoding="utf-8"))["cases"]
+    names = a.case or list(budget)
+    results = [run_case(n, budget[n], a.repeat, a.scale, a.top) for n in names]
+    if a.json:
+        Path(a.json).parent.mkdir(parents=True, exist_ok=True)
+        Path(a.json).write_text(json.dumps(results, indent=1), encoding="utf-8")
+    return 1 if any(r["status"] != "ok" for r in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())